@@ -0,0 +1,62 @@
+"""
+Бенчмарк списка комментариев в админке: первая страница, страница с фильтром по автомобилю
+и шаги date_hierarchy (год, месяц) на большой таблице.
+
+Смысл замера есть только на PostgreSQL (оценка числа строк берется из его планировщика),
+поэтому используется БД из переменных DB_*:
+
+    python -m benchmarks.admin_changelist --comments 5000000 --repeat 5
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import seed, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=5000000)
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django('admin_changelist', use_env_database=True)
+    seed(countries=20, manufactures=200, cars=args.cars, comments=args.comments, batch_size=10000)
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.utils import timezone
+    from reviews.models import Car
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    user, _ = get_user_model().objects.get_or_create(username='benchmark', defaults={
+        'is_staff': True, 'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+
+    now = timezone.now()
+    car_id = Car.objects.order_by('-comments_count').values_list('id', flat=True).first()
+    pages = {
+        'first page': {},
+        'car filter': {'car': car_id},
+        'year': {'created_at__year': now.year},
+        'month': {'created_at__year': now.year, 'created_at__month': now.month},
+    }
+    for name, params in pages.items():
+        timings = []
+        for _ in range(args.repeat + 1):
+            started = time.perf_counter()
+            response = client.get('/admin/reviews/comment/', params)
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        # Первый запрос - прогрев
+        print(f'{name:<12} median {statistics.median(timings[1:]) * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Нагрузочный тест: WSGI (runserver и gunicorn) против ASGI (uvicorn с асинхронными /api/async/...).
+
+Каждый сервер запускается отдельным процессом с одним воркером на SQLite базе .benchmarks/.
+Клиенты --clients параллельно запрашивают списки и объекты, а еще --exporters клиентов в это
+время без остановки скачивают XLSX экспорт комментариев. Считаются запросы в секунду и
+p50/p99 задержки коротких запросов. Кеш ответов и троттлинг выключены, чтобы сравнивать сами серверы.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.asgi_load --comments 50000 --clients 16 --exporters 2 --duration 20
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.common import BASE_DIR, seed, setup_django
+
+SERVERS = {
+    # Текущая конфигурация docker-compose до перехода на ASGI
+    'runserver': (['manage.py', 'runserver', '{port}', '--noreload', '--skip-checks'], '/api'),
+    'gunicorn': (['-m', 'gunicorn', 'test_proj_reviews.wsgi:application', '--bind', '127.0.0.1:{port}',
+                  '--workers', '1', '--threads', '8', '--log-level', 'warning'], '/api'),
+    'uvicorn': (['-m', 'uvicorn', 'test_proj_reviews.asgi:application', '--port', '{port}',
+                 '--workers', '1', '--log-level', 'warning'], '/api/async'),
+    # Обычные синхронные вьюсеты под ASGI: Django выполняет их по очереди в одном потоке
+    'uvicorn-sync': (['-m', 'uvicorn', 'test_proj_reviews.asgi:application', '--port', '{port}',
+                      '--workers', '1', '--log-level', 'warning'], '/api'),
+}
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Сервер на порту {port} не запустился')
+
+
+def client_loop(port, urls, stop, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    index = 0
+    while not stop.is_set():
+        url = urls[index % len(urls)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', url)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as exc:
+            errors.append(type(exc).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            continue
+        if latencies is not None:
+            latencies.append(time.perf_counter() - started)
+    connection.close()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0
+
+
+def run(server, port, urls, prefix, args):
+    command, _ = SERVERS[server]
+    env = dict(os.environ, REVIEWS_CACHE_ENABLED='False', THROTTLE_ENABLED='False')
+    process = subprocess.Popen(
+        [sys.executable] + [part.format(port=port) for part in command],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        stop = threading.Event()
+        latencies = []
+        errors = []
+        threads = [
+            threading.Thread(target=client_loop, args=(port, [prefix + url for url in urls], stop, latencies, errors))
+            for _ in range(args.clients)
+        ] + [
+            threading.Thread(target=client_loop, args=(port, [prefix + '/comments/export/xlsx/'], stop, None, errors))
+            for _ in range(args.exporters)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f'{server:<10} {len(latencies) / args.duration:>8.1f} rps   p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms   '
+          f'p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms   errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--exporters', type=int, default=2)
+    parser.add_argument('--duration', type=int, default=20)
+    parser.add_argument('--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    setup_django(f'load_{args.comments}')
+    seed(comments=args.comments)
+
+    from reviews.models import Car, Comment
+
+    car = Car.objects.first()
+    urls = [
+        '/comments/?page_size=50',
+        f'/comments/?car={car.pk}',
+        '/cars/?page_size=20',
+        f'/cars/{car.pk}/',
+        f'/comments/{Comment.objects.first().pk}/',
+    ]
+    for offset, server in enumerate(args.servers):
+        run(server, args.port + offset, urls, SERVERS[server][1], args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Бенчмарк выгрузки всего каталога: четыре отдельных экспорта против одного /api/catalogue/export/.
+
+XLSX каталога сравнивается с суммой четырех /export/xlsx/, ZIP с CSV - с суммой четырех /export/csv/.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.catalogue_export --comments 200000 --repeat 3
+"""
+import argparse
+import time
+
+from benchmarks.common import seed, setup_django
+
+MODELS = ('countries', 'manufactures', 'cars', 'comments')
+
+
+def download(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, url
+    size = sum(len(chunk) for chunk in response.streaming_content)
+    response.close()
+    return size
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=200000)
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django(f'catalogue_{args.comments}')
+    seed(countries=20, manufactures=200, cars=args.cars, comments=args.comments)
+
+    from django.test import Client
+
+    client = Client()
+    for file_format, catalogue_format in (('xlsx', 'xlsx'), ('csv', 'zip')):
+        separate = best_of(args.repeat, lambda: [download(client, f'/api/{name}/export/{file_format}/')
+                                                  for name in MODELS])
+        catalogue = best_of(args.repeat, lambda: download(client, f'/api/catalogue/export/{catalogue_format}/'))
+        print(f'4 x {file_format:<5} {separate:>7.2f} s   catalogue {catalogue_format:<5} {catalogue:>7.2f} s   '
+              f'x{separate / catalogue:.2f}')
+
+
+if __name__ == '__main__':
+    main()
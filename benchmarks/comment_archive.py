@@ -0,0 +1,111 @@
+"""
+Бенчмарк секций и архива комментариев: запросы списка комментариев, когда в таблице все три года
+сгенерированных данных, и после archive_comments, когда в БД остаются последние --keep-months месяцев.
+Для каждого этапа печатается размер таблицы с индексами, а после архивации еще и страницы
+с ?include_archived=true (первая и страница из архивной части).
+
+Секции есть только на PostgreSQL, поэтому используется БД из переменных DB_*. Архивация удаляет
+комментарии из базы, после прогона ее нужно заполнить заново (seed_reviews --clear):
+
+    python -m benchmarks.comment_archive --comments 2000000 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.common import seed, setup_django
+
+
+def measure(client, url, params, repeat):
+    timings = []
+    for _ in range(repeat + 1):
+        started = time.perf_counter()
+        response = client.get(url, params)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    # Первый запрос - прогрев
+    return statistics.median(timings[1:]) * 1000
+
+
+def table_size(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_size_pretty(COALESCE(SUM(pg_total_relation_size(relid)), 0)) "
+                       "FROM pg_partition_tree('reviews_comment'::regclass)")
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=2000000)
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--keep-months', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django('comment_archive', use_env_database=True)
+    devnull = open(os.devnull, 'w')
+    seed(countries=20, manufactures=200, cars=args.cars, comments=args.comments, batch_size=10000)
+
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.utils import timezone
+    from reviews.models import Car, CommentArchive
+    from reviews.partitions import is_partitioned
+    from reviews.snapshot import catalogue_snapshot
+
+    assert is_partitioned(), 'Нужен PostgreSQL с примененной миграцией 0009'
+    # Архивы прошлого прогона лежали во временной папке
+    CommentArchive.objects.all().delete()
+    # Сгенерированные комментарии прошлых месяцев попали в секцию по умолчанию, после переноса
+    # по месяцам она пуста, но занимает столько же места
+    call_command('partition_comments', stdout=devnull)
+    with connection.cursor() as cursor:
+        cursor.execute('VACUUM FULL reviews_comment_default')
+        cursor.execute('ANALYZE reviews_comment')
+    catalogue_snapshot.warm_up()
+
+    archive_dir = tempfile.TemporaryDirectory()
+    settings_override = override_settings(REVIEWS_CACHE_ENABLED=False, THROTTLE_ENABLED=False,
+                                          SLOW_REQUEST_MS=0, COMMENTS_ARCHIVE_DIR=archive_dir.name)
+    settings_override.enable()
+    client = Client()
+    car_id = Car.objects.order_by('-comments_count').values_list('id', flat=True).first()
+    recent = (timezone.now() - timedelta(days=30)).date().isoformat()
+    pages = {
+        'first page': {},
+        'last 30 days': {'created_after': recent},
+        'car filter': {'car': car_id},
+    }
+
+    def run(stage):
+        print(f'{stage}: comments table {table_size(connection)}')
+        for name, params in pages.items():
+            median = measure(client, '/api/comments/', params, args.repeat)
+            print(f'  {name:<28} median {median:>8.1f} ms')
+
+    run('all months in DB')
+    started = time.perf_counter()
+    call_command('archive_comments', keep_months=args.keep_months, stdout=devnull)
+    print(f'archive_comments --keep-months {args.keep_months}: {time.perf_counter() - started:.1f} s')
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE reviews_comment')
+    run(f'last {args.keep_months} months in DB')
+
+    # Страница из архивной части: created_before на год раньше самых старых комментариев в БД
+    median = measure(client, '/api/comments/', {'include_archived': 'true'}, args.repeat)
+    print(f'  {"include_archived first page":<28} median {median:>8.1f} ms')
+    archived_from = (timezone.now() - timedelta(days=31 * (args.keep_months + 12))).date().isoformat()
+    median = measure(client, '/api/comments/', {'include_archived': 'true', 'created_before': archived_from},
+                        args.repeat)
+    print(f'  {"include_archived old month":<28} median {median:>8.1f} ms')
+
+    settings_override.disable()
+    archive_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Бенчмарк полнотекстового поиска /api/comments/search/ (на SQLite - индекс в памяти процесса).
+
+Запуск из корня проекта:
+
+    python -m benchmarks.comment_search --comments 1000000 --repeat 20
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import peak_rss_mb, seed, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django(f'search_{args.comments}')
+    seed(comments=args.comments)
+
+    from django.test import Client
+    from reviews.models import Car
+    from reviews.search import inverted_index
+
+    started = time.perf_counter()
+    with inverted_index.lock:
+        inverted_index.sync()
+    print(f'построение индекса: {time.perf_counter() - started:.1f} с, пиковая память {peak_rss_mb():.0f} MB')
+
+    car = Car.objects.select_related('manufacture').first()
+    queries = {
+        'редкое слово': {'q': '150000'},
+        'частое слово': {'q': 'отличный'},
+        'два слова': {'q': 'отличный автомобиль'},
+        'фильтр по авто': {'q': 'отличный', 'car': car.pk},
+        'фильтр по стране': {'q': 'отличный', 'country': car.manufacture.country_id},
+    }
+    client = Client()
+    for name, params in queries.items():
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.get('/api/comments/search/', params)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f'{name:<17} p50 {statistics.median(timings):>8.1f} мс   p95 {p95:>8.1f} мс')
+
+
+if __name__ == '__main__':
+    main()
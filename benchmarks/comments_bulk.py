@@ -0,0 +1,59 @@
+"""
+Бенчмарк загрузки комментариев: N запросов POST /api/comments/ против одного POST /api/comments/bulk/.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.comments_bulk --items 2000
+"""
+import argparse
+import json
+import time
+
+from benchmarks.common import seed, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django('bulk')
+    seed(comments=0)
+
+    from django.test import Client
+    from reviews.models import Car, Comment
+
+    car_ids = list(Car.objects.values_list('id', flat=True))
+    items = [
+        {'email': f'partner{i}@example.com', 'car': car_ids[i % len(car_ids)],
+         'comment_text': f'Отзыв партнера номер {i}, автомобиль понравился'}
+        for i in range(args.items)
+    ]
+    client = Client(HTTP_AUTHORIZATION='Token benchmark')
+
+    Comment.objects.all().delete()
+    started = time.perf_counter()
+    for item in items:
+        response = client.post('/api/comments/', item, content_type='application/json')
+        assert response.status_code == 201, response.content
+    single = time.perf_counter() - started
+
+    Comment.objects.all().delete()
+    started = time.perf_counter()
+    response = client.post('/api/comments/bulk/', json.dumps(items), content_type='application/json')
+    assert response.status_code == 201 and response.json()['created'] == len(items), response.content
+    bulk_json = time.perf_counter() - started
+
+    Comment.objects.all().delete()
+    body = '\n'.join(json.dumps(item) for item in items)
+    started = time.perf_counter()
+    response = client.post('/api/comments/bulk/', body, content_type='application/x-ndjson')
+    assert response.status_code == 201, response.content
+    bulk_ndjson = time.perf_counter() - started
+
+    for name, seconds in (('single create', single), ('bulk JSON', bulk_json), ('bulk NDJSON', bulk_ndjson)):
+        print(f'{name:<14} {seconds:>7.2f} s  {args.items / seconds:>10.0f} comments/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Общие помощники для бенчмарков.
+Каждый бенчмарк поднимает Django на своей SQLite базе, поэтому PostgreSQL для запуска не нужен.
+"""
+import os
+import sys
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_DB_DIR = BASE_DIR / '.benchmarks'
+
+
+def setup_django(db_name, use_env_database=False):
+    """
+    Настраиваю Django на SQLite базе .benchmarks/<db_name>.sqlite3 и применяю миграции.
+    С use_env_database=True используется БД из переменных DB_* (например, PostgreSQL).
+    """
+    sys.path.insert(0, str(BASE_DIR))
+    DEFAULT_DB_DIR.mkdir(exist_ok=True)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_proj_reviews.settings')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ.setdefault('ALLOWED_HOSTS', '*')
+    # Пустая строка выключает DEBUG, иначе Django копит все SQL запросы в памяти
+    os.environ['DEBUG'] = ''
+    if not use_env_database:
+        os.environ['DB_ENGINE'] = 'django.db.backends.sqlite3'
+        os.environ['DB_NAME'] = str(DEFAULT_DB_DIR / f'{db_name}.sqlite3')
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+
+
+def seed(countries=10, manufactures=50, cars=500, comments=10000, batch_size=5000):
+    """Наполняю базу через reviews.seeding, если в ней еще нет нужного количества автомобилей и комментариев"""
+    from reviews.models import Car, Comment
+    from reviews.seeding import clear_catalogue, seed_catalogue
+
+    if Car.objects.count() == cars and Comment.objects.count() == comments:
+        return
+
+    clear_catalogue()
+    seed_catalogue(countries, manufactures, cars, comments, batch_size=batch_size)
+
+
+def peak_rss_mb():
+    """Пиковое потребление памяти текущим процессом в мегабайтах"""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux ru_maxrss в килобайтах, в macOS - в байтах
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
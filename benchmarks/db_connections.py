@@ -0,0 +1,92 @@
+"""
+Бенчмарк повторного использования соединений с БД: задержка дешевого запроса GET /api/countries/.
+
+Режимы:
+    no-reuse    DB_CONN_MAX_AGE=0, новое соединение на каждый запрос (поведение до настройки)
+    persistent  DB_CONN_MAX_AGE=60 с проверкой соединения перед повторным использованием
+    pool        DB_POOL=True, пул psycopg 3 (только PostgreSQL)
+
+Каждый режим запускается в отдельном процессе, потому что настройки БД читаются при старте.
+По умолчанию используется SQLite из .benchmarks/, где открыть соединение дешево.
+Для PostgreSQL задайте DB_ENGINE=django.db.backends.postgresql и остальные DB_* и добавьте --env-database:
+
+    python -m benchmarks.db_connections --requests 2000
+    python -m benchmarks.db_connections --requests 2000 --env-database
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BASE_DIR, seed, setup_django
+
+MODES = {
+    'no-reuse': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'False'},
+    'persistent': {'DB_CONN_MAX_AGE': '60', 'DB_CONN_HEALTH_CHECKS': 'True', 'DB_POOL': 'False'},
+    'pool': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': 'True'},
+}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def child(args):
+    setup_django('connections', use_env_database=args.env_database)
+    seed(comments=0)
+
+    from django.db import connection
+    from django.test import Client
+
+    client = Client()
+    # Прогрев: импорты, первый запрос, наполнение пула
+    for _ in range(20):
+        client.get('/api/countries/')
+
+    latencies = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        response = client.get('/api/countries/')
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    print(json.dumps({
+        'vendor': connection.vendor,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'rps': len(latencies) / sum(latencies),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--env-database', action='store_true', help='БД из переменных DB_* вместо SQLite')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    postgres = args.env_database and os.getenv('DB_ENGINE') == 'django.db.backends.postgresql'
+    for mode in args.modes:
+        if mode == 'pool' and not postgres:
+            print(f'{mode:<11} пропущен: пул есть только у PostgreSQL')
+            continue
+        # Кеш ответов выключен, иначе запрос не доходит до БД
+        env = dict(os.environ, REVIEWS_CACHE_ENABLED='False', THROTTLE_ENABLED='False', **MODES[mode])
+        command = [sys.executable, '-m', 'benchmarks.db_connections', '--child', '--requests', str(args.requests)]
+        if args.env_database:
+            command.append('--env-database')
+        output = subprocess.run(command, cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'{mode:<11} {result["vendor"]:<10} p50 {result["p50"] * 1000:>6.2f} ms   '
+              f'p99 {result["p99"] * 1000:>6.2f} ms   {result["rps"]:>7.0f} rps')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Бенчмарк сериализации list: ModelSerializer + JSONRenderer против values() + FastJSONRenderer.
+
+Для каждой модели берутся первые --rows объектов (выборка, связанные объекты и рендер JSON
+входят во время, как в настоящем запросе) и проверяется, что оба пути дают одинаковые байты.
+Отдельно меряется запрос списка через тестовый клиент с максимальным page_size.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.fast_read --rows 10000 50000 --comments 100000
+"""
+import argparse
+import os
+import time
+
+from benchmarks.common import seed, setup_django
+
+
+def best_of(repeat, func):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--manufactures', type=int, default=10000)
+    parser.add_argument('--cars', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ['REVIEWS_CACHE_ENABLED'] = 'False'
+    os.environ['THROTTLE_ENABLED'] = 'False'
+    setup_django(f'fast_read_{args.manufactures}_{args.cars}_{args.comments}')
+    seed(countries=20, manufactures=args.manufactures, cars=args.cars, comments=args.comments)
+
+    from django.test import Client, override_settings
+    from rest_framework.renderers import JSONRenderer
+    from reviews.renderers import FastJSONRenderer
+    from reviews.views import CountryViewSet, ManufactureViewSet, CarViewSet, CommentViewSet
+
+    for viewset in (CountryViewSet, ManufactureViewSet, CarViewSet, CommentViewSet):
+        for rows in args.rows:
+            queryset = viewset().get_queryset()
+            if queryset.count() < rows:
+                continue
+            order = viewset.pagination_class.ordering
+            model_time, model_json = best_of(args.repeat, lambda: JSONRenderer().render(
+                viewset.serializer_class(queryset.order_by(*order)[:rows], many=True).data))
+            reader = viewset.values_reader
+            values_time, values_json = best_of(args.repeat, lambda: FastJSONRenderer().render(
+                reader.represent(list(reader.get_queryset().order_by(*order)[:rows]))))
+            assert model_json == values_json, viewset.__name__
+            print(f'{viewset.cache_scope:<12} {rows:>7} rows   serializer {model_time:>7.3f} s   '
+                  f'values {values_time:>7.3f} s   x{model_time / values_time:.2f}')
+
+    client = Client()
+    for url in ('/api/cars/?page_size=500', '/api/comments/?page_size=500'):
+        for enabled in (False, True):
+            with override_settings(FAST_READ_ENABLED=enabled):
+                elapsed, _ = best_of(args.repeat * 10, lambda: client.get(url))
+            print(f'{url:<32} {"values" if enabled else "serializer":<10} {elapsed * 1000:>7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Бенчмарк кеша ответов: запросов в секунду к list/retrieve эндпоинтам с холодным и прогретым кешем.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.response_cache --comments 20000 --requests 200
+"""
+import argparse
+import time
+
+from benchmarks.common import seed, setup_django
+
+
+def measure(client, urls, requests, warm):
+    from django.core.cache import cache
+
+    cache.clear()
+    if warm:
+        for url in urls:
+            client.get(url)
+
+    started = time.perf_counter()
+    for i in range(requests):
+        if not warm:
+            cache.clear()
+        response = client.get(urls[i % len(urls)])
+        assert response.status_code == 200, response.status_code
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django(f'cache_{args.comments}')
+    seed(comments=args.comments)
+
+    from django.test import Client
+    from reviews.models import Car, Country, Manufacture
+
+    endpoints = {
+        'countries': ['/api/countries/', f'/api/countries/{Country.objects.first().pk}/'],
+        'manufactures': ['/api/manufactures/', f'/api/manufactures/{Manufacture.objects.first().pk}/'],
+        'cars': ['/api/cars/', f'/api/cars/{Car.objects.first().pk}/'],
+    }
+    client = Client()
+    for name, urls in endpoints.items():
+        cold = measure(client, urls, args.requests, warm=False)
+        warm = measure(client, urls, args.requests, warm=True)
+        print(f'{name:<13} cold {cold:>8.1f} rps   warm {warm:>8.1f} rps   x{warm / cold:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Набор бенчмарков всех GET маршрутов reviews/urls.py: списки, объекты, экспорты, поиск и асинхронный путь.
+
+Для каждого маршрута через тестовый клиент снимаются время (минимум и медиана из --repeat),
+количество SQL запросов, пиковая память Python (tracemalloc, отдельным прогоном) и размер ответа.
+Результат - JSON, который удобно сохранять и сравнивать между коммитами. Кеш ответов выключен,
+чтобы каждый запрос доходил до БД. Работает на SQLite в .benchmarks/.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.suite --comments 100000 --output before.json
+    python -m benchmarks.suite --comments 100000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from asgiref.sync import async_to_sync
+
+from benchmarks.common import BASE_DIR, setup_django
+
+# Параметры маршрутов, без которых они не работают
+ROUTE_PARAMS = {
+    'comment-search': {'q': 'автомобиль'},
+}
+
+
+def collect_routes():
+    """(имя, url, параметры, асинхронный ли) для всех GET маршрутов списка, объекта и действий"""
+    from reviews.urls import async_urlpatterns, router
+
+    routes = []
+    for prefix, viewset, basename in router.registry:
+        queryset = getattr(viewset, 'queryset', None)
+        pk = None if queryset is None else queryset.order_by('pk').values_list('pk', flat=True).first()
+        if hasattr(viewset, 'list'):
+            routes.append((f'{basename}-list', f'/api/{prefix}/', {}, False))
+        if hasattr(viewset, 'retrieve') and pk is not None:
+            routes.append((f'{basename}-detail', f'/api/{prefix}/{pk}/', {}, False))
+        for action in viewset.get_extra_actions():
+            if 'get' not in action.mapping:
+                continue
+            name = f'{basename}-{action.url_name}'
+            if action.detail:
+                if pk is not None:
+                    routes.append((name, f'/api/{prefix}/{pk}/{action.url_path}/', ROUTE_PARAMS.get(name, {}), False))
+            else:
+                routes.append((name, f'/api/{prefix}/{action.url_path}/', ROUTE_PARAMS.get(name, {}), False))
+
+    from reviews.models import Country, Manufacture, Car, Comment
+
+    first_pk = {model.__name__.lower(): model.objects.order_by('pk').values_list('pk', flat=True).first()
+                for model in (Country, Manufacture, Car, Comment)}
+    for pattern in async_urlpatterns:
+        route = str(pattern.pattern)
+        if '<int:pk>' in route:
+            model_name = pattern.callback.view_initkwargs['viewset'].cache_scope
+            route = route.replace('<int:pk>', str(first_pk[model_name]))
+        name = pattern.name or 'async-' + route.strip('/').replace('/', '-')
+        routes.append((name, f'/api/async/{route}', {}, True))
+    return routes
+
+
+async def consume_async(content):
+    size = 0
+    async for chunk in content:
+        size += len(chunk)
+    return size
+
+
+def fetch(client, url, params):
+    response = client.get(url, params)
+    if response.streaming and response.is_async:
+        size = async_to_sync(consume_async)(response.streaming_content)
+    elif response.streaming:
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return response.status_code, size
+
+
+def measure(client, name, url, params, is_async, repeat):
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    # Журнал запросов ограничен по длине, после заполнения базы он полон и разница была бы нулевой
+    reset_queries()
+    # Первый прогон: количество запросов и размер ответа (заодно прогрев)
+    with CaptureQueriesContext(connection) as captured:
+        status, size = fetch(client, url, params)
+    # Следующие запросы очищают журнал соединения, поэтому считаю сразу
+    queries = len(captured)
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fetch(client, url, params)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    fetch(client, url, params)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'route': name,
+        'url': url,
+        'status': status,
+        'seconds_min': round(min(timings), 4),
+        'seconds_median': round(statistics.median(timings), 4),
+        # Асинхронные представления ходят в БД из других потоков, их запросы здесь не видны.
+        # По той же причине у экспорта каталога (таблицы читаются пулом потоков) будет 0
+        'queries': None if is_async else queries,
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+        'bytes': size,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = {item['route']: item for item in json.load(file)['results']}
+    print(f'{"route":<32} {"before":>9} {"after":>9} {"ratio":>7} {"queries":>13}', file=sys.stderr)
+    for item in results:
+        old = baseline.get(item['route'])
+        if old is None:
+            continue
+        ratio = item['seconds_median'] / old['seconds_median'] if old['seconds_median'] else float('inf')
+        queries = f'{old["queries"]} -> {item["queries"]}'
+        print(f'{item["route"]:<32} {old["seconds_median"]:>9.4f} {item["seconds_median"]:>9.4f} '
+              f'{ratio:>6.2f}x {queries:>13}', file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--countries', type=int, default=20)
+    parser.add_argument('--manufactures', type=int, default=200)
+    parser.add_argument('--cars', type=int, default=2000)
+    parser.add_argument('--comments', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--routes', nargs='+', help='Только маршруты, в имени которых есть одна из подстрок')
+    parser.add_argument('--output', help='Файл для JSON результата (по умолчанию stdout)')
+    parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+    args = parser.parse_args()
+
+    os.environ['REVIEWS_CACHE_ENABLED'] = 'False'
+    os.environ['THROTTLE_ENABLED'] = 'False'
+    # Лог медленных запросов мешал бы выводу, экспорты на большом наборе всегда дольше секунды
+    os.environ['SLOW_REQUEST_MS'] = '0'
+    db_name = f'suite_{args.countries}_{args.manufactures}_{args.cars}_{args.comments}'
+    setup_django(db_name)
+
+    import django
+    from django.core.management import call_command
+    from django.test import Client
+    from reviews.models import Car, Comment
+
+    if Car.objects.count() != args.cars or Comment.objects.count() != args.comments:
+        call_command('seed_reviews', countries=args.countries, manufactures=args.manufactures, cars=args.cars,
+                     comments=args.comments, clear=True, stdout=sys.stderr)
+
+    # Как при старте воркера (wsgi.py/asgi.py): загрузка снимка справочников не попадает в замеры
+    from reviews.snapshot import catalogue_snapshot
+
+    catalogue_snapshot.warm_up()
+    client = Client(HTTP_AUTHORIZATION='Token benchmark')
+    results = []
+    for name, url, params, is_async in collect_routes():
+        if args.routes and not any(part in name for part in args.routes):
+            continue
+        result = measure(client, name, url, params, is_async, args.repeat)
+        print(f'{name:<32} {result["seconds_median"]:>8.4f} s  queries {result["queries"]}', file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'dataset': {'countries': args.countries, 'manufactures': args.manufactures,
+                        'cars': args.cars, 'comments': args.comments},
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Нагрузочный тест троттлинга: задержка дешевых запросов, пока один клиент без остановки качает экспорты.
+
+Сервер - gunicorn с одним воркером на SQLite базе .benchmarks/. Читатели (--clients) ходят со своим
+API токеном в списки и объекты, а один клиент без токена в --hammers потоков запрашивает CSV и XLSX
+экспорт комментариев. Три прогона: только читатели, читатели и экспорты без троттлинга,
+читатели и экспорты с троттлингом. Для читателей считаются p50/p99 без первых --warmup секунд
+(за это время клиент с экспортами тратит запас корзины), для экспортов - сколько запросов
+выполнено и сколько получили 429.
+
+Запуск из корня проекта:
+
+    python -m benchmarks.throttle_load --comments 50000 --clients 4 --hammers 4 --duration 40 --warmup 10
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.asgi_load import percentile, wait_for_port
+from benchmarks.common import BASE_DIR, seed, setup_django
+
+TOKEN = 'benchmark-token'
+
+
+def client_loop(port, urls, headers, stop, latencies, statuses, measure_from=0.0):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    index = 0
+    while not stop.is_set():
+        url = urls[index % len(urls)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            connection.request('GET', url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            statuses.append(type(exc).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+            continue
+        statuses.append(response.status)
+        if latencies is not None and started >= measure_from:
+            latencies.append(time.perf_counter() - started)
+        if response.status == 429:
+            # Клиент, который уважает Retry-After, ждал бы; этот долбит дальше, но не чаще раза в 50 мс
+            time.sleep(0.05)
+    connection.close()
+
+
+def run(name, port, urls, args, hammers, throttle):
+    env = dict(os.environ, REVIEWS_CACHE_ENABLED='False', SLOW_REQUEST_MS='0', API_ACCESS_TOKEN=TOKEN,
+               THROTTLE_ENABLED=str(throttle))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'test_proj_reviews.wsgi:application', '--bind', f'127.0.0.1:{port}',
+         '--workers', '1', '--threads', str(args.clients + args.hammers), '--log-level', 'warning'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        stop = threading.Event()
+        measure_from = time.perf_counter() + args.warmup
+        latencies = []
+        reader_statuses = []
+        hammer_statuses = []
+        exports = ['/api/comments/export/csv/', '/api/comments/export/xlsx/']
+        threads = [
+            threading.Thread(target=client_loop, args=(port, urls, {'Authorization': f'Token {TOKEN}'}, stop,
+                                                       latencies, reader_statuses, measure_from))
+            for _ in range(args.clients)
+        ] + [
+            threading.Thread(target=client_loop, args=(port, exports, {}, stop, None, hammer_statuses))
+            for _ in range(hammers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f'{name:<22} readers {len(latencies) / (args.duration - args.warmup):>7.1f} rps   '
+          f'p50 {percentile(latencies, 0.5) * 1000:>7.1f} ms   p99 {percentile(latencies, 0.99) * 1000:>8.1f} ms   '
+          f'exports ok {hammer_statuses.count(200):>4}   429 {hammer_statuses.count(429):>5}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=50000)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--hammers', type=int, default=4)
+    parser.add_argument('--duration', type=int, default=40)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--port', type=int, default=8775)
+    args = parser.parse_args()
+
+    setup_django(f'load_{args.comments}')
+    seed(comments=args.comments)
+
+    from reviews.models import Car, Comment
+
+    car = Car.objects.first()
+    urls = [
+        '/api/comments/?page_size=50',
+        f'/api/comments/?car={car.pk}',
+        '/api/cars/?page_size=20',
+        f'/api/cars/{car.pk}/',
+        f'/api/comments/{Comment.objects.first().pk}/',
+    ]
+    run('readers only', args.port, urls, args, hammers=0, throttle=True)
+    run('exports, no throttle', args.port + 1, urls, args, hammers=args.hammers, throttle=False)
+    run('exports, throttle', args.port + 2, urls, args, hammers=args.hammers, throttle=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Бенчмарк XLSX экспорта комментариев: старый Workbook() против write-only движка из ExportMixin.
+
+Каждый замер выполняется в отдельном процессе, чтобы пиковая память (ru_maxrss) не смешивалась.
+Запуск из корня проекта:
+
+    python -m benchmarks.xlsx_export --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.common import peak_rss_mb, setup_django
+
+ENGINES = ('legacy', 'write_only')
+
+
+def run_legacy():
+    """Прежняя реализация: обычная книга openpyxl и полностью вычисленный queryset"""
+    from django.http import HttpResponse
+    from openpyxl import Workbook
+    from reviews.models import Comment
+
+    comments = Comment.objects.all().select_related('car', 'car__manufacture', 'car__manufacture__country')
+    response = HttpResponse()
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'comments'
+    ws.append(['ID', 'Email', 'Car', 'Manufacture', 'Country', 'Created At', 'Comment Text'])
+    for comment in comments:
+        ws.append([comment.id, comment.email, comment.car.name, comment.car.manufacture.name,
+                   comment.car.manufacture.country.name, comment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                   comment.comment_text[:100] + '...' if len(comment.comment_text) > 100 else comment.comment_text])
+    wb.save(response)
+    return len(response.content)
+
+
+def run_write_only():
+    """Текущая реализация через эндпоинт /api/comments/export/xlsx/"""
+    from django.test import Client
+
+    response = Client().get('/api/comments/export/xlsx/')
+    size = 0
+    for chunk in response.streaming_content:
+        size += len(chunk)
+    response.close()
+    return size
+
+
+def child(engine, rows):
+    setup_django(f'xlsx_{rows}')
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    size = run_legacy() if engine == 'legacy' else run_write_only()
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        'engine': engine,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_before_mb': round(rss_before, 1),
+        'bytes': size,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--child', choices=ENGINES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.sizes[0])
+        return
+
+    results = []
+    for rows in args.sizes:
+        # Наполняю базу заранее, чтобы генерация данных не попала в замер памяти
+        subprocess.run(
+            [sys.executable, '-c',
+             f'from benchmarks.common import setup_django, seed; setup_django("xlsx_{rows}"); seed(comments={rows})'],
+            check=True,
+        )
+        for engine in args.engines:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.xlsx_export', '--child', engine, '--sizes', str(rows)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{rows:>9} rows  {engine:<10}  {result['seconds']:>8.2f} s  "
+                  f"peak RSS {result['peak_rss_mb']:>8.1f} MB (до экспорта {result['rss_before_mb']:.1f} MB)")
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,97 @@
+import json
+from datetime import datetime
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
 from .models import Country, Manufacture, Car, Comment
 
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор changelist для больших таблиц. На PostgreSQL количество строк сначала берется из оценки
+    планировщика (EXPLAIN по статистике таблицы), и только если она меньше ADMIN_ESTIMATED_COUNT_THRESHOLD,
+    считается точный COUNT(*). На больших таблицах счетчик в админке поэтому приблизительный.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        # У пустого QuerySet (none()) нет SQL, его считает обычный count() без запроса
+        if (isinstance(queryset, QuerySet) and not queryset.query.is_empty()
+                and connections[queryset.db].vendor == 'postgresql'):
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def next_period(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return datetime.fromordinal(start.toordinal() + 1).replace(tzinfo=start.tzinfo)
+
+
+class DatePeriodsQuerySet(QuerySet):
+    """
+    QuerySet для date_hierarchy. Стандартный datetimes() - это SELECT DISTINCT по усеченной дате, то есть
+    просмотр всех строк. Здесь границы берутся через Min/Max, а каждый год, месяц или день проверяется
+    запросом exists() по диапазону дат - все это идет по индексу на поле даты.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+
+        tzinfo = tzinfo or (timezone.get_current_timezone() if settings.USE_TZ else None)
+        first, last = bounds['first'], bounds['last']
+        if tzinfo is not None:
+            first, last = first.astimezone(tzinfo), last.astimezone(tzinfo)
+        start = datetime(first.year, 1 if kind == 'year' else first.month, 1 if kind != 'day' else first.day)
+        if tzinfo is not None:
+            start = timezone.make_aware(start, tzinfo)
+
+        periods = []
+        while start <= last:
+            end = next_period(start, kind)
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                periods.append(start)
+            start = end
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class PopularCarFilter(admin.SimpleListFilter):
+    """Фильтр по автомобилю без выборки всех автомобилей: самые обсуждаемые и уже выбранный"""
+    title = 'автомобиль'
+    parameter_name = 'car'
+    limit = 20
+
+    def lookups(self, request, model_admin):
+        # Порядок по индексу (-comments_count, id)
+        cars = list(Car.objects.order_by('-comments_count', 'id').values_list('id', 'name')[:self.limit])
+        value = self.value()
+        if value and value.isdigit() and all(str(pk) != value for pk, _ in cars):
+            cars += Car.objects.filter(pk=value).values_list('id', 'name')
+        return cars
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value is None:
+            return queryset
+        if not value.isdigit():
+            return queryset.none()
+        return queryset.filter(car_id=value)
+
+
 @admin.register(Country)
 class CountryAdmin(admin.ModelAdmin):
     """Админка для стран"""
@@ -15,6 +106,11 @@ class ManufactureAdmin(admin.ModelAdmin):
     list_filter = ('country',)  # Фильтр по странам
     search_fields = ('name', 'country__name')
     ordering = ('name',)
+    autocomplete_fields = ('country',)
+
+    def get_queryset(self, request):
+        # str(manufacture) показывает страну: и в списке, и в подсказках автодополнения
+        return super().get_queryset(request).select_related('country')
 
 @admin.register(Car)
 class CarAdmin(admin.ModelAdmin):
@@ -23,12 +119,27 @@ class CarAdmin(admin.ModelAdmin):
     list_filter = ('manufacture', 'release_year')
     search_fields = ('name', 'manufacture__name')
     ordering = ('name',)
+    autocomplete_fields = ('manufacture',)
+
+    def get_queryset(self, request):
+        # str(car) показывает производителя и его страну, без соединения это два запроса на строку
+        return super().get_queryset(request).select_related('manufacture__country')
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     """Админка для комментариев"""
     list_display = ('id', 'email', 'car', 'created_at')
-    list_filter = ('created_at', 'car')  # Фильтр по дате и автомобилю
+    list_select_related = ('car__manufacture__country',)
+    list_filter = (PopularCarFilter,)  # Фильтр по дате - date_hierarchy
+    date_hierarchy = 'created_at'
     search_fields = ('email', 'car__name', 'comment_text')
     readonly_fields = ('created_at',)  # Дата создания только для чтения
-    ordering = ('-created_at',)  # Сначала новые комментарии
\ No newline at end of file
+    ordering = ('-created_at',)  # Сначала новые комментарии
+    autocomplete_fields = ('car',)
+    # Без полного COUNT(*) по таблице на каждой странице с фильтром
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return DatePeriodsQuerySet(self.model, query=queryset.query, using=queryset._db)
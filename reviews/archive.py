@@ -0,0 +1,292 @@
+"""
+Архив старых комментариев. Месяц комментариев переносится из БД в файл
+COMMENTS_ARCHIVE_DIR/comments-YYYY-MM-<время архивации>.ndjson.gz: gzip, по JSON объекту на строку, новые первыми.
+О файле остается запись CommentArchive. На PostgreSQL месяц - это секция таблицы (reviews/partitions.py),
+и из БД он удаляется через DROP секции, без DELETE по строкам и без раздувания таблицы.
+
+Списки, поиск и экспорты по умолчанию видят только комментарии в БД. С параметром
+?include_archived=true список, объект и экспорты комментариев добавляют архивные: файлы читаются
+потоково и только за месяцы, которые попадают в фильтр по датам и идут после позиции курсора.
+"""
+import gzip
+import heapq
+import json
+import operator
+import os
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from functools import partial
+from itertools import islice
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.http import Http404
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .cache import bump_versions
+from .counters import adjust_comments_count
+from .filters import parse_filters
+from .models import Car, Comment, CommentArchive
+from .pagination import decode_position, encode_position, keyset_filter
+from .partitions import add_months, current_month, drop_partition, get_connection, is_partitioned, month_bounds
+from .search import inverted_index
+from .snapshot import catalogue_snapshot
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, с ним архив читается в несколько раз быстрее
+    orjson = None
+
+FIELDS = ('id', 'email', 'car_id', 'created_at', 'comment_text')
+
+LOOKUP_OPERATORS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def row_key(row):
+    """Ключ порядка выдачи комментариев (-created_at, -id)"""
+    return row['created_at'], row['id']
+
+
+def archive_path(archive):
+    return Path(settings.COMMENTS_ARCHIVE_DIR) / archive.file_name
+
+
+def dump_row(row):
+    if orjson is not None:
+        return orjson.dumps(row) + b'\n'
+    row = {**row, 'created_at': row['created_at'].isoformat()}
+    return json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode() + b'\n'
+
+
+def open_archive(archive):
+    try:
+        return gzip.open(archive_path(archive), 'rb')
+    except FileNotFoundError:
+        # Месяц архивировали повторно после того, как запись была прочитана: файл заменен новым
+        return gzip.open(archive_path(CommentArchive.objects.get(month=archive.month)), 'rb')
+
+
+def read_archive(archive):
+    loads = orjson.loads if orjson is not None else json.loads
+    with open_archive(archive) as file:
+        for line in file:
+            row = loads(line)
+            row['created_at'] = datetime.fromisoformat(row['created_at'])
+            yield row
+
+
+def write_archive(path, rows):
+    """Пишет строки в файл через временный .part, возвращает (число строк, минимальный id, максимальный id)"""
+    temporary = path.with_name(path.name + '.part')
+    count, min_id, max_id = 0, None, None
+    with open(temporary, 'wb') as raw, gzip.open(raw, 'wb') as file:
+        for row in rows:
+            file.write(dump_row(row))
+            count += 1
+            min_id = row['id'] if min_id is None else min(min_id, row['id'])
+            max_id = row['id'] if max_id is None else max(max_id, row['id'])
+        file.close()
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(temporary, path)
+    return count, min_id, max_id
+
+
+def unique_rows(rows):
+    """Убирает повторы из отсортированного потока: из двух одинаковых строк остается первая"""
+    last = None
+    for row in rows:
+        key = row_key(row)
+        if key != last:
+            last = key
+            yield row
+
+
+def delete_month(month):
+    """Удаляет комментарии месяца из БД, возвращает число удаленных. Вызывать внутри транзакции"""
+    connection = get_connection()
+    if is_partitioned(connection):
+        rows = drop_partition(month, connection)
+        if rows is not None:
+            return rows
+    # Месяц без своей секции (SQLite или строки в секции по умолчанию)
+    start, end = month_bounds(month)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Comment._meta.db_table} WHERE created_at >= %s AND created_at < %s',
+            [connection.ops.adapt_datetimefield_value(start), connection.ops.adapt_datetimefield_value(end)],
+        )
+        return cursor.rowcount
+
+
+def archive_month(month):
+    """
+    Переносит комментарии месяца (month - первое число) в архив, возвращает число перенесенных.
+    Если месяц уже в архиве (потом в БД попали его комментарии, например импортом), пишется новый файл
+    со строками прежнего. Запись CommentArchive переключается на новый файл в одной транзакции
+    с удалением строк из БД, поэтому при ошибке строки остаются в БД и в архив не попадают.
+    Сигналы не отправляются: счетчики, кеш и индекс поиска обновляются здесь же.
+    """
+    start, end = month_bounds(month)
+    comments = Comment.objects.filter(created_at__gte=start, created_at__lt=end)
+    if not comments.exists():
+        return 0
+
+    directory = Path(settings.COMMENTS_ARCHIVE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = CommentArchive.objects.filter(month=month).first()
+    file_name = f'comments-{month:%Y-%m}-{datetime.now(dt_timezone.utc):%Y%m%d%H%M%S%f}.ndjson.gz'
+    car_counts = Counter()
+
+    def database_rows():
+        rows = comments.order_by('-created_at', '-id').values(*FIELDS)
+        for row in rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            car_counts[row['car_id']] += 1
+            yield row
+
+    rows = database_rows()
+    if previous is not None:
+        # Строки из БД идут первыми и при повторе побеждают: комментарий мог вернуться в БД
+        # из выгрузки архива (например, импортом), и в файле он должен остаться один раз
+        rows = unique_rows(heapq.merge(rows, read_archive(previous), key=row_key, reverse=True))
+    path = directory / file_name
+    total, min_id, max_id = write_archive(path, rows)
+    archived = sum(car_counts.values())
+
+    try:
+        with transaction.atomic():
+            deleted = delete_month(month)
+            if deleted != archived:
+                # Пока писался файл, комментарии месяца добавили или удалили
+                raise RuntimeError(f'Комментарии за {month:%Y-%m} изменились во время архивации, повторите запуск')
+            CommentArchive.objects.update_or_create(month=month, defaults={
+                'file_name': file_name, 'rows': total, 'min_id': min_id, 'max_id': max_id,
+            })
+            adjust_comments_count({car_id: -count for car_id, count in car_counts.items()})
+    except BaseException:
+        # Строки остались в БД, запись архива указывает на прежний файл
+        path.unlink(missing_ok=True)
+        raise
+    if previous is not None:
+        transaction.on_commit(partial(archive_path(previous).unlink, missing_ok=True))
+
+    bump_versions(['comment:all', 'car:all', 'manufacture:all'])
+    inverted_index.reset()
+    return archived
+
+
+def archive_old_comments(keep_months):
+    """
+    Архивирует все месяцы старше keep_months последних (текущий месяц считается).
+    Возвращает список (месяц, сколько перенесено).
+    """
+    cutoff = add_months(current_month(), 1 - keep_months)
+    first = Comment.objects.aggregate(first=Min('created_at'))['first']
+    if first is None:
+        return []
+    month = first.astimezone(dt_timezone.utc).date().replace(day=1)
+    results = []
+    while month < cutoff:
+        archived = archive_month(month)
+        if archived:
+            results.append((month, archived))
+        month = add_months(month, 1)
+    return results
+
+
+def row_checks(filters):
+    """Функции проверки строки архива по фильтрам {lookup: значение} из filter_params вьюсета"""
+    checks = []
+    for lookup, value in filters.items():
+        field, _, kind = lookup.partition('__')
+        compare = LOOKUP_OPERATORS[kind or 'exact']
+        key = field if field in FIELDS else f'{field}_id'
+        checks.append(lambda row, key=key, compare=compare, value=value: compare(row[key], value))
+    return checks
+
+
+def archived_rows(filters=None, after=None):
+    """
+    Архивные комментарии в порядке (-created_at, -id): подходящие под filters и идущие после
+    позиции курсора after ([created_at, id]). Комментарии удаленных потом автомобилей пропускаются.
+    """
+    filters = filters or {}
+    checks = row_checks(filters)
+    lower, upper = filters.get('created_at__gte'), filters.get('created_at__lt')
+    archives = list(CommentArchive.objects.order_by('-month'))
+    cars = catalogue_snapshot.get().rows[Car] if archives else {}
+    for archive in archives:
+        start, end = month_bounds(archive.month)
+        if lower is not None and end <= lower:
+            break
+        if (upper is not None and start >= upper) or (after is not None and start > after[0]):
+            continue
+        for row in read_archive(archive):
+            if after is not None and row_key(row) >= tuple(after):
+                continue
+            if row['car_id'] in cars and all(check(row) for check in checks):
+                yield row
+
+
+def find_archived(pk):
+    """Архивный комментарий по id или None"""
+    for archive in CommentArchive.objects.filter(min_id__lte=pk, max_id__gte=pk):
+        for row in read_archive(archive):
+            if row['id'] == pk:
+                return row if row['car_id'] in catalogue_snapshot.get().rows[Car] else None
+    return None
+
+
+def include_archived(request):
+    return request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+class ArchiveReadMixin:
+    """
+    list и retrieve комментариев с ?include_archived=true: к строкам из БД добавляются архивные.
+    Список в этом режиме листается вперед keyset курсором, как /api/async/; курсор обычного списка не подходит.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not include_archived(request):
+            return super().list(request, *args, **kwargs)
+
+        ordering = self.pagination_class.ordering
+        filters = parse_filters(request.query_params, self.filter_params)
+        position = None
+        if request.query_params.get('cursor'):
+            position = decode_position(request.query_params['cursor'], Comment, ordering)
+            if position is None:
+                raise ValidationError({'cursor': 'Некорректный курсор'})
+
+        page_size = self.pagination_class().get_page_size(request)
+        queryset = self.values_reader.get_queryset().filter(**filters).order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+        # Из архива читается ровно столько строк, сколько нужно странице
+        rows = heapq.merge(list(queryset[:page_size + 1]), archived_rows(filters, position), key=row_key, reverse=True)
+        page = list(islice(rows, page_size + 1))
+
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_position(row_key(page[-1])))
+        return Response({'next': next_url, 'previous': None, 'results': self.values_reader.represent(page)})
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+            row = find_archived(int(pk)) if include_archived(request) and str(pk).isdigit() else None
+            if row is None:
+                raise
+            return Response(self.values_reader.represent([row])[0])
@@ -0,0 +1,196 @@
+"""
+Асинхронный путь чтения /api/async/...: список, объект и экспорт без DRF, на асинхронном ORM.
+Под ASGI сервером (uvicorn) такие запросы не занимают поток на время ожидания БД,
+а долгий экспорт не блокирует остальные запросы воркера.
+
+Queryset, сериализатор, фильтры и порядок берутся из обычных вьюсетов, поэтому состав
+данных тот же. Пагинация keyset: курсор хранит значения полей сортировки последнего объекта, как у обычных списков.
+"""
+import csv
+import tempfile
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.request import Request
+from rest_framework.throttling import BaseThrottle
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
+from .exports import CSV_STREAM_BUFFER_SIZE, XLSX_CONTENT_TYPE, Echo, write_xlsx
+from .filters import filter_by_params
+from .pagination import decode_position, encode_position, keyset_filter
+from .throttling import take_tokens
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+
+async def aiterate(queryset, chunk_size):
+    """
+    То же, что queryset.aiterator(), но итератор создается в потоке: у values_list() запрос
+    выполняется уже при создании итератора, и aiterator() сделал бы его в цикле событий
+    """
+    rows = await sync_to_async(lambda: iter(queryset.iterator(chunk_size=chunk_size)))()
+    while chunk := await sync_to_async(lambda: list(islice(rows, chunk_size)))():
+        for row in chunk:
+            yield row
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.GET['page_size'])
+    except (KeyError, ValueError):
+        return api_settings.PAGE_SIZE
+    if page_size <= 0:
+        return api_settings.PAGE_SIZE
+    return min(page_size, settings.API_MAX_PAGE_SIZE)
+
+
+class AsyncThrottledView(View):
+    """Те же корзины жетонов, что и у вьюсетов DRF; стоимость запроса - по throttle_action"""
+    throttle_action = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        ident = BaseThrottle().get_ident(request)
+        if settings.THROTTLE_SHARED:
+            # Общие корзины лежат в кеше (Redis): его запросы блокировали бы цикл событий
+            wait = await sync_to_async(take_tokens)(request, self.throttle_action, ident)
+        else:
+            wait = take_tokens(request, self.throttle_action, ident)
+        if wait is not None:
+            exc = Throttled(wait)
+            response = json_response({'detail': exc.detail}, status=exc.status_code)
+            response['Retry-After'] = str(exc.wait)
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncViewSetView(AsyncThrottledView):
+    """Базовое представление: данные берутся у вьюсета viewset"""
+    viewset = None
+
+    def get_queryset(self):
+        return self.viewset().get_queryset()
+
+    def serialize(self, data, many=False):
+        # Все связанные объекты уже загружены select_related/prefetch_related, сериализатор в БД не ходит
+        return self.viewset.serializer_class(data, many=many).data
+
+
+class AsyncListView(AsyncViewSetView):
+    throttle_action = 'list'
+
+    def get_ordering(self, request, queryset):
+        """Порядок обычного списка: ?ordering= через OrderingFilter вьюсета и id для однозначной позиции"""
+        return self.viewset.pagination_class().get_ordering(Request(request), queryset, self.viewset())
+
+    async def get(self, request):
+        try:
+            queryset = filter_by_params(self.get_queryset(), request.GET, getattr(self.viewset, 'filter_params', {}))
+        except ValidationError as exc:
+            return json_response(exc.detail, status=400)
+        ordering = self.get_ordering(request, queryset)
+        queryset = queryset.order_by(*ordering)
+
+        if request.GET.get('cursor'):
+            position = decode_position(request.GET['cursor'], queryset.model, ordering)
+            if position is None:
+                return json_response({'cursor': 'Некорректный курсор'}, status=400)
+            queryset = queryset.filter(keyset_filter(ordering, position))
+
+        page_size = get_page_size(request)
+        objects = [obj async for obj in queryset[:page_size + 1].aiterator(chunk_size=page_size + 1)]
+
+        next_url = None
+        if len(objects) > page_size:
+            objects = objects[:page_size]
+            last = objects[-1]
+            cursor = encode_position([getattr(last, field.lstrip('-')) for field in ordering])
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', cursor)
+        return json_response({'next': next_url, 'results': self.serialize(objects, many=True)})
+
+
+class AsyncDetailView(AsyncViewSetView):
+    throttle_action = 'retrieve'
+
+    async def get(self, request, pk):
+        obj = await self.get_queryset().filter(pk=pk).afirst()
+        if obj is None:
+            return json_response({'detail': 'Не найдено.'}, status=404)
+        return json_response(self.serialize(obj))
+
+
+class AsyncCSVExportView(AsyncThrottledView):
+    """Потоковый CSV: строки читаются через aiterator и отдаются кусками по CSV_STREAM_BUFFER_SIZE"""
+    export = None
+    throttle_action = 'export_csv'
+
+    async def get(self, request):
+        # Спецификация берет снимок справочников, а его загрузка - синхронный запрос к БД
+        spec = await sync_to_async(self.export)()
+        writer = csv.writer(Echo())
+
+        async def stream():
+            yield writer.writerow(spec.headers)
+
+            buffer = []
+            buffer_size = 0
+            async for item in aiterate(spec.data, settings.EXPORT_CHUNK_SIZE):
+                line = writer.writerow(spec.row_callback(item))
+                buffer.append(line)
+                buffer_size += len(line)
+                if buffer_size >= CSV_STREAM_BUFFER_SIZE:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffer_size = 0
+            if buffer:
+                yield ''.join(buffer)
+
+        return StreamingHttpResponse(
+            stream(),
+            content_type='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{spec.filename}.csv"'},
+        )
+
+
+def build_xlsx(export):
+    output = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+    spec = export()
+    try:
+        write_xlsx(output, spec.data, spec.filename, spec.headers, spec.row_callback)
+    finally:
+        # Поток из общего пула asgiref, его соединение с БД Django сам не закроет
+        connections.close_all()
+    output.seek(0)
+    return output, spec.filename
+
+
+class AsyncXLSXExportView(AsyncThrottledView):
+    """
+    Сборка XLSX - это в основном работа openpyxl на процессоре, поэтому книга строится целиком
+    в отдельном потоке, а цикл событий в это время обслуживает другие запросы
+    """
+    export = None
+    throttle_action = 'export_xlsx'
+
+    async def get(self, request):
+        output, filename = await sync_to_async(build_xlsx, thread_sensitive=False)(self.export)
+
+        # FileResponse под ASGI читал бы файл синхронным итератором через отдельный поток на каждый кусок
+        async def stream():
+            with output:
+                while chunk := output.read(FILE_CHUNK_SIZE):
+                    yield chunk
+
+        return StreamingHttpResponse(
+            stream(),
+            content_type=XLSX_CONTENT_TYPE,
+            headers={'Content-Disposition': f'attachment; filename="{filename}.xlsx"'},
+        )
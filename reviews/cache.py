@@ -0,0 +1,127 @@
+import hashlib
+import time
+from functools import partial
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+VERSION_PREFIX = 'reviews:version:'
+RESPONSE_PREFIX = 'reviews:response:'
+STATS_PREFIX = 'reviews:stats:'
+
+
+def get_cache():
+    return caches[settings.REVIEWS_CACHE_ALIAS]
+
+
+def list_scopes(model_name):
+    """Области, от которых зависит список объектов модели"""
+    return [f'{model_name}:all', f'{model_name}:list']
+
+
+def entity_scopes(model_name, pk):
+    """Области, от которых зависит один объект модели"""
+    return [f'{model_name}:all', f'{model_name}:{pk}']
+
+
+def get_versions(scopes):
+    """
+    Возвращает версии областей кеша. Версия - время последнего изменения в наносекундах.
+    Если версии еще нет (холодный кеш или вытеснение), заводится новая, что равносильно сбросу.
+    """
+    cache = get_cache()
+    keys = [VERSION_PREFIX + scope for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time_ns()
+        for key in missing:
+            # add не перезапишет версию, которую успел поставить другой процесс
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def set_versions(scopes):
+    now = time.time_ns()
+    get_cache().set_many({VERSION_PREFIX + scope: now for scope in scopes}, timeout=None)
+
+
+def bump_versions(scopes):
+    """
+    Сбрасывает все закешированные ответы, которые зависят от переданных областей.
+    Версии меняются после коммита транзакции: при смене до коммита параллельный запрос успел бы
+    закешировать еще старые данные под новой версией. Откат транзакции оставляет кеш как есть.
+    """
+    transaction.on_commit(partial(set_versions, list(scopes)))
+
+
+def record(event):
+    """Увеличивает счетчик попаданий/промахов кеша"""
+    cache = get_cache()
+    key = STATS_PREFIX + event
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_cache_stats():
+    """Счетчики попаданий и промахов кеша ответов"""
+    cache = get_cache()
+    return {event: cache.get(STATS_PREFIX + event, 0) for event in ('hits', 'misses')}
+
+
+class CachedResponseMixin:
+    """
+    Кеширует сериализованные данные list и retrieve и поддерживает условные GET запросы.
+    Ключ ответа и ETag строятся из версий областей кеша, поэтому сигналы моделей (reviews/signals.py)
+    сбрасывают ровно те ответы, которые зависят от измененных объектов.
+    """
+    cache_scope = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(list_scopes(self.cache_scope), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(entity_scopes(self.cache_scope, pk), super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, scopes, view, request, *args, **kwargs):
+        versions = get_versions(scopes)
+        # В ключ входит полный URL: от него зависят страница, фильтры и ссылки next/previous
+        raw_key = f'{self.cache_scope}:{self.action}:{request.build_absolute_uri()}:{versions}'
+        digest = hashlib.md5(raw_key.encode()).hexdigest()
+
+        # ETag и Last-Modified считаются только по версиям, без запросов к БД и сериализации
+        etag = '"%s"' % hashlib.md5(f'{digest}:{request.accepted_media_type}'.encode()).hexdigest()
+        last_modified = max(versions) // 1_000_000_000
+        not_modified = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = self.cached_data_response(RESPONSE_PREFIX + digest, view, request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def cached_data_response(self, key, view, request, *args, **kwargs):
+        if not settings.REVIEWS_CACHE_ENABLED:
+            return view(request, *args, **kwargs)
+
+        cache = get_cache()
+        data = cache.get(key)
+        if data is not None:
+            record('hits')
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        record('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.REVIEWS_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,152 @@
+"""
+Выгрузка всего каталога одним файлом: XLSX с листом на каждую модель или ZIP с CSV файлами.
+
+Вместо четырех отдельных экспортов с пересекающимися JOIN таблицы читаются по одному разу
+через values_list, параллельно в потоках (у каждого потока свое соединение с БД).
+Страны, производители и автомобили держатся в памяти как справочники, по ним строятся
+названия во всех листах. Комментарии копятся во временном файле пачками pickle, а названия
+автомобиля, производителя и страны к ним подставляются из справочников без JOIN.
+"""
+import csv
+import io
+import pickle
+import tempfile
+import zipfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+from openpyxl import Workbook
+from .exports import (
+    CAR_HEADERS, COMMENT_HEADERS, COUNTRY_HEADERS, CREATED_AT_FORMAT, MANUFACTURE_HEADERS, short_comment_text,
+)
+from .models import Country, Manufacture, Car, Comment
+
+ZIP_CONTENT_TYPE = 'application/zip'
+
+
+def fetch_list(queryset):
+    return list(queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE))
+
+
+def fetch_spooled(queryset):
+    """Сохраняет строки во временный файл пачками, чтобы большая таблица не лежала в памяти целиком"""
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+    batch = []
+    for row in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        batch.append(row)
+        if len(batch) >= settings.EXPORT_CHUNK_SIZE:
+            pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+            batch = []
+    if batch:
+        pickle.dump(batch, spool, pickle.HIGHEST_PROTOCOL)
+    spool.seek(0)
+    return spool
+
+
+def read_spooled(spool):
+    with spool:
+        while True:
+            try:
+                batch = pickle.load(spool)
+            except EOFError:
+                return
+            yield from batch
+
+
+def in_thread(fetch, queryset):
+    try:
+        return fetch(queryset)
+    finally:
+        # Соединение потока пула Django сам не закроет
+        connections.close_all()
+
+
+def fetch_catalogue():
+    """
+    Читает все четыре таблицы. Внутри транзакции другие соединения не видят ее изменений,
+    поэтому тогда таблицы читаются по очереди в текущем соединении.
+    """
+    tasks = {
+        'countries': (fetch_list, Country.objects.values_list('id', 'name')),
+        'manufactures': (fetch_list, Manufacture.objects.values_list('id', 'name', 'country_id', 'comments_count')),
+        'cars': (fetch_list, Car.objects.values_list(
+            'id', 'name', 'manufacture_id', 'release_year', 'end_year', 'comments_count',
+        )),
+        'comments': (fetch_spooled, Comment.objects.values_list(
+            'id', 'email', 'car_id', 'created_at', 'comment_text',
+        )),
+    }
+
+    if connection.in_atomic_block or settings.CATALOGUE_EXPORT_WORKERS < 2:
+        return {name: fetch(queryset) for name, (fetch, queryset) in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=settings.CATALOGUE_EXPORT_WORKERS, thread_name_prefix='catalogue') as pool:
+        futures = {name: pool.submit(in_thread, fetch, queryset) for name, (fetch, queryset) in tasks.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def catalogue_sheets():
+    """
+    Листы каталога: (название, заголовок, строки) в том же виде, что и отдельные экспорты.
+    Таблицы читаются разными запросами, и объект может сослаться на родителя, созданного
+    после чтения его таблицы. Тогда названия родителя пустые, как в отдельных экспортах.
+    """
+    data = fetch_catalogue()
+    countries, manufactures, cars = data['countries'], data['manufactures'], data['cars']
+
+    country_names = dict(countries)
+    manufacture_names = defaultdict(list)
+    manufacture_lookup = {}
+    for manufacture_id, name, country_id, _ in manufactures:
+        manufacture_names[country_id].append(name)
+        manufacture_lookup[manufacture_id] = (name, country_names.get(country_id, ''))
+    cars_count = Counter(car[2] for car in cars)
+    car_lookup = {car_id: (name, *manufacture_lookup.get(manufacture_id, ('', '')))
+                  for car_id, name, manufacture_id, *_ in cars}
+
+    country_rows = (
+        [country_id, name, len(manufacture_names[country_id]), ', '.join(manufacture_names[country_id])]
+        for country_id, name in countries
+    )
+    manufacture_rows = (
+        [manufacture_id, name, country_names.get(country_id, ''), cars_count[manufacture_id], comments_count]
+        for manufacture_id, name, country_id, comments_count in manufactures
+    )
+    car_rows = (
+        [car_id, name, *manufacture_lookup.get(manufacture_id, ('', '')), release_year, end_year or 'Present',
+         comments_count]
+        for car_id, name, manufacture_id, release_year, end_year, comments_count in cars
+    )
+    comment_rows = (
+        [comment_id, email, *car_lookup.get(car_id, ('', '', '')), created_at.strftime(CREATED_AT_FORMAT),
+         short_comment_text(text)]
+        for comment_id, email, car_id, created_at, text in read_spooled(data['comments'])
+    )
+    return [
+        ('countries', COUNTRY_HEADERS, country_rows),
+        ('manufactures', MANUFACTURE_HEADERS, manufacture_rows),
+        ('cars', CAR_HEADERS, car_rows),
+        ('comments', COMMENT_HEADERS, comment_rows),
+    ]
+
+
+def write_catalogue_xlsx(output):
+    """Книга Excel с листом на каждую модель"""
+    wb = Workbook(write_only=True)
+    for title, headers, rows in catalogue_sheets():
+        ws = wb.create_sheet(title=title)
+        ws.append(headers)
+        for row in rows:
+            ws.append(row)
+    wb.save(output)
+
+
+def write_catalogue_zip(output):
+    """ZIP архив с CSV файлом на каждую модель"""
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for title, headers, rows in catalogue_sheets():
+            with io.TextIOWrapper(archive.open(f'{title}.csv', 'w'), encoding='utf-8', newline='') as member:
+                writer = csv.writer(member)
+                writer.writerow(headers)
+                writer.writerows(rows)
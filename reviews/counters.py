@@ -0,0 +1,52 @@
+from collections import defaultdict
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Manufacture, Car, Comment
+
+
+def adjust_comments_count(car_deltas):
+    """
+    Меняет счетчики комментариев автомобилей и их производителей.
+    car_deltas - {car_id: на сколько изменилось число комментариев}. Обновление идет через F(),
+    поэтому параллельные запросы не теряют изменения; вызывать внутри транзакции записи комментариев.
+    """
+    car_deltas = {car_id: delta for car_id, delta in car_deltas.items() if delta}
+    if not car_deltas:
+        return
+
+    manufacture_deltas = defaultdict(int)
+    for car_id, manufacture_id in Car.objects.filter(pk__in=car_deltas).values_list('id', 'manufacture_id'):
+        manufacture_deltas[manufacture_id] += car_deltas[car_id]
+
+    for model, deltas in ((Car, car_deltas), (Manufacture, manufacture_deltas)):
+        # Один UPDATE на каждое значение изменения, а не на каждый объект
+        ids_by_delta = defaultdict(list)
+        for pk, delta in deltas.items():
+            if delta:
+                ids_by_delta[delta].append(pk)
+        for delta, ids in ids_by_delta.items():
+            model.objects.filter(pk__in=ids).update(
+                comments_count=Greatest(F('comments_count') + delta, Value(0)),
+            )
+
+
+def recount_comments():
+    """Пересчитывает счетчики по таблице комментариев. Возвращает число исправленных автомобилей и производителей"""
+    actual_cars = Coalesce(Subquery(
+        Comment.objects.filter(car=OuterRef('pk')).order_by().values('car').annotate(total=Count('id')).values('total')
+    ), 0)
+    cars = Car.objects.annotate(actual=actual_cars).exclude(comments_count=F('actual'))
+    fixed_cars = cars.count()
+    if fixed_cars:
+        Car.objects.update(comments_count=actual_cars)
+
+    actual_manufactures = Coalesce(Subquery(
+        Car.objects.filter(manufacture=OuterRef('pk')).order_by().values('manufacture')
+        .annotate(total=Sum('comments_count')).values('total')
+    ), 0)
+    manufactures = Manufacture.objects.annotate(actual=actual_manufactures).exclude(comments_count=F('actual'))
+    fixed_manufactures = manufactures.count()
+    if fixed_manufactures:
+        Manufacture.objects.update(comments_count=actual_manufactures)
+
+    return fixed_cars, fixed_manufactures
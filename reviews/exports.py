@@ -0,0 +1,181 @@
+import csv
+import tempfile
+from collections import namedtuple
+from itertools import chain
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from openpyxl import Workbook
+from .archive import FIELDS as ARCHIVE_FIELDS, archived_rows
+from .models import Country, Manufacture, Car, Comment
+from .snapshot import SnapshotLookup, catalogue_snapshot
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Сколько байт CSV копить перед отправкой очередного куска клиенту
+CSV_STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: не хранит данные, а сразу возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def iterate_rows(data):
+    """
+    Итерация по данным экспорта без полной загрузки таблицы в память.
+    Queryset читаю кусками через iterator(chunk_size=...), prefetch_related при этом
+    выполняется для каждого куска отдельно.
+    """
+    if hasattr(data, 'iterator'):
+        return data.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    return iter(data)
+
+
+# Что выгружать: данные, имя файла, заголовок и функция построения строки
+ExportSpec = namedtuple('ExportSpec', 'data filename headers row_callback')
+
+COUNTRY_HEADERS = ['ID', 'Country Name', 'Manufactures Count', 'Manufactures List']
+MANUFACTURE_HEADERS = ['ID', 'Manufacture Name', 'Country', 'Cars Count', 'Total Comments Count']
+CAR_HEADERS = ['ID', 'Model', 'Manufacture', 'Country', 'Start Year', 'End Year', 'Comments Count']
+COMMENT_HEADERS = ['ID', 'Email', 'Car', 'Manufacture', 'Country', 'Created At', 'Comment Text']
+CREATED_AT_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def short_comment_text(text):
+    """В выгрузку попадают первые 100 символов комментария"""
+    return text[:100] + '...' if len(text) > 100 else text
+
+
+def countries_export():
+    # Названия связанных объектов берутся из снимка справочников, из БД читается только сама таблица
+    countries = Country.objects.values_list('id', 'name')
+    headers = COUNTRY_HEADERS
+    lookup = SnapshotLookup(catalogue_snapshot)
+
+    def country_row_callback(row):
+        pk, name = row
+        manufactures = lookup('manufacture_names', pk, [])
+        return [pk, name, len(manufactures), ', '.join(manufactures)]
+
+    return ExportSpec(countries, 'countries', headers, country_row_callback)
+
+
+def manufactures_export():
+    manufactures = Manufacture.objects.values_list('id', 'name', 'country_id', 'comments_count')
+    headers = MANUFACTURE_HEADERS
+    lookup = SnapshotLookup(catalogue_snapshot)
+
+    def manufacture_row_callback(row):
+        pk, name, country_id, comments_count = row
+        return [pk, name, lookup('country_name', country_id, ''), len(lookup('car_names', pk, [])), comments_count]
+
+    return ExportSpec(manufactures, 'manufactures', headers, manufacture_row_callback)
+
+
+def cars_export():
+    cars = Car.objects.values_list('id', 'name', 'manufacture_id', 'release_year', 'end_year', 'comments_count')
+    headers = CAR_HEADERS
+    lookup = SnapshotLookup(catalogue_snapshot)
+
+    def car_row_callback(row):
+        pk, name, manufacture_id, release_year, end_year, comments_count = row
+        _, manufacture_name, country_name = lookup('car_relation_names', pk, ('', '', ''))
+        return [pk, name, manufacture_name, country_name, release_year, end_year or 'Present', comments_count]
+
+    return ExportSpec(cars, 'cars', headers, car_row_callback)
+
+
+def comments_export(include_archived=False):
+    comments = Comment.objects.values_list(*ARCHIVE_FIELDS)
+    if include_archived:
+        # Архивные комментарии идут после строк из БД
+        archived = (tuple(row[field] for field in ARCHIVE_FIELDS) for row in archived_rows())
+        comments = chain(iterate_rows(comments), archived)
+    headers = COMMENT_HEADERS
+    lookup = SnapshotLookup(catalogue_snapshot)
+
+    def comment_row_callback(row):
+        pk, email, car_id, created_at, comment_text = row
+        car_name, manufacture_name, country_name = lookup('car_relation_names', car_id, ('', '', ''))
+        return [pk, email, car_name, manufacture_name, country_name, created_at.strftime(CREATED_AT_FORMAT),
+                short_comment_text(comment_text)]
+
+    return ExportSpec(comments, 'comments', headers, comment_row_callback)
+
+
+EXPORTS = {
+    'countries': countries_export,
+    'manufactures': manufactures_export,
+    'cars': cars_export,
+    'comments': comments_export,
+}
+
+
+def write_csv(output, data, headers, row_callback):
+    """Запись CSV в открытый текстовый файл"""
+    writer = csv.writer(output)
+    writer.writerow(headers)
+    for item in iterate_rows(data):
+        writer.writerow(row_callback(item))
+
+
+def write_xlsx(output, data, sheet_title, headers, row_callback):
+    """Запись книги Excel в бинарный файл в write-only режиме openpyxl"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+    ws.append(headers)
+
+    for item in iterate_rows(data):
+        ws.append(row_callback(item))
+
+    wb.save(output)
+
+
+class ExportMixin:
+    """Миксин для экспорта данных в CSV и XLSX форматах"""
+
+    def export_to_csv(self, data, filename, headers, row_callback):
+        """Потоковая генерация CSV файла"""
+        writer = csv.writer(Echo())
+
+        def stream():
+            # Заголовок отдаю сразу, чтобы клиент получил первый байт до выборки данных
+            yield writer.writerow(headers)
+
+            buffer = []
+            buffer_size = 0
+            for item in iterate_rows(data):
+                line = writer.writerow(row_callback(item))
+                buffer.append(line)
+                buffer_size += len(line)
+                if buffer_size >= CSV_STREAM_BUFFER_SIZE:
+                    yield ''.join(buffer)
+                    buffer = []
+                    buffer_size = 0
+            if buffer:
+                yield ''.join(buffer)
+
+        return StreamingHttpResponse(
+            stream(),
+            content_type='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
+        )
+
+    def export_to_xlsx(self, data, filename, headers, row_callback):
+        """
+        Генерация Excel файла в write-only режиме openpyxl: ячейки не копятся в памяти,
+        а сразу пишутся в файл. Готовая книга собирается во временном файле
+        (в памяти, пока он меньше EXPORT_SPOOL_MAX_SIZE) и отдается клиенту кусками.
+        """
+        output = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+        write_xlsx(output, data, filename, headers, row_callback)
+        output.seek(0)
+
+        return FileResponse(
+            output,
+            as_attachment=True,
+            filename=f'{filename}.xlsx',
+            content_type=XLSX_CONTENT_TYPE,
+        )
@@ -0,0 +1,60 @@
+from datetime import datetime, time
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+
+# Пределы bigint: число за ними SQLite не может передать в запрос, и вместо 400 получалась ошибка 500
+MIN_INT, MAX_INT = -2 ** 63, 2 ** 63 - 1
+
+
+def parse_int(value):
+    value = int(value)
+    if not MIN_INT <= value <= MAX_INT:
+        raise ValueError(value)
+    return value
+
+
+def parse_moment(value):
+    """Дата '2024-05-01' или дата и время в ISO 8601; без часового пояса считается текущий пояс"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_filters(query_params, filter_params):
+    """{lookup: значение} по filter_params вьюсета; некорректное значение - ошибка 400"""
+    filters = {}
+    for param, (lookup, parse) in filter_params.items():
+        value = query_params.get(param)
+        if value in (None, ''):
+            continue
+        try:
+            filters[lookup] = parse(value)
+        except (TypeError, ValueError):
+            raise ValidationError({param: 'Некорректное значение фильтра'})
+    return filters
+
+
+def filter_by_params(queryset, query_params, filter_params):
+    """Применяет filter_params вьюсета к queryset, используется и в асинхронных представлениях"""
+    return queryset.filter(**parse_filters(query_params, filter_params))
+
+
+class QueryParamFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация списка по параметрам запроса.
+    Вьюсет описывает фильтры в filter_params: {параметр: (lookup, функция разбора значения)}.
+    Под каждый набор фильтров есть составной индекс, поэтому отфильтрованный список - это
+    чтение диапазона индекса, а не полный просмотр таблицы.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return filter_by_params(queryset, request.query_params, getattr(view, 'filter_params', {}))
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .exports import EXPORTS, write_csv, write_xlsx
+from .models import ExportJob
+from .serializers import ExportJobSerializer
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Пул воркеров процесса, создается при первой выгрузке"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.EXPORT_JOBS_WORKERS, thread_name_prefix='export')
+        return _executor
+
+
+def job_path(job):
+    return Path(settings.EXPORT_JOBS_DIR) / job.file_name
+
+
+def enqueue_export(export, file_format):
+    """
+    Ставит выгрузку в очередь. Если такая же выгрузка уже строится, возвращает ее задание.
+    Возвращает пару (задание, создано ли новое).
+    """
+    cleanup_export_jobs()
+
+    # Вторая попытка нужна, если найденное задание успело завершиться между INSERT и SELECT
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                job = ExportJob.objects.create(export=export, format=file_format)
+        except IntegrityError:
+            job = ExportJob.objects.filter(export=export, format=file_format, status__in=ExportJob.IN_FLIGHT).first()
+            if job is not None:
+                return job, False
+        else:
+            transaction.on_commit(lambda: submit(job.pk))
+            return job, True
+    raise RuntimeError(f'Не удалось поставить выгрузку {export}.{file_format} в очередь')
+
+
+def submit(job_id):
+    # EXPORT_JOBS_WORKERS=0 - строю выгрузку сразу, без пула (удобно в тестах и при отладке)
+    if not settings.EXPORT_JOBS_WORKERS:
+        run_export_job(job_id)
+        return
+    get_executor().submit(run_in_worker, job_id)
+
+
+def run_in_worker(job_id):
+    try:
+        run_export_job(job_id)
+    finally:
+        # У потока пула свое соединение с БД, сам Django его не закроет
+        connections.close_all()
+
+
+def run_export_job(job_id):
+    """Строит файл выгрузки. Задание берет только один воркер: тот, кто перевел его из pending в running"""
+    if not ExportJob.objects.filter(pk=job_id, status=ExportJob.PENDING).update(status=ExportJob.RUNNING):
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    job.file_name = f'{job.pk}.{job.format}'
+    path = job_path(job)
+    part_path = path.with_name(path.name + '.part')
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        spec = EXPORTS[job.export]()
+        if job.format == 'csv':
+            with open(part_path, 'w', encoding='utf-8', newline='') as output:
+                write_csv(output, spec.data, spec.headers, spec.row_callback)
+        else:
+            with open(part_path, 'wb') as output:
+                write_xlsx(output, spec.data, spec.filename, spec.headers, spec.row_callback)
+        # Файл появляется под итоговым именем только целиком
+        os.replace(part_path, path)
+    except Exception as exc:
+        logger.exception('Выгрузка %s завершилась ошибкой', job_id)
+        part_path.unlink(missing_ok=True)
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.FAILED, file_name='', error=str(exc), finished_at=timezone.now(),
+        )
+        return
+
+    ExportJob.objects.filter(pk=job_id).update(
+        status=ExportJob.DONE, file_name=job.file_name, file_size=path.stat().st_size, finished_at=timezone.now(),
+    )
+
+
+def cleanup_export_jobs():
+    """
+    Удаляет задания и файлы старше EXPORT_JOBS_RETENTION секунд. Незавершенные задания старше
+    EXPORT_JOBS_TIMEOUT (например, процесс перезапустили посреди выгрузки) помечаются ошибкой,
+    чтобы не блокировать новые такие же выгрузки. Возвращает количество удаленных заданий.
+    """
+    now = timezone.now()
+    ExportJob.objects.filter(
+        status__in=ExportJob.IN_FLIGHT,
+        created_at__lt=now - timedelta(seconds=settings.EXPORT_JOBS_TIMEOUT),
+    ).update(status=ExportJob.FAILED, error='Превышено время выполнения', finished_at=now)
+
+    expired = list(ExportJob.objects.filter(
+        status__in=[ExportJob.DONE, ExportJob.FAILED],
+        finished_at__lt=now - timedelta(seconds=settings.EXPORT_JOBS_RETENTION),
+    ))
+    for job in expired:
+        if job.file_name:
+            job_path(job).unlink(missing_ok=True)
+    ExportJob.objects.filter(pk__in=[job.pk for job in expired]).delete()
+    return len(expired)
+
+
+class ExportJobMixin:
+    """Добавляет ViewSet действие POST .../export/, которое ставит выгрузку export_name в очередь"""
+    export_name = None
+
+    @action(detail=False, methods=['post'], url_path='export')
+    def export(self, request):
+        """Фоновая выгрузка в CSV или Excel, формат передается в поле format (по умолчанию xlsx)"""
+        file_format = request.data.get('format', 'xlsx') if hasattr(request.data, 'get') else None
+        if file_format not in dict(ExportJob.FORMAT_CHOICES):
+            raise ValidationError({'format': 'Ожидается csv или xlsx'})
+
+        job, _ = enqueue_export(self.export_name, file_format)
+        data = ExportJobSerializer(job, context={'request': request}).data
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['url']})
+
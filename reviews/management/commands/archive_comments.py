@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from reviews.archive import archive_old_comments
+
+
+class Command(BaseCommand):
+    help = 'Перенос комментариев старше последних COMMENTS_RETENTION_MONTHS месяцев в сжатые NDJSON файлы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=settings.COMMENTS_RETENTION_MONTHS,
+                            help='Сколько последних месяцев, считая текущий, оставить в БД')
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months должен быть не меньше 1')
+        try:
+            archived = archive_old_comments(options['keep_months'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        for month, count in archived:
+            self.stdout.write(f'{month:%Y-%m}: {count}')
+        self.stdout.write(self.style.SUCCESS(f'Перенесено в архив комментариев: {sum(count for _, count in archived)}'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from reviews.jobs import cleanup_export_jobs
+
+
+class Command(BaseCommand):
+    help = 'Удаление фоновых выгрузок и их файлов старше EXPORT_JOBS_RETENTION секунд'
+
+    def handle(self, *args, **options):
+        deleted = cleanup_export_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Удалено выгрузок: {deleted}'))
@@ -0,0 +1,327 @@
+import csv
+import io
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+from reviews.cache import bump_versions
+from reviews.counters import adjust_comments_count
+from reviews.models import Country, Manufacture, Car, Comment
+from reviews.snapshot import catalogue_snapshot
+
+# По какой колонке выгрузки /export/* определяется модель
+MODEL_BY_HEADER = {
+    'Country Name': 'countries',
+    'Manufacture Name': 'manufactures',
+    'Model': 'cars',
+    'Comment Text': 'comments',
+}
+
+FORMAT_BY_SUFFIX = {
+    '.csv': 'csv',
+    '.xlsx': 'xlsx',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        yield from csv.DictReader(file)
+
+
+def read_xlsx(path):
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        headers = next(rows, None) or []
+        for row in rows:
+            if any(value is not None for value in row):
+                yield dict(zip(headers, row))
+    finally:
+        wb.close()
+
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+READERS = {
+    'csv': read_csv,
+    'xlsx': read_xlsx,
+    'ndjson': read_ndjson,
+}
+
+
+def clean(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def parse_year(value):
+    value = clean(value)
+    if not value or value == 'Present':
+        return None
+    return int(float(value))
+
+
+def parse_created_at(value):
+    """Дата из выгрузки в формате '%Y-%m-%d %H:%M:%S' (UTC) или ISO 8601"""
+    if isinstance(value, datetime):
+        created_at = value
+    else:
+        value = clean(value)
+        if not value:
+            return timezone.now()
+        created_at = datetime.fromisoformat(value)
+    if timezone.is_naive(created_at):
+        created_at = created_at.replace(tzinfo=dt_timezone.utc)
+    return created_at
+
+
+def comment_key(email, car_id, created_at):
+    """Ключ повтора комментария. Выгрузка пишет время с точностью до секунды, поэтому доли секунды отбрасываю"""
+    return email, car_id, created_at.astimezone(dt_timezone.utc).replace(microsecond=0)
+
+
+def existing_comment_keys(batch):
+    """Ключи комментариев пачки, которые уже есть в БД"""
+    start = min(comment.created_at for comment in batch).replace(microsecond=0)
+    end = max(comment.created_at for comment in batch).replace(microsecond=0) + timedelta(seconds=1)
+    existing = Comment.objects.filter(
+        car_id__in={comment.car_id for comment in batch},
+        email__in={comment.email for comment in batch},
+        created_at__gte=start, created_at__lt=end,
+    )
+    return {comment_key(*row) for row in existing.values_list('email', 'car_id', 'created_at')}
+
+
+def is_truncated(text):
+    """Текст обрезан выгрузкой: short_comment_text оставляет первые 100 символов и '...'"""
+    return len(text) == 103 and text.endswith('...')
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка стран, производителей, автомобилей или комментариев из файлов в формате выгрузок '
+        '/export/csv и /export/xlsx, а также из NDJSON с теми же ключами. '
+        'Связи ищутся по названиям в словарях в памяти, строки пишутся пачками bulk_create '
+        '(комментарии на PostgreSQL - через COPY).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу выгрузки')
+        parser.add_argument('--model', choices=sorted(MODEL_BY_HEADER.values()),
+                            help='Что загружать. По умолчанию определяется по заголовкам файла')
+        parser.add_argument('--format', choices=sorted(READERS), dest='file_format',
+                            help='Формат файла. По умолчанию определяется по расширению')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки вставки')
+        parser.add_argument('--no-copy', action='store_true', help='Не использовать COPY на PostgreSQL')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        file_format = options['file_format'] or FORMAT_BY_SUFFIX.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError('Не удалось определить формат файла, укажите --format')
+
+        rows = READERS[file_format](path)
+        first = next(rows, None)
+        if first is None:
+            self.stdout.write('Файл пустой')
+            return
+
+        model = options['model'] or next(
+            (name for header, name in MODEL_BY_HEADER.items() if header in first), None
+        )
+        if model is None:
+            raise CommandError('Не удалось определить модель по заголовкам, укажите --model')
+
+        self.batch_size = options['batch_size']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.started = time.perf_counter()
+        self.processed = 0
+        self.imported = 0
+        self.skipped = 0
+
+        def all_rows():
+            yield first
+            yield from rows
+
+        getattr(self, f'import_{model}')(all_rows())
+
+        # Массовая вставка не отправляет сигналы, поэтому кеш ответов и снимок справочников сбрасываю целиком
+        bump_versions(['country:all', 'manufacture:all', 'car:all', 'comment:all'])
+        catalogue_snapshot.invalidate()
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'{model}: загружено {self.imported}, пропущено {self.skipped} за {elapsed:.1f} с '
+            f'({self.processed / max(elapsed, 1e-6):.0f} строк/с)'
+        ))
+
+    def report(self, model):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(f'{model}: обработано {self.processed} строк, {self.processed / max(elapsed, 1e-6):.0f} строк/с')
+
+    def batches(self, rows, build, model):
+        """Превращает строки файла в объекты и отдает их пачками по batch_size"""
+        batch = []
+        for row in rows:
+            self.processed += 1
+            obj = build(row)
+            if obj is None:
+                self.skipped += 1
+            else:
+                batch.append(obj)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+                self.report(model)
+        if batch:
+            yield batch
+
+    def save(self, model_class, batch, names):
+        """Вставляет пачку и дописывает id новых объектов в словарь названий"""
+        with transaction.atomic():
+            created = model_class.objects.bulk_create(batch)
+        for obj in created:
+            names[obj.name.lower()] = obj.pk
+        self.imported += len(created)
+
+    def import_countries(self, rows):
+        countries = {name.lower(): pk for name, pk in Country.objects.values_list('name', 'id')}
+
+        def build(row):
+            name = clean(row.get('Country Name'))
+            if not name or name.lower() in countries:
+                return None
+            countries[name.lower()] = None
+            return Country(name=name)
+
+        for batch in self.batches(rows, build, 'countries'):
+            self.save(Country, batch, countries)
+
+    def import_manufactures(self, rows):
+        countries = {name.lower(): pk for name, pk in Country.objects.values_list('name', 'id')}
+        manufactures = {name.lower(): pk for name, pk in Manufacture.objects.values_list('name', 'id')}
+
+        def build(row):
+            name = clean(row.get('Manufacture Name'))
+            country_id = countries.get(clean(row.get('Country')).lower())
+            if not name or country_id is None or name.lower() in manufactures:
+                return None
+            manufactures[name.lower()] = None
+            return Manufacture(name=name, country_id=country_id)
+
+        for batch in self.batches(rows, build, 'manufactures'):
+            self.save(Manufacture, batch, manufactures)
+
+    def import_cars(self, rows):
+        manufactures = {name.lower(): pk for name, pk in Manufacture.objects.values_list('name', 'id')}
+        cars = {name.lower(): pk for name, pk in Car.objects.values_list('name', 'id')}
+
+        def build(row):
+            name = clean(row.get('Model'))
+            manufacture_id = manufactures.get(clean(row.get('Manufacture')).lower())
+            if not name or manufacture_id is None or name.lower() in cars:
+                return None
+            try:
+                release_year = parse_year(row.get('Start Year'))
+                end_year = parse_year(row.get('End Year'))
+            except ValueError:
+                return None
+            if release_year is None:
+                return None
+            cars[name.lower()] = None
+            return Car(name=name, manufacture_id=manufacture_id, release_year=release_year, end_year=end_year)
+
+        for batch in self.batches(rows, build, 'cars'):
+            self.save(Car, batch, cars)
+
+    def import_comments(self, rows):
+        """
+        Комментарий, который уже есть в БД (тот же email, автомобиль и время создания), пропускается,
+        поэтому повторная загрузка того же файла ничего не дублирует.
+        """
+        cars = {name.lower(): pk for name, pk in Car.objects.values_list('name', 'id')}
+        duplicates = truncated = 0
+
+        def build(row):
+            car_id = cars.get(clean(row.get('Car')).lower())
+            email = clean(row.get('Email'))
+            text = clean(row.get('Comment Text'))
+            if car_id is None or not email or not text:
+                return None
+            try:
+                created_at = parse_created_at(row.get('Created At'))
+            except ValueError:
+                return None
+            if is_truncated(text):
+                nonlocal truncated
+                truncated += 1
+            return Comment(email=email, car_id=car_id, created_at=created_at, comment_text=text)
+
+        for batch in self.batches(rows, build, 'comments'):
+            # Предыдущие пачки уже в БД, так что повторы внутри файла тоже находятся здесь
+            seen = existing_comment_keys(batch)
+            unique = []
+            for comment in batch:
+                key = comment_key(comment.email, comment.car_id, comment.created_at)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(comment)
+            duplicates += len(batch) - len(unique)
+            self.skipped += len(batch) - len(unique)
+            batch = unique
+            if not batch:
+                continue
+            with transaction.atomic():
+                if self.use_copy:
+                    self.copy_comments(batch)
+                else:
+                    Comment.objects.bulk_create(batch)
+                adjust_comments_count(Counter(comment.car_id for comment in batch))
+            self.imported += len(batch)
+
+        if duplicates:
+            self.stdout.write(f'comments: пропущено {duplicates} уже загруженных комментариев')
+        if truncated:
+            self.stdout.write(self.style.WARNING(
+                f'comments: у {truncated} комментариев текст обрезан выгрузкой до 100 символов и загружен как есть. '
+                'Для точного переноса загружайте NDJSON с полным текстом'
+            ))
+
+    def copy_comments(self, batch):
+        """Вставка пачки комментариев через COPY ... FROM STDIN (psycopg2 и psycopg 3)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for comment in batch:
+            writer.writerow([comment.email, comment.car_id, comment.created_at.isoformat(), comment.comment_text])
+
+        columns = ', '.join(
+            connection.ops.quote_name(Comment._meta.get_field(name).column)
+            for name in ('email', 'car', 'created_at', 'comment_text')
+        )
+        sql = f'COPY {connection.ops.quote_name(Comment._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv)'
+
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, 'copy_expert'):
+                buffer.seek(0)
+                raw_cursor.copy_expert(sql, buffer)
+            else:
+                with raw_cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from reviews.partitions import ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = 'Создание месячных секций таблицы комментариев на PostgreSQL (запускать по cron, например раз в день)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=settings.COMMENT_PARTITIONS_AHEAD,
+                            help='На сколько месяцев вперед держать секции')
+
+    def handle(self, *args, **options):
+        if options['ahead'] < 0:
+            raise CommandError('--ahead не может быть отрицательным')
+        if not is_partitioned():
+            self.stdout.write('Таблица комментариев не секционирована (только PostgreSQL), делать нечего')
+            return
+        created = ensure_partitions(options['ahead'])
+        for name in created:
+            self.stdout.write(f'Создана секция {name}')
+        self.stdout.write(self.style.SUCCESS(f'Создано секций: {len(created)}'))
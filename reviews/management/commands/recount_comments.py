@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from reviews.cache import bump_versions
+from reviews.counters import recount_comments
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков comments_count у автомобилей и производителей по таблице комментариев'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            fixed_cars, fixed_manufactures = recount_comments()
+        if fixed_cars or fixed_manufactures:
+            bump_versions(['manufacture:all', 'car:all'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено автомобилей: {fixed_cars}, производителей: {fixed_manufactures}'
+        ))
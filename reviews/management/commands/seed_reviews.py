@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from reviews.models import Country
+from reviews.seeding import clear_catalogue, seed_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Наполнение базы правдоподобными тестовыми данными через bulk_create (для бенчмарков)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--countries', type=int, default=20)
+        parser.add_argument('--manufactures', type=int, default=200)
+        parser.add_argument('--cars', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Размер пачки bulk_create')
+        parser.add_argument('--seed', type=int, default=42, help='Одинаковый seed дает одинаковые данные')
+        parser.add_argument('--clear', action='store_true', help='Удалить существующий каталог перед генерацией')
+
+    def handle(self, *args, **options):
+        if options['countries'] < 1 or options['manufactures'] < 1 or options['cars'] < 1:
+            raise CommandError('Нужна хотя бы одна страна, один производитель и один автомобиль')
+        if options['clear']:
+            clear_catalogue()
+        elif Country.objects.exists():
+            raise CommandError('В базе уже есть данные. Запустите с --clear, чтобы заменить их')
+
+        started = time.perf_counter()
+        seed_catalogue(
+            options['countries'], options['manufactures'], options['cars'], options['comments'],
+            batch_size=options['batch_size'], seed=options['seed'],
+            log=lambda message: self.stdout.write(message) if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
@@ -0,0 +1,264 @@
+"""
+Метрики запросов: количество SQL запросов, время в БД и вне ее (сериализация, рендеринг),
+размер ответа. Метрики копятся гистограммами по эндпоинтам (имя маршрута и HTTP метод)
+в памяти процесса и отдаются в формате Prometheus на /metrics.
+
+Middleware работает и в синхронном, и в асинхронном стеке, чтобы под ASGI Django не переключал
+ради нее потоки. Запросы к БД считает обертка collect_queries, которая ставится на каждое соединение
+и пишет в сборщик текущего HTTP запроса из ContextVar: в асинхронном пути SQL выполняется в потоках
+sync_to_async со своими соединениями, а контекст переходит туда вместе с вызовом. У потоковых ответов
+(экспорт) выборка идет во время отдачи, поэтому такие ответы измеряются до конца потока.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from .cache import get_cache_stats
+
+logger = logging.getLogger(__name__)
+
+METRICS_PATH = '/metrics'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024)
+
+
+class Histogram:
+    """Гистограмма Prometheus с метками view и method"""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # (view, method) -> [счетчики по корзинам, сумма, количество]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * len(self.buckets), 0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for (view, method), (counts, total, count) in sorted(self.series.items()):
+            labels = f'view="{view}",method="{method}"'
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.histograms = {
+            'duration': Histogram('reviews_request_duration_seconds', 'Полное время обработки запроса', DURATION_BUCKETS),
+            'db': Histogram('reviews_request_db_seconds', 'Время выполнения SQL запросов', DURATION_BUCKETS),
+            'app': Histogram('reviews_request_app_seconds', 'Время вне БД: код вью, сериализация, рендеринг',
+                             DURATION_BUCKETS),
+            'queries': Histogram('reviews_request_queries', 'Количество SQL запросов на HTTP запрос', QUERY_BUCKETS),
+            'size': Histogram('reviews_response_size_bytes', 'Размер тела ответа', SIZE_BUCKETS),
+        }
+
+    def record(self, view, method, status, sample):
+        with self.lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in sample.items():
+                self.histograms[name].observe((view, method), value)
+
+    def render(self):
+        with self.lock:
+            lines = ['# HELP reviews_requests_total Количество запросов', '# TYPE reviews_requests_total counter']
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'reviews_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for histogram in self.histograms.values():
+                lines += histogram.render()
+
+        stats = get_cache_stats()
+        lines += ['# HELP reviews_cache_requests_total Попадания и промахи кеша ответов',
+                  '# TYPE reviews_cache_requests_total counter']
+        lines += [f'reviews_cache_requests_total{{result="{event}"}} {count}' for event, count in stats.items()]
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.requests.clear()
+            for histogram in self.histograms.values():
+                histogram.series.clear()
+
+
+registry = Registry()
+
+
+class QueryCollector:
+    """Метрики одного HTTP запроса: число SQL запросов и время в БД"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+current_collector = ContextVar('reviews_metrics_collector', default=None)
+
+
+def collect_queries(execute, sql, params, many, context):
+    collector = current_collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def watch_queries(db_connection):
+    # В начало списка: connection.execute_wrapper снимает обертки с конца, и чужой with
+    # не должен снять эту вместо своей
+    if collect_queries not in db_connection.execute_wrappers:
+        db_connection.execute_wrappers.insert(0, collect_queries)
+
+
+@receiver(connection_created)
+def watch_new_connection(sender, connection, **kwargs):
+    watch_queries(connection)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+class MetricsMiddleware:
+    """
+    Снимает метрики каждого запроса. По настройкам добавляет заголовок Server-Timing
+    (SERVER_TIMING_ENABLED) и пишет в лог запросы дольше SLOW_REQUEST_MS миллисекунд.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def measured(request):
+        return settings.METRICS_ENABLED and request.path != METRICS_PATH
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.measured(request):
+            return self.get_response(request)
+
+        # Соединение потока могло открыться до загрузки middleware
+        watch_queries(connection)
+        collector = QueryCollector()
+        token = current_collector.set(collector)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.record(request, response, collector)
+
+    async def __acall__(self, request):
+        if not self.measured(request):
+            return await self.get_response(request)
+
+        collector = QueryCollector()
+        token = current_collector.set(collector)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_collector.reset(token)
+        return self.record(request, response, collector)
+
+    def record(self, request, response, collector):
+        def finish(size):
+            duration = time.perf_counter() - collector.started
+            view = view_label(request)
+            registry.record(view, request.method, response.status_code, {
+                'duration': duration,
+                'db': collector.duration,
+                'app': max(duration - collector.duration, 0.0),
+                'queries': collector.count,
+                'size': size,
+            })
+            if settings.SLOW_REQUEST_MS and duration * 1000 >= settings.SLOW_REQUEST_MS:
+                logger.warning(
+                    'Медленный запрос %s %s (%s): %.1f ms, SQL запросов %d, в БД %.1f ms, ответ %d байт',
+                    request.method, request.get_full_path(), view, duration * 1000,
+                    collector.count, collector.duration * 1000, size,
+                )
+            return duration
+
+        # Заголовки потокового ответа уходят до выборки данных, поэтому Server-Timing у него нет
+        if response.streaming:
+            measure = self.measure_async_stream if response.is_async else self.measure_stream
+            response.streaming_content = measure(response.streaming_content, collector, finish)
+            return response
+
+        duration = finish(0 if response.streaming else len(response.content))
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = (
+                f'db;dur={collector.duration * 1000:.1f};desc="{collector.count} queries", '
+                f'app;dur={max(duration - collector.duration, 0) * 1000:.1f}, total;dur={duration * 1000:.1f}'
+            )
+        return response
+
+    @staticmethod
+    def measure_stream(content, collector, finish):
+        """Считает запросы и размер, пока поток отдается клиенту; метрики записываются в конце"""
+        size = 0
+        # Без reset(token): поток может закрыть уже другой контекст, когда клиент отключился
+        current_collector.set(collector)
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            current_collector.set(None)
+            finish(size)
+
+    @staticmethod
+    async def measure_async_stream(content, collector, finish):
+        """То же для асинхронного потока (экспорты /api/async/)"""
+        size = 0
+        current_collector.set(collector)
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            current_collector.set(None)
+            finish(size)
+
+
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus"""
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
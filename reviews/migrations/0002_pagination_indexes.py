@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['name', 'id'], name='reviews_car_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', '-id'], name='reviews_comment_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=models.Index(fields=['name', 'id'], name='reviews_country_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manufacture',
+            index=models.Index(fields=['name', 'id'], name='reviews_manuf_name_id_idx'),
+        ),
+    ]
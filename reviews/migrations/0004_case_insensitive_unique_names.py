@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0003_comment_created_at_default'),
+    ]
+
+    operations = [
+        # Сначала создаю регистронезависимые индексы, потом убираю прежние unique
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='reviews_car_name_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='country',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='reviews_country_name_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='manufacture',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='reviews_manuf_name_ci_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='car',
+            name='name',
+            field=models.CharField(help_text='Введите название модели автомобиля', max_length=100, verbose_name='Автомобиль'),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='name',
+            field=models.CharField(help_text='Введите название страны', max_length=30, verbose_name='Название страны'),
+        ),
+        migrations.AlterField(
+            model_name='manufacture',
+            name='name',
+            field=models.CharField(help_text='Введите название производителя', max_length=150, verbose_name='Название производителя'),
+        ),
+    ]
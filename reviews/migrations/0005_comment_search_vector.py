@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def add_search_vector(apps, schema_editor):
+    """На PostgreSQL добавляю вычисляемую колонку tsvector и GIN индекс по ней"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "ALTER TABLE reviews_comment ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('russian', coalesce(comment_text, ''))) STORED"
+    )
+    schema_editor.execute(
+        'CREATE INDEX reviews_comment_search_gin ON reviews_comment USING GIN (search_vector)'
+    )
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS reviews_comment_search_gin')
+    schema_editor.execute('ALTER TABLE reviews_comment DROP COLUMN IF EXISTS search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0004_case_insensitive_unique_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
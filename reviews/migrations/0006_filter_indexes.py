@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0005_comment_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['manufacture', 'release_year'], name='reviews_car_manuf_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['release_year'], name='reviews_car_release_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['end_year'], name='reviews_car_end_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['car', '-created_at', '-id'], name='reviews_comm_car_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['email', '-created_at', '-id'], name='reviews_comm_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='manufacture',
+            index=models.Index(fields=['country', 'name', 'id'], name='reviews_manuf_country_name_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:47
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_comments_count(apps, schema_editor):
+    """Заполняю счетчики по уже существующим комментариям"""
+    Manufacture = apps.get_model('reviews', 'Manufacture')
+    Car = apps.get_model('reviews', 'Car')
+    Comment = apps.get_model('reviews', 'Comment')
+
+    Car.objects.update(comments_count=Coalesce(Subquery(
+        Comment.objects.filter(car=OuterRef('pk')).order_by().values('car').annotate(total=Count('id')).values('total')
+    ), 0))
+    Manufacture.objects.update(comments_count=Coalesce(Subquery(
+        Car.objects.filter(manufacture=OuterRef('pk')).order_by().values('manufacture')
+        .annotate(total=Sum('comments_count')).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0006_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='manufacture',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['-comments_count', 'id'], name='reviews_car_comments_count_idx'),
+        ),
+        migrations.RunPython(fill_comments_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:50
+
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0007_comments_count_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('export', models.CharField(max_length=30, verbose_name='Выгрузка')),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel')], max_length=10, verbose_name='Формат')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Готово'), ('failed', 'Ошибка')], default='pending', max_length=10, verbose_name='Статус')),
+                ('file_name', models.CharField(blank=True, max_length=100, verbose_name='Файл')),
+                ('file_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Размер файла')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Дата создания')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата завершения')),
+            ],
+            options={
+                'verbose_name': 'Фоновая выгрузка',
+                'verbose_name_plural': 'Фоновые выгрузки',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='reviews_exportjob_created_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('export', 'format'), name='reviews_exportjob_inflight_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,119 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:12
+
+import django.utils.timezone
+from datetime import date
+from django.conf import settings
+from django.db import migrations, models
+
+COLUMNS = 'id, email, created_at, comment_text, car_id'
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def table_definitions(cursor):
+    """Индексы (кроме первичного ключа) и внешние ключи таблицы комментариев, чтобы пересоздать их на новой таблице"""
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = 'reviews_comment'::regclass AND NOT indisprimary"
+    )
+    # У секционированной таблицы индексы описаны как ON ONLY, без индексов секций
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = 'reviews_comment'::regclass AND contype = 'f'"
+    )
+    return indexes, cursor.fetchall()
+
+
+def create_month_partitions(cursor):
+    """Секции с месяца самого старого комментария по COMMENT_PARTITIONS_AHEAD месяцев вперед и секция по умолчанию"""
+    cursor.execute("SELECT date_trunc('month', MIN(created_at) AT TIME ZONE 'UTC')::date, "
+                   "date_trunc('month', now() AT TIME ZONE 'UTC')::date FROM reviews_comment_old")
+    first, current = cursor.fetchone()
+    month = first or current
+    last = current
+    for _ in range(settings.COMMENT_PARTITIONS_AHEAD):
+        last = next_month(last)
+    while month <= last:
+        cursor.execute(
+            f"CREATE TABLE reviews_comment_p{month:%Y_%m} PARTITION OF reviews_comment "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d} 00:00:00+00') TO ('{next_month(month):%Y-%m-%d} 00:00:00+00')"
+        )
+        month = next_month(month)
+    cursor.execute('CREATE TABLE reviews_comment_default PARTITION OF reviews_comment DEFAULT')
+
+
+def rebuild_comment_table(schema_editor, partitioned):
+    """
+    Переливает комментарии в новую таблицу: секционированную по месяцам created_at или обычную.
+    Таблица копируется целиком, на время миграции запись комментариев должна быть остановлена.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = table_definitions(cursor)
+        cursor.execute('ALTER TABLE reviews_comment RENAME TO reviews_comment_old')
+        if partitioned:
+            cursor.execute('CREATE TABLE reviews_comment (LIKE reviews_comment_old INCLUDING DEFAULTS INCLUDING GENERATED) '
+                           'PARTITION BY RANGE (created_at)')
+            create_month_partitions(cursor)
+        else:
+            cursor.execute('CREATE TABLE reviews_comment (LIKE reviews_comment_old INCLUDING DEFAULTS INCLUDING GENERATED)')
+            # Значение по умолчанию ссылается на последовательность старой таблицы, она удалится вместе с ней
+            cursor.execute('ALTER TABLE reviews_comment ALTER COLUMN id DROP DEFAULT')
+        cursor.execute(f'INSERT INTO reviews_comment ({COLUMNS}) SELECT {COLUMNS} FROM reviews_comment_old')
+        cursor.execute('DROP TABLE reviews_comment_old')
+
+        if partitioned:
+            # Первичный ключ секционированной таблицы обязан включать ключ секционирования.
+            # Identity колонки у секционированных таблиц есть только с PostgreSQL 17, поэтому id - обычная последовательность
+            cursor.execute('ALTER TABLE reviews_comment ADD CONSTRAINT reviews_comment_pkey PRIMARY KEY (id, created_at)')
+            cursor.execute('CREATE SEQUENCE reviews_comment_id_seq OWNED BY reviews_comment.id')
+            cursor.execute("ALTER TABLE reviews_comment ALTER COLUMN id SET DEFAULT nextval('reviews_comment_id_seq')")
+        else:
+            cursor.execute('ALTER TABLE reviews_comment ADD CONSTRAINT reviews_comment_pkey PRIMARY KEY (id)')
+            cursor.execute('ALTER TABLE reviews_comment ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY')
+        cursor.execute("SELECT setval(pg_get_serial_sequence('reviews_comment', 'id'), COALESCE(MAX(id), 0) + 1, false) "
+                       "FROM reviews_comment")
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE reviews_comment ADD CONSTRAINT {name} {definition}')
+        for definition in indexes:
+            cursor.execute(definition)
+
+
+def partition_comments(apps, schema_editor):
+    rebuild_comment_table(schema_editor, partitioned=True)
+
+
+def unpartition_comments(apps, schema_editor):
+    rebuild_comment_table(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0008_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommentArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц')),
+                ('file_name', models.CharField(max_length=100, verbose_name='Файл')),
+                ('rows', models.PositiveIntegerField(verbose_name='Комментариев')),
+                ('min_id', models.BigIntegerField(verbose_name='Минимальный id')),
+                ('max_id', models.BigIntegerField(verbose_name='Максимальный id')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата архивации')),
+            ],
+            options={
+                'verbose_name': 'Архив комментариев',
+                'verbose_name_plural': 'Архивы комментариев',
+                'ordering': ['-month'],
+            },
+        ),
+        migrations.RunPython(partition_comments, unpartition_comments),
+    ]
@@ -1,44 +1,91 @@
+import uuid
 from django.db import models
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 class  Country(models.Model):
     """Модель стран производителей"""
 
-    name = models.CharField(max_length=30, verbose_name='Название страны', help_text='Введите название страны', unique=True)
+    name = models.CharField(max_length=30, verbose_name='Название страны', help_text='Введите название страны')
 
     class Meta:
         verbose_name = 'Страна'
         verbose_name_plural = 'Страны'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='reviews_country_name_id_idx'),
+        ]
+        constraints = [
+            # Уникальность без учета регистра проверяет сама БД по функциональному индексу
+            models.UniqueConstraint(Lower('name'), name='reviews_country_name_ci_uniq'),
+        ]
 
     def __str__(self):
         return self.name
 
-class Manufacture(models.Model):
+class CommentsCountMixin:
+    """
+    Обычное сохранение объекта не перезаписывает comments_count значением, прочитанным ранее:
+    счетчик меняется только через F() в reviews/counters.py.
+    """
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(*args, **kwargs)
+
+class Manufacture(CommentsCountMixin, models.Model):
     """Модель производителей"""
 
-    name = models.CharField(max_length=150, verbose_name='Название производителя', help_text='Введите название производителя', unique=True)
+    name = models.CharField(max_length=150, verbose_name='Название производителя', help_text='Введите название производителя')
     country = models.ForeignKey(Country, on_delete=models.CASCADE, related_name='manufactures', help_text='Выберите страну производителя')
+    # Денормализованный счетчик, обновляется при добавлении и удалении комментариев (reviews/counters.py)
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев')
 
     class Meta:
         verbose_name = 'Производитель'
         verbose_name_plural = 'Производители'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='reviews_manuf_name_id_idx'),
+            # Фильтр ?country= в порядке курсорной пагинации
+            models.Index(fields=['country', 'name', 'id'], name='reviews_manuf_country_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='reviews_manuf_name_ci_uniq'),
+        ]
 
     def __str__(self):
         return f'Производитель {self.name} из страны {self.country}'
     
-class Car(models.Model):
+class Car(CommentsCountMixin, models.Model):
     """Модель автомобилей"""
 
-    name = models.CharField(max_length=100, verbose_name='Автомобиль', help_text='Введите название модели автомобиля', unique=True)
+    name = models.CharField(max_length=100, verbose_name='Автомобиль', help_text='Введите название модели автомобиля')
     manufacture = models.ForeignKey(Manufacture, on_delete=models.CASCADE, related_name='cars', help_text='Выберите производителя')
     release_year = models.PositiveIntegerField(verbose_name='Год начала выпуска')
     end_year = models.PositiveIntegerField(verbose_name='Год окончания выпуска', null=True, blank=True, help_text='Оставьте поле пустым, если автомобиль еще выпускается')
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев')
 
     class Meta:
         verbose_name = 'Автомобиль'
         verbose_name_plural = 'Автомобили'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='reviews_car_name_id_idx'),
+            # Фильтры ?manufacture=, ?country= и диапазоны годов выпуска
+            models.Index(fields=['manufacture', 'release_year'], name='reviews_car_manuf_year_idx'),
+            models.Index(fields=['release_year'], name='reviews_car_release_year_idx'),
+            models.Index(fields=['end_year'], name='reviews_car_end_year_idx'),
+            # Сортировка ?ordering=-comments_count (популярные автомобили)
+            models.Index(fields=['-comments_count', 'id'], name='reviews_car_comments_count_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='reviews_car_name_ci_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.manufacture}), {self.release_year} - {self.end_year or 'н.в'}"
@@ -48,13 +95,86 @@ class Comment(models.Model):
 
     email = models.EmailField(verbose_name='Email автора')
     car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='comments', verbose_name='Автомобиль')
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    # default вместо auto_now_add, чтобы импорт мог сохранить исходную дату комментария
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Дата создания')
     comment_text = models.TextField(max_length=1000, verbose_name='Текст комментария', help_text='Максимальная длина коммента - 1000 символов')
 
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='reviews_comment_created_id_idx'),
+            # Фильтры ?car= и ?email= в порядке курсорной пагинации
+            models.Index(fields=['car', '-created_at', '-id'], name='reviews_comm_car_created_idx'),
+            models.Index(fields=['email', '-created_at', '-id'], name='reviews_comm_email_created_idx'),
+        ]
 
     def __str__(self):
         return f'Комментарий "{self.comment_text}" от {self.email} к {self.car}'
+
+class ExportJob(models.Model):
+    """Фоновая выгрузка: строится пулом воркеров (reviews/jobs.py), готовый файл лежит в EXPORT_JOBS_DIR"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    ]
+    IN_FLIGHT = (PENDING, RUNNING)
+
+    FORMAT_CHOICES = [('csv', 'CSV'), ('xlsx', 'Excel')]
+
+    # uuid, чтобы ссылку на чужую выгрузку нельзя было подобрать перебором
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    export = models.CharField(max_length=30, verbose_name='Выгрузка')
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name='Формат')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name='Статус')
+    file_name = models.CharField(max_length=100, blank=True, verbose_name='Файл')
+    file_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name='Размер файла')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_at = models.DateTimeField(default=timezone.now, editable=False, verbose_name='Дата создания')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата завершения')
+
+    class Meta:
+        verbose_name = 'Фоновая выгрузка'
+        verbose_name_plural = 'Фоновые выгрузки'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='reviews_exportjob_created_idx'),
+        ]
+        constraints = [
+            # Одинаковые выгрузки не строятся параллельно: БД не даст завести второе незавершенное задание
+            models.UniqueConstraint(
+                fields=['export', 'format'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='reviews_exportjob_inflight_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.export}.{self.format} ({self.status})'
+
+class CommentArchive(models.Model):
+    """Месяц комментариев, перенесенный из БД в сжатый NDJSON файл в COMMENTS_ARCHIVE_DIR (reviews/archive.py)"""
+
+    month = models.DateField(unique=True, verbose_name='Месяц')
+    file_name = models.CharField(max_length=100, verbose_name='Файл')
+    rows = models.PositiveIntegerField(verbose_name='Комментариев')
+    # Границы id нужны, чтобы искать комментарий по id, не распаковывая все архивы
+    min_id = models.BigIntegerField(verbose_name='Минимальный id')
+    max_id = models.BigIntegerField(verbose_name='Максимальный id')
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name='Дата архивации')
+
+    class Meta:
+        verbose_name = 'Архив комментариев'
+        verbose_name_plural = 'Архивы комментариев'
+        ordering = ['-month']
+
+    def __str__(self):
+        return f'{self.month:%Y-%m} ({self.rows})'
@@ -0,0 +1,126 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_position(values, reverse=False):
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+    # Курсор ссылки previous указывает на страницу перед позицией
+    data = {'before': values} if reverse else values
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def parse_position(cursor, model, ordering):
+    """(значения полей сортировки, курсор назад или нет) или None, если курсор испорчен"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        reverse = isinstance(data, dict)
+        values = data.get('before') if reverse else data
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        values = [model._meta.get_field(field.lstrip('-')).to_python(value) for field, value in zip(ordering, values)]
+        return values, reverse
+    except (TypeError, ValueError, UnicodeError, DjangoValidationError):
+        return None
+
+
+def decode_position(cursor, model, ordering):
+    """Значения полей сортировки из курсора ссылки next или None, если курсор испорчен"""
+    position = parse_position(cursor, model, ordering)
+    if position is None or position[1]:
+        return None
+    return position[0]
+
+
+def reverse_ordering(ordering):
+    return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+
+def keyset_filter(ordering, values):
+    """Условие "после позиции values" для сортировки ordering, например name > x OR (name = x AND id > y)"""
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        step = Q(**{f'{name}__lt' if field.startswith('-') else f'{name}__gt': values[index]})
+        for previous, value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+class NameCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация по названию.
+    Следующая страница выбирается условием (name, id) > последней позиции по индексу (name, id),
+    поэтому глубокие страницы стоят столько же, сколько первая. В курсоре лежат значения всех полей
+    сортировки: CursorPagination из DRF хранит только первое поле и смещение, и на одинаковых значениях
+    (например, ?ordering=-comments_count) строки повторялись или пропадали между страницами.
+    """
+    ordering = ('name', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # Сортировка из ?ordering= дополняется id, чтобы позиция строки была однозначной
+        if not any(field.lstrip('-') == 'id' for field in ordering):
+            ordering += ('id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        position, reverse = None, False
+        if request.query_params.get(self.cursor_query_param):
+            parsed = parse_position(request.query_params[self.cursor_query_param], queryset.model, self.ordering)
+            if parsed is None:
+                raise NotFound(self.invalid_cursor_message)
+            position, reverse = parsed
+
+        # Страница перед позицией выбирается в обратном порядке и потом переворачивается
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(keyset_filter(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, len(results) > self.page_size
+        else:
+            self.has_next, self.has_previous = len(results) > self.page_size, position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def get_position(self, row):
+        return [row[field.lstrip('-')] if isinstance(row, dict) else getattr(row, field.lstrip('-'))
+                for field in self.ordering]
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        cursor = encode_position(self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        cursor = encode_position(self.get_position(self.page[0]), reverse=True)
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+
+class CommentCursorPagination(NameCursorPagination):
+    """Курсорная пагинация комментариев: сначала новые, по индексу (-created_at, -id)"""
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,35 @@
+import codecs
+import json
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+def too_many_items_message():
+    return f'За один запрос можно загрузить не больше {settings.COMMENTS_BULK_MAX_ITEMS} комментариев'
+
+
+class NDJSONParser(BaseParser):
+    """
+    Парсер NDJSON: один JSON объект на строку, тело читается построчно.
+    Больше COMMENTS_BULK_MAX_ITEMS объектов не разбирается: на первом лишнем чтение останавливается.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        reader = codecs.getreader(encoding)(stream)
+
+        items = []
+        for number, line in enumerate(reader, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) >= settings.COMMENTS_BULK_MAX_ITEMS:
+                raise ParseError(too_many_items_message())
+            try:
+                items.append(json.loads(line))
+            except ValueError as exc:
+                raise ParseError(f'Ошибка разбора NDJSON в строке {number}: {exc}')
+        return items
@@ -0,0 +1,116 @@
+"""
+Секции таблицы комментариев на PostgreSQL (миграция 0009): по секции на календарный месяц created_at
+в UTC и секция по умолчанию для строк, которым своей секции не нашлось. Запросы с условием на
+created_at (первые страницы списка, фильтры created_after/created_before) читают только нужные месяцы,
+а старый месяц уходит в архив целиком через DROP секции (reviews/archive.py).
+
+Секции на следующие месяцы создает команда partition_comments, ее нужно запускать по cron. Она же разносит
+по своим секциям строки, попавшие в секцию по умолчанию (например, импорт комментариев за прошлые годы).
+"""
+from datetime import date, datetime, timezone as dt_timezone
+from django.db import connections, transaction
+from .models import Comment
+
+DEFAULT_PARTITION = 'reviews_comment_default'
+COLUMNS = 'id, email, created_at, comment_text, car_id'
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def current_month():
+    now = datetime.now(dt_timezone.utc)
+    return date(now.year, now.month, 1)
+
+
+def month_bounds(month):
+    """Начало месяца и начало следующего в UTC"""
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end = add_months(month, 1)
+    return start, datetime(end.year, end.month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'reviews_comment_p{month:%Y_%m}'
+
+
+def get_connection():
+    return connections[Comment.objects.db]
+
+
+def is_partitioned(connection=None):
+    connection = connection or get_connection()
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = 'reviews_comment'::regclass")
+        return cursor.fetchone()[0] == 'p'
+
+
+def list_partitions(connection=None):
+    """Имена секций таблицы комментариев"""
+    with (connection or get_connection()).cursor() as cursor:
+        cursor.execute("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'reviews_comment'::regclass")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def create_partition(month, connection=None):
+    """
+    Создает секцию месяца. Строки этого месяца, уже попавшие в секцию по умолчанию,
+    переносятся в новую секцию: иначе PostgreSQL не даст ее создать.
+    """
+    connection = connection or get_connection()
+    name = partition_name(month)
+    start, end = month_bounds(month)
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE moved_comments AS '
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s '
+            f'RETURNING {COLUMNS}) SELECT * FROM moved',
+            [start, end],
+        )
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF reviews_comment "
+                       f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')")
+        cursor.execute(f'INSERT INTO reviews_comment ({COLUMNS}) SELECT {COLUMNS} FROM moved_comments')
+        cursor.execute('DROP TABLE moved_comments')
+    return name
+
+
+def default_months(connection=None):
+    """Месяцы, строки которых лежат в секции по умолчанию (например, после импорта старых комментариев)"""
+    with (connection or get_connection()).cursor() as cursor:
+        cursor.execute(f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date FROM {DEFAULT_PARTITION}")
+        return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_partitions(ahead, connection=None):
+    """
+    Секции с текущего месяца на ahead месяцев вперед и для месяцев, оказавшихся в секции по умолчанию.
+    Возвращает имена созданных секций.
+    """
+    connection = connection or get_connection()
+    existing = list_partitions(connection)
+    month = current_month()
+    months = {add_months(month, offset) for offset in range(ahead + 1)} | default_months(connection)
+    return [create_partition(target, connection) for target in sorted(months)
+            if partition_name(target) not in existing]
+
+
+def drop_partition(month, connection=None):
+    """
+    Отсоединяет и удаляет секцию месяца. Возвращает число строк, которые в ней были,
+    или None, если такой секции нет. Вызывать внутри транзакции.
+    """
+    connection = connection or get_connection()
+    name = partition_name(month)
+    if name not in list_partitions(connection):
+        return None
+    with connection.cursor() as cursor:
+        # После DETACH в секцию уже никто не пишет, поэтому подсчет точный
+        cursor.execute(f'ALTER TABLE reviews_comment DETACH PARTITION {name}')
+        cursor.execute(f'SELECT COUNT(*) FROM {name}')
+        rows = cursor.fetchone()[0]
+        cursor.execute(f'DROP TABLE {name}')
+    return rows
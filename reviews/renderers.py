@@ -0,0 +1,32 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, без него работает обычный JSONRenderer
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson. Вывод побайтно совпадает с JSONRenderer при настройках по умолчанию
+    (компактный JSON, UTF-8 без экранирования): даты и прочие типы, которые orjson пишет по-своему,
+    отдаются кодировщику DRF. Для отступов, ensure_ascii и данных, которые orjson не умеет
+    (ключи не строки, слишком большие числа), используется обычный JSONRenderer.
+    Числа с плавающей точкой orjson пишет иначе (1e-5 вместо 1e-05), поэтому ответы с ними
+    лучше отдавать обычным JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Как и JSONRenderer, экранирую разделители строк, которые ломают JSONP и встраивание в <script>
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
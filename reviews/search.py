@@ -0,0 +1,183 @@
+import base64
+import heapq
+import json
+import math
+import re
+import threading
+from array import array
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from .models import Car, Comment
+
+# Конфигурация полнотекстового поиска PostgreSQL, совпадает с колонкой из миграции 0005
+PG_SEARCH_CONFIG = 'russian'
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Разбивает текст на слова в нижнем регистре, однобуквенные слова отбрасываются"""
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1]
+
+
+def encode_cursor(rank, pk):
+    return base64.urlsafe_b64encode(json.dumps([rank, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (rank, id) последнего результата предыдущей страницы или None, если курсор испорчен"""
+    try:
+        rank, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс комментариев в памяти процесса, используется вместо PostgreSQL на SQLite.
+    Для каждого слова хранится массив id комментариев и массив частот слова в них.
+    Индекс строится при первом поиске, обновляется сигналами, а новые комментарии из других
+    процессов (или добавленные через bulk_create) подгружаются перед каждым поиском по id > max_id.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.postings = {}
+        # id комментария -> car_id * 65536 + количество слов
+        self.docs = {}
+        self.max_id = 0
+
+    def add(self, pk, car_id, text):
+        tokens = tokenize(text)
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            ids, tfs = self.postings.setdefault(token, (array('q'), array('H')))
+            ids.append(pk)
+            tfs.append(min(count, 65535))
+        self.docs[pk] = car_id * 65536 + min(len(tokens), 65535)
+        self.max_id = max(self.max_id, pk)
+
+    def remove(self, pk, text):
+        if self.docs.pop(pk, None) is None:
+            return
+        for token in set(tokenize(text)):
+            entry = self.postings.get(token)
+            if entry is None:
+                continue
+            ids, tfs = entry
+            for position in range(len(ids) - 1, -1, -1):
+                if ids[position] == pk:
+                    del ids[position]
+                    del tfs[position]
+            if not ids:
+                del self.postings[token]
+
+    def sync(self):
+        """Подгружает комментарии, появившиеся в БД после последней синхронизации"""
+        comments = Comment.objects.filter(id__gt=self.max_id).order_by('id').values_list('id', 'car_id', 'comment_text')
+        for pk, car_id, text in comments.iterator(chunk_size=5000):
+            self.add(pk, car_id, text)
+        self.loaded = True
+
+    def reset(self):
+        """Сбрасывает индекс после массового удаления комментариев, он построится заново при следующем поиске"""
+        with self.lock:
+            self.loaded = False
+            self.postings = {}
+            self.docs = {}
+            self.max_id = 0
+
+    def on_save(self, pk, car_id, text, old_text=None):
+        with self.lock:
+            if not self.loaded:
+                return
+            if old_text is not None:
+                self.remove(pk, old_text)
+            self.add(pk, car_id, text)
+
+    def on_delete(self, pk, text):
+        with self.lock:
+            if self.loaded:
+                self.remove(pk, text)
+
+    def search(self, query, car_ids=None, after=None, limit=50):
+        """Возвращает до limit пар (rank, id) по убыванию ранга; все слова запроса обязательны"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            self.sync()
+            if any(term not in self.postings for term in terms):
+                return []
+
+            total = len(self.docs)
+            scores = None
+            # Начинаю с самого редкого слова, чтобы пересечение было минимальным
+            for term in sorted(terms, key=lambda term: len(self.postings[term][0])):
+                ids, tfs = self.postings[term]
+                idf = math.log(1 + total / len(ids))
+                if scores is None:
+                    scores = {pk: tf * idf for pk, tf in zip(ids, tfs)}
+                else:
+                    scores = {pk: scores[pk] + tf * idf for pk, tf in zip(ids, tfs) if pk in scores}
+                if not scores:
+                    return []
+
+            results = []
+            for pk, score in scores.items():
+                doc = self.docs.get(pk)
+                if doc is None:
+                    continue
+                if car_ids is not None and doc // 65536 not in car_ids:
+                    continue
+                rank = round(score / math.sqrt(doc % 65536 or 1), 6)
+                if after is not None and (rank, pk) >= after:
+                    continue
+                results.append((rank, pk))
+
+        return heapq.nlargest(limit, results)
+
+
+inverted_index = InvertedIndex()
+
+
+def search_comments(query, filters=None, after=None, limit=50):
+    """
+    Полнотекстовый поиск комментариев с ранжированием.
+    filters - фильтры по автомобилю, например {'car__manufacture': 3}.
+    after - (rank, id) последнего результата предыдущей страницы (keyset пагинация).
+    Возвращает список (rank, comment) по убыванию ранга.
+    """
+    filters = filters or {}
+    comments = Comment.objects.select_related('car', 'car__manufacture', 'car__manufacture__country')
+
+    if connection.vendor == 'postgresql':
+        tsquery = f"plainto_tsquery('{PG_SEARCH_CONFIG}', %s)"
+        queryset = comments.filter(
+            RawSQL(f'search_vector @@ {tsquery}', [query], output_field=BooleanField()),
+            **filters,
+        ).annotate(
+            # ts_rank возвращает real: psycopg читает его коротким десятичным числом, и ранг из курсора
+            # не совпал бы с тем же real в сравнении. В double precision значение переживает JSON без потерь
+            rank=RawSQL(f'ts_rank(search_vector, {tsquery})::float8', [query], output_field=FloatField()),
+        )
+        if after is not None:
+            rank, pk = after
+            queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=pk))
+        return [(comment.rank, comment) for comment in queryset.order_by('-rank', '-id')[:limit]]
+
+    car_ids = None
+    if filters:
+        car_filters = {key[len('car__'):] if key.startswith('car__') else 'pk': value for key, value in filters.items()}
+        car_ids = set(Car.objects.filter(**car_filters).values_list('id', flat=True))
+
+    ranked = inverted_index.search(query, car_ids=car_ids, after=after, limit=limit)
+    found = comments.in_bulk([pk for rank, pk in ranked])
+    # Удаленные в другом процессе комментарии просто пропускаю
+    return [(rank, found[pk]) for rank, pk in ranked if pk in found]
@@ -0,0 +1,120 @@
+"""
+Генерация правдоподобного каталога для бенчмарков и ручной проверки производительности.
+Все объекты создаются через bulk_create пачками, поэтому миллион комментариев вставляется
+за минуты, а не часы. Один и тот же seed дает одни и те же данные.
+"""
+import random
+from datetime import timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from .cache import bump_versions
+from .counters import recount_comments
+from .models import Country, Manufacture, Car, Comment
+from .snapshot import catalogue_snapshot
+
+COUNTRY_NAMES = [
+    'Германия', 'Япония', 'США', 'Южная Корея', 'Франция', 'Италия', 'Великобритания', 'Швеция',
+    'Китай', 'Чехия', 'Испания', 'Россия', 'Индия', 'Румыния', 'Малайзия', 'Нидерланды',
+]
+MANUFACTURE_NAMES = [
+    'Volkswagen', 'BMW', 'Mercedes-Benz', 'Audi', 'Porsche', 'Opel', 'Toyota', 'Honda', 'Nissan', 'Mazda',
+    'Subaru', 'Mitsubishi', 'Ford', 'Chevrolet', 'Tesla', 'Jeep', 'Hyundai', 'Kia', 'Renault', 'Peugeot',
+    'Citroen', 'Fiat', 'Alfa Romeo', 'Ferrari', 'Jaguar', 'Land Rover', 'Mini', 'Volvo', 'Saab', 'Geely',
+    'BYD', 'Chery', 'Skoda', 'Seat', 'Lada', 'GAZ', 'Tata', 'Dacia', 'Proton', 'Spyker',
+]
+MODEL_WORDS = ['Astra', 'Corsa', 'Sport', 'City', 'Terra', 'Nova', 'Prime', 'Vento', 'Sol', 'Aura', 'Rio', 'Vita']
+FIRST_NAMES = ['ivan', 'anna', 'petr', 'olga', 'sergey', 'maria', 'alex', 'elena', 'dmitry', 'irina']
+EMAIL_DOMAINS = ['example.com', 'mail.test', 'cars.test', 'inbox.test']
+PHRASES = [
+    'Отличный автомобиль, рекомендую.', 'Расход топлива в городе выше заявленного.',
+    'Подвеска мягкая, на плохих дорогах комфортно.', 'Шумоизоляция слабая на скорости больше 100 км/ч.',
+    'Владею третий год, серьезных поломок не было.', 'Салон просторный, багажник вместительный.',
+    'Обслуживание у дилера дорогое.', 'Мультимедиа иногда зависает.', 'Динамика хорошая для своего класса.',
+    'Зимой заводится без проблем.', 'Краска тонкая, появляются сколы.', 'Для семьи подходит идеально.',
+]
+
+# Комментарии распределены по последним трем годам
+COMMENTS_PERIOD = timedelta(days=3 * 365)
+
+
+def unique_names(base_names, count):
+    """count уникальных названий: сначала из списка, дальше с номером"""
+    names = []
+    for index in range(count):
+        name = base_names[index % len(base_names)]
+        if index >= len(base_names):
+            name = f'{name} {index // len(base_names)}'
+        names.append(name)
+    return names
+
+
+def comment_text(rnd):
+    text = ' '.join(rnd.choice(PHRASES) for _ in range(rnd.randint(1, 6)))
+    # Пробег в половине отзывов дает редкие слова для бенчмарка поиска
+    if rnd.random() < 0.5:
+        text += f' Пробег {rnd.randrange(1, 300) * 1000} км.'
+    return text
+
+
+def seed_catalogue(countries, manufactures, cars, comments, batch_size=5000, seed=42, log=None):
+    """
+    Заполняет пустую базу. Счетчики comments_count пересчитываются в конце, а кеш ответов
+    и снимок справочников сбрасываются, потому что bulk_create не вызывает сигналы.
+    """
+    rnd = random.Random(seed)
+    log = log or (lambda message: None)
+
+    with transaction.atomic():
+        country_objs = Country.objects.bulk_create(
+            [Country(name=name) for name in unique_names(COUNTRY_NAMES, countries)],
+            batch_size=batch_size,
+        )
+        manufacture_objs = Manufacture.objects.bulk_create(
+            [Manufacture(name=name, country=rnd.choice(country_objs))
+             for name in unique_names(MANUFACTURE_NAMES, manufactures)],
+            batch_size=batch_size,
+        )
+        car_objs = []
+        for index in range(cars):
+            release_year = rnd.randint(1970, 2024)
+            car_objs.append(Car(
+                name=f'{rnd.choice(MODEL_WORDS)} {index}',
+                manufacture=rnd.choice(manufacture_objs),
+                release_year=release_year,
+                end_year=None if rnd.random() < 0.4 else rnd.randint(release_year, 2025),
+            ))
+        car_objs = Car.objects.bulk_create(car_objs, batch_size=batch_size)
+        log(f'Стран: {countries}, производителей: {manufactures}, автомобилей: {cars}')
+
+    now = timezone.now()
+    period = int(COMMENTS_PERIOD.total_seconds())
+    created = 0
+    while created < comments:
+        size = min(batch_size, comments - created)
+        batch = []
+        for index in range(created, created + size):
+            batch.append(Comment(
+                email=f'{rnd.choice(FIRST_NAMES)}{index}@{rnd.choice(EMAIL_DOMAINS)}',
+                car=rnd.choice(car_objs),
+                created_at=now - timedelta(seconds=rnd.randrange(period)),
+                comment_text=comment_text(rnd),
+            ))
+        Comment.objects.bulk_create(batch)
+        created += size
+        log(f'Комментариев: {created} из {comments}')
+
+    recount_comments()
+    bump_versions([f'{model}:all' for model in ('country', 'manufacture', 'car', 'comment')])
+    catalogue_snapshot.invalidate()
+
+
+def clear_catalogue():
+    """
+    Удаляет весь каталог одним DELETE на таблицу. QuerySet.delete() здесь не подходит:
+    из-за сигналов комментариев он загружал бы и удалял каждую строку отдельно.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model in (Comment, Car, Manufacture, Country):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+    bump_versions([f'{model}:all' for model in ('country', 'manufacture', 'car', 'comment')])
+    catalogue_snapshot.invalidate()
@@ -1,10 +1,36 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from .models import Country, Manufacture, Car, Comment
+from rest_framework.reverse import reverse
+from .models import Country, Manufacture, Car, Comment, ExportJob
 from django.core.exceptions import ValidationError
 
-class CountrySerializer(serializers.ModelSerializer):
+class UniqueNameMixin:
+    """
+    Уникальность названия без учета регистра проверяет индекс UniqueConstraint(Lower('name')),
+    ошибку БД превращаю в ошибку валидации. Снимок справочников для этого не годится:
+    он может отставать от других процессов и отклонить уже освободившееся название.
+    """
+    unique_name_message = None
+
+    def create(self, validated_data):
+        return self.save_unique(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        return self.save_unique(super().update, instance, validated_data)
+
+    def save_unique(self, save, *args):
+        try:
+            with transaction.atomic():
+                return save(*args)
+        except IntegrityError:
+            raise serializers.ValidationError({'name': [self.unique_name_message]})
+
+
+class CountrySerializer(UniqueNameMixin, serializers.ModelSerializer):
     # Требование: При запросе страны на стороне сериализатора добавить производителей в выдачу, которые ссылаются на нее
     manufactures = serializers.SerializerMethodField()
+    unique_name_message = "Страна с таким названием уже существует"
 
     class Meta:
         model = Country
@@ -15,21 +41,13 @@ class CountrySerializer(serializers.ModelSerializer):
         if hasattr(obj, 'manufactures'):
             return [manufacture.name for manufacture in obj.manufactures.all()]
         return []
-
-    def validate_name(self, value):
-        """Валидация названия страны с учетом уникальности"""
-        value = value.strip()
-        # Проверяю, существует ли страна с таким названием (игнорируя регистр)
-        if Country.objects.filter(name__iexact=value).exists():
-            raise serializers.ValidationError("Страна с таким названием уже существует")
-        return value
     
-class ManufactureSerializer(serializers.ModelSerializer):
+class ManufactureSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Сериализатор для модели Manufacture"""
     # Требование: При запросе производителя добавлять страну, автомобили и количество комментариев к ним к выдаче
     country_name = serializers.CharField(source='country.name', read_only=True)
     cars = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    unique_name_message = "Производитель с таким названием уже существует"
 
     class Meta:
         model = Manufacture
@@ -39,27 +57,13 @@ class ManufactureSerializer(serializers.ModelSerializer):
         """Возвращает список автомобилей этого производителя"""
         return [car.name for car in obj.cars.all()]
 
-    def get_comments_count(self, obj):
-        """Возвращает общее количество комментариев ко всем автомобилям производителя"""
-        total_comments = 0
-        for car in obj.cars.all():
-            total_comments += car.comments.count()
-        return total_comments
-
-    def validate_name(self, value):
-        """Валидация названия производителя с учетом уникальности"""
-        value = value.strip()
-        if Manufacture.objects.filter(name__iexact=value).exists():
-            raise serializers.ValidationError("Производитель с таким названием уже существует")
-        return value
-
     
-class CarSerializer(serializers.ModelSerializer):
+class CarSerializer(UniqueNameMixin, serializers.ModelSerializer):
     """Сериализатор для модели Car"""
     # Требование: При запросе автомобиля добавить производителя и комментарии с их количеством в выдачу
     manufacture_name = serializers.CharField(source='manufacture.name', read_only=True)
     comments = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
+    unique_name_message = "Автомобиль с таким названием уже существует"
 
     class Meta:
         model = Car
@@ -68,20 +72,15 @@ class CarSerializer(serializers.ModelSerializer):
 
     def get_comments(self, obj):
         """Возвращает текст комментариев к автомобилю"""
-        comments = obj.comments.all().order_by('-created_at')
+        # Во вьюсете комментарии уже подгружены через Prefetch в нужном порядке
+        if hasattr(obj, 'latest_comments'):
+            comments = obj.latest_comments
+        else:
+            comments = obj.comments.order_by('-created_at')
+            if settings.CAR_COMMENTS_LIMIT:
+                comments = comments[:settings.CAR_COMMENTS_LIMIT]
         return [comment.comment_text for comment in comments]
 
-    def get_comments_count(self, obj):
-        """Возвращает количество комментариев к автомобилю"""
-        return obj.comments.count()
-
-    def validate_name(self, value):
-        """Валидация названия автомобиля с учетом уникальности"""
-        value = value.strip()
-        if Car.objects.filter(name__iexact=value).exists():
-            raise serializers.ValidationError("Автомобиль с таким названием уже существует")
-        return value
-
 
 class CommentSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Comment"""
@@ -112,9 +111,41 @@ class CommentSerializer(serializers.ModelSerializer):
             )
         return value
 
-    def validate_car(self, value):
-        """Валидация существования автомобиля"""
-        if not Car.objects.filter(id=value.id).exists():
-            raise serializers.ValidationError("Указанный автомобиль не существует")
-        return value
-    
\ No newline at end of file
+
+class PreloadedCarField(serializers.PrimaryKeyRelatedField):
+    """Поле автомобиля, которое берет объект из заранее загруженного словаря context['cars']"""
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        car = self.context['cars'].get(pk)
+        if car is None:
+            self.fail('does_not_exist', pk_value=data)
+        return car
+
+
+class CommentBulkSerializer(CommentSerializer):
+    """Сериализатор одного комментария при массовой загрузке: автомобили загружены одним запросом"""
+    car = PreloadedCarField(queryset=Car.objects.all())
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    """Сериализатор фоновой выгрузки: статус и ссылка на скачивание готового файла"""
+    url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'export', 'format', 'status', 'file_size', 'error', 'created_at', 'finished_at',
+                  'url', 'download_url')
+        read_only_fields = fields
+
+    def get_url(self, obj):
+        return reverse('exportjob-detail', args=[obj.pk], request=self.context.get('request'))
+
+    def get_download_url(self, obj):
+        if obj.status != ExportJob.DONE:
+            return None
+        return reverse('exportjob-download', args=[obj.pk], request=self.context.get('request'))
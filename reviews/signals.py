@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models import F, QuerySet, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .cache import bump_versions
+from .counters import adjust_comments_count
+from .models import Country, Manufacture, Car, Comment
+from .search import inverted_index
+from .snapshot import catalogue_snapshot
+
+
+def invalidate_comments(car_ids, comment_ids=()):
+    """
+    Сбрасывает кеш после изменения комментариев к указанным автомобилям.
+    Вызывается из сигналов и из массовых операций, которые сигналы не отправляют.
+    """
+    car_ids = set(car_ids)
+    scopes = {'comment:list', 'car:list', 'manufacture:list'}
+    scopes.update(f'comment:{pk}' for pk in comment_ids)
+    scopes.update(f'car:{pk}' for pk in car_ids)
+    relations = Car.objects.filter(pk__in=car_ids).values_list('manufacture_id', 'manufacture__country_id')
+    for manufacture_id, country_id in relations:
+        scopes.add(f'manufacture:{manufacture_id}')
+        scopes.add(f'country:{country_id}')
+    bump_versions(scopes)
+
+
+def origin_model(origin):
+    """Модель, с которой началось удаление: origin - удаляемый объект или queryset"""
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def cascaded(sender, kwargs):
+    """
+    Объект удаляется каскадом вместе с объектом другой модели. Такие удаления целиком обрабатывает
+    delete_cascaded_comments, а сигналы каждого удаленного объекта их пропускают
+    """
+    origin = kwargs.get('origin')
+    return kwargs['signal'] is post_delete and origin is not None and origin_model(origin) is not sender
+
+
+@receiver([post_save, post_delete], sender=Country)
+def invalidate_country(sender, instance, **kwargs):
+    # Название страны выводится у производителей и в car_name комментариев,
+    # а при удалении вместе со страной уходят ее производители и их автомобили
+    bump_versions([f'country:{instance.pk}', 'country:list', 'manufacture:all', 'car:all', 'comment:all'])
+
+
+@receiver([post_save, post_delete], sender=Manufacture)
+def invalidate_manufacture(sender, instance, **kwargs):
+    if cascaded(sender, kwargs):
+        return
+    # Производитель мог переехать в другую страну, поэтому сбрасываю все страны
+    bump_versions([f'manufacture:{instance.pk}', 'manufacture:list', 'country:all', 'car:all', 'comment:all'])
+
+
+@receiver([post_save, post_delete], sender=Car)
+def invalidate_car(sender, instance, **kwargs):
+    if cascaded(sender, kwargs):
+        return
+    bump_versions([f'car:{instance.pk}', 'car:list', 'manufacture:all', 'comment:all'])
+
+
+@receiver([post_save, post_delete], sender=Country)
+@receiver([post_save, post_delete], sender=Manufacture)
+@receiver([post_save, post_delete], sender=Car)
+def update_snapshot(sender, instance, **kwargs):
+    catalogue_snapshot.schedule(instance, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_comment(sender, instance, created=False, **kwargs):
+    if cascaded(sender, kwargs):
+        return
+    if kwargs['signal'] is post_save and not created:
+        # При редактировании комментарий мог перейти к другому автомобилю
+        bump_versions([f'comment:{instance.pk}', 'comment:list', 'car:all', 'manufacture:all'])
+        return
+    invalidate_comments([instance.car_id], [instance.pk])
+
+
+@receiver(pre_save, sender=Comment)
+def remember_comment_state(sender, instance, **kwargs):
+    # При редактировании нужны прежний автомобиль (для счетчиков) и прежний текст (для индекса поиска)
+    if instance._state.adding:
+        return
+    previous = Comment.objects.filter(pk=instance.pk).values_list('car_id', 'comment_text').first()
+    if previous is not None:
+        instance._previous_car_id, instance._indexed_text = previous
+
+
+@receiver(pre_save, sender=Car)
+def remember_car_manufacture(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._previous_manufacture_id = (
+            Car.objects.filter(pk=instance.pk).values_list('manufacture_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        adjust_comments_count({instance.car_id: 1})
+        return
+    previous_car_id = getattr(instance, '_previous_car_id', instance.car_id)
+    if previous_car_id != instance.car_id:
+        adjust_comments_count({previous_car_id: -1, instance.car_id: 1})
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if cascaded(sender, kwargs):
+        return
+    adjust_comments_count({instance.car_id: -1})
+
+
+@receiver(post_save, sender=Car)
+def move_car_comments_count(sender, instance, created, **kwargs):
+    # Автомобиль перешел к другому производителю - вместе с ним переходят его комментарии
+    previous_manufacture_id = getattr(instance, '_previous_manufacture_id', None)
+    if created or previous_manufacture_id in (None, instance.manufacture_id):
+        return
+    comments_count = Car.objects.filter(pk=instance.pk).values_list('comments_count', flat=True).get()
+    Manufacture.objects.filter(pk=previous_manufacture_id).update(
+        comments_count=Greatest(F('comments_count') - comments_count, Value(0)),
+    )
+    Manufacture.objects.filter(pk=instance.manufacture_id).update(comments_count=F('comments_count') + comments_count)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, **kwargs):
+    inverted_index.on_save(instance.pk, instance.car_id, instance.comment_text, getattr(instance, '_indexed_text', None))
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, **kwargs):
+    if cascaded(sender, kwargs):
+        return
+    inverted_index.on_delete(instance.pk, instance.comment_text)
+
+
+@receiver(pre_delete, sender=Country)
+@receiver(pre_delete, sender=Manufacture)
+@receiver(pre_delete, sender=Car)
+def delete_cascaded_comments(sender, instance, origin=None, **kwargs):
+    """
+    Комментарии, которые удаляются вместе с автомобилем, производителем или страной, обрабатываются
+    одним проходом на все удаление, а не сигналом на каждый комментарий. Кеш сбрасывает сигнал самого
+    удаляемого объекта: его области покрывают все, что удаляется каскадом.
+    """
+    # pre_delete приходит для каждого удаляемого объекта, а обработать нужно один раз на origin
+    if origin is None or origin_model(origin) is not sender or getattr(origin, '_cascade_handled', False):
+        return
+    origin._cascade_handled = True
+    if sender is Car:
+        # Производители остаются: с них снимаются комментарии удаляемых автомобилей
+        objects = origin.values('pk') if isinstance(origin, QuerySet) else [origin.pk]
+        counts = Car.objects.filter(pk__in=objects).values_list('id', 'comments_count')
+        adjust_comments_count({car_id: -count for car_id, count in counts})
+    if inverted_index.loaded:
+        transaction.on_commit(inverted_index.reset)
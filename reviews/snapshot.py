@@ -0,0 +1,238 @@
+"""
+Снимок справочников (страны, производители, автомобили) в памяти процесса.
+
+Таблицы маленькие и меняются редко, поэтому списки и экспорты
+берут названия и связи отсюда, а не соединяют таблицы в каждом запросе. Снимок загружается
+при старте воркера (или при первом обращении) и обновляется сигналами после коммита транзакции:
+изменение применяется к копии данных, поэтому читатели всегда видят целостную версию.
+
+Согласованность между процессами держит счетчик версии в кеше reviews: каждое изменение
+увеличивает его через incr. Если версия в кеше ушла дальше, чем изменения, известные процессу,
+снимок перечитывается целиком. Общей версия будет только с общим кешем, поэтому с несколькими
+процессами настройки требуют REDIS_URL. Между коммитом в другом процессе и сменой версии снимок
+может отставать: читатели ищут в нем через SnapshotLookup, который перечитывает снимок, если строка
+ссылается на неизвестный ему объект, а уникальность названий решает только индекс БД.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import partial
+from django.db import DatabaseError, transaction
+from .cache import get_cache
+from .models import Country, Manufacture, Car
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'reviews:snapshot:version'
+
+# Что хранится о каждом объекте: название первым
+ROW_FIELDS = {
+    Country: ('name',),
+    Manufacture: ('name', 'country_id'),
+    Car: ('name', 'manufacture_id', 'release_year', 'end_year'),
+}
+# Списки названий дочерних объектов: модель родителя -> (дочерняя модель, поле связи)
+CHILDREN = {
+    Country: (Manufacture, 'country_id'),
+    Manufacture: (Car, 'manufacture_id'),
+}
+
+
+def read_children(parent_model, parent_ids=None):
+    """{id родителя: [названия дочерних объектов]} в порядке модели, как у prefetch_related"""
+    model, field = CHILDREN[parent_model]
+    queryset = model.objects.all()
+    if parent_ids is not None:
+        queryset = queryset.filter(**{f'{field}__in': parent_ids})
+    children = defaultdict(list)
+    for parent_id, name in queryset.values_list(field, 'name'):
+        children[parent_id].append(name)
+    return dict(children)
+
+
+class CatalogueData:
+    """Одна версия снимка. После публикации не меняется: изменения применяются к копии"""
+
+    def __init__(self, rows, children):
+        # модель -> {id: кортеж полей ROW_FIELDS}
+        self.rows = rows
+        # модель родителя -> {id: [названия дочерних объектов]}
+        self.children = children
+
+    @classmethod
+    def load(cls):
+        rows = {model: {pk: tuple(values) for pk, *values in model.objects.values_list('id', *fields)}
+                for model, fields in ROW_FIELDS.items()}
+        children = {model: read_children(model) for model in CHILDREN}
+        return cls(rows, children)
+
+    def copy(self):
+        return CatalogueData(
+            {model: dict(table) for model, table in self.rows.items()},
+            {model: dict(table) for model, table in self.children.items()},
+        )
+
+    def apply(self, model, pk, row):
+        """Изменение одного объекта; row=None - объект удален"""
+        table = self.rows[model]
+        old = table.pop(pk, None)
+        if row is not None:
+            table[pk] = row
+        elif model in self.children:
+            self.children[model].pop(pk, None)
+
+        # Название или родитель поменялись - списки родителей перечитываю в порядке БД
+        for parent_model, (child_model, field) in CHILDREN.items():
+            if child_model is model:
+                position = ROW_FIELDS[model].index(field)
+                parent_ids = {item[position] for item in (old, row) if item is not None}
+                children = self.children[parent_model]
+                for parent_id in parent_ids:
+                    children.pop(parent_id, None)
+                children.update(read_children(parent_model, parent_ids))
+
+    def has(self, model, ids):
+        table = self.rows[model]
+        return all(pk in table for pk in ids)
+
+    def country_name(self, pk):
+        return self.rows[Country][pk][0]
+
+    def manufacture_name(self, pk):
+        return self.rows[Manufacture][pk][0]
+
+    def manufacture_names(self, country_id):
+        return self.children[Country].get(country_id, [])
+
+    def car_names(self, manufacture_id):
+        return self.children[Manufacture].get(manufacture_id, [])
+
+    def car_relation_names(self, car_id):
+        """(автомобиль, производитель, страна) для строк экспорта комментариев"""
+        name, manufacture_id = self.rows[Car][car_id][:2]
+        manufacture_name, country_id = self.rows[Manufacture][manufacture_id]
+        return name, manufacture_name, self.rows[Country][country_id][0]
+
+    def car_title(self, car_id):
+        """То же, что str(car): Car.__str__ вместе с Manufacture.__str__"""
+        name, manufacture_id, release_year, end_year = self.rows[Car][car_id]
+        manufacture_name, country_id = self.rows[Manufacture][manufacture_id]
+        manufacture = f'Производитель {manufacture_name} из страны {self.rows[Country][country_id][0]}'
+        return f"{name} ({manufacture}), {release_year} - {end_year or 'н.в'}"
+
+
+class CatalogueSnapshot:
+    """Текущая версия снимка процесса и ее номер в общем счетчике версий"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = None
+        self.version = None
+
+    def read_version(self):
+        cache = get_cache()
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # Холодный кеш: новая версия от времени, чтобы не совпасть с версиями до очистки
+            cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def reload(self, version):
+        self.data = CatalogueData.load()
+        self.version = version
+
+    def get(self, countries=(), manufactures=(), cars=()):
+        """
+        Актуальная версия снимка. Если в нем нет переданных id (объект только что создан
+        в другом процессе и версия еще не обновилась), снимок перечитывается.
+        """
+        with self.lock:
+            version = self.read_version()
+            data = self.data
+            if (data is None or version != self.version or not data.has(Country, countries)
+                    or not data.has(Manufacture, manufactures) or not data.has(Car, cars)):
+                self.reload(version)
+            return self.data
+
+    def refresh_missing(self, data):
+        """
+        Вызывается, когда строка экспорта ссылается на объект, которого нет в снимке.
+        В потоке с циклом событий (асинхронный экспорт) БД трогать нельзя, там снимок только
+        помечается устаревшим и перечитается при следующем обращении.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            with self.lock:
+                if self.data is None or self.data is data:
+                    self.reload(self.read_version())
+                return self.data
+        with self.lock:
+            self.data = None
+        return data
+
+    def warm_up(self):
+        """Загрузка при старте воркера; без БД снимок загрузится при первом запросе"""
+        try:
+            self.get()
+        except DatabaseError:
+            logger.warning('Снимок справочников не загружен при старте', exc_info=True)
+
+    def changed(self, model, pk, row):
+        """Применяет закоммиченное изменение и сообщает о нем остальным процессам"""
+        with self.lock:
+            try:
+                version = get_cache().incr(VERSION_KEY)
+            except ValueError:
+                version = None
+            if self.data is None:
+                return
+            if version is None or version != self.version + 1:
+                # Версии нет или были изменения в других процессах: перечитаю при следующем обращении
+                self.data = None
+                return
+            data = self.data.copy()
+            data.apply(model, pk, row)
+            self.data = data
+            self.version = version
+
+    def schedule(self, instance, deleted=False):
+        """Изменение из сигнала модели применяется только после коммита, откат его отменяет"""
+        model = type(instance)
+        row = None if deleted else tuple(getattr(instance, field) for field in ROW_FIELDS[model])
+        transaction.on_commit(partial(self.changed, model, instance.pk, row))
+
+    def invalidate(self):
+        """Сброс во всех процессах после массовых изменений без сигналов (bulk_create, сырой SQL)"""
+        with self.lock:
+            get_cache().set(VERSION_KEY, time.time_ns(), timeout=None)
+            self.data = None
+
+
+class SnapshotLookup:
+    """
+    Поиск по снимку для страниц и выгрузок. Если строка ссылается на объект, которого в снимке нет
+    (создан в другом процессе, а версия еще не сменилась), снимок один раз перечитывается, дальше
+    отдается default. ids - id объектов страницы, как у CatalogueSnapshot.get.
+    """
+
+    def __init__(self, snapshot, **ids):
+        self.snapshot = snapshot
+        self.data = snapshot.get(**ids)
+        self.refreshed = False
+
+    def __call__(self, method, pk, default):
+        try:
+            return getattr(self.data, method)(pk)
+        except KeyError:
+            if not self.refreshed:
+                self.refreshed = True
+                self.data = self.snapshot.refresh_missing(self.data)
+                return self(method, pk, default)
+            return default
+
+
+catalogue_snapshot = CatalogueSnapshot()
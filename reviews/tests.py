@@ -1,3 +1,1260 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import os
+import runpy
+import tempfile
+import threading
+import unittest
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from openpyxl import Workbook, load_workbook
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from test_proj_reviews import settings as project_settings
+from .admin import EstimatedCountPaginator
+from .archive import archive_month
+from .cache import get_cache_stats
+from .catalogue_export import fetch_catalogue
+from .metrics import MetricsMiddleware, registry
+from .models import Country, Manufacture, Car, Comment, CommentArchive, ExportJob
+from .partitions import create_partition, is_partitioned, list_partitions, partition_name
+from .search import inverted_index
+from .snapshot import VERSION_KEY, catalogue_snapshot
+from .throttling import local_store
+
+# Все тесты идут от одного адреса, и троттлинг мешал бы им; его проверяет ThrottlingTests
+throttling_off = override_settings(THROTTLE_ENABLED=False)
+
+
+def setUpModule():
+    throttling_off.enable()
+
+
+def tearDownModule():
+    throttling_off.disable()
+
+
+def create_catalogue(manufactures, cars_per_manufacture, comments_per_car):
+    """Создаю страну с производителями, автомобилями и комментариями для тестов"""
+    # В TestCase транзакция не коммитится, поэтому сброс кеша и обновление снимка справочников
+    # после коммита выполняю сами
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        country = Country.objects.create(name=f'Страна {Country.objects.count()}')
+        for m in range(manufactures):
+            manufacture = Manufacture.objects.create(name=f'{country.name} производитель {m}', country=country)
+            for c in range(cars_per_manufacture):
+                car = Car.objects.create(name=f'{manufacture.name} авто {c}', manufacture=manufacture, release_year=2000)
+                for i in range(comments_per_car):
+                    Comment.objects.create(email=f'user{i}@example.com', car=car,
+                                           comment_text='Отличный автомобиль, рекомендую')
+    catalogue_snapshot.invalidate()
+
+
+class ManufactureQueryCountTests(TestCase):
+    """Список производителей не должен делать запрос на каждый автомобиль"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_list_query_count_does_not_grow(self):
+        create_catalogue(manufactures=2, cars_per_manufacture=2, comments_per_car=1)
+        catalogue_snapshot.get()
+        # Один запрос страницы: страна и автомобили берутся из снимка справочников
+        with self.assertNumQueries(1):
+            self.client.get('/api/manufactures/')
+
+        create_catalogue(manufactures=5, cars_per_manufacture=4, comments_per_car=3)
+        catalogue_snapshot.get()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/manufactures/')
+
+        self.assertEqual(response.status_code, 200)
+        counts = {item['name']: item['comments_count'] for item in response.json()['results']}
+        self.assertEqual(counts['Страна 1 производитель 0'], 12)
+        self.assertEqual(counts['Страна 0 производитель 0'], 2)
+
+
+class CarQueryCountTests(TestCase):
+    """Список автомобилей использует prefetch комментариев, а не запрос на каждый автомобиль"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_list_query_count_does_not_grow(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=1)
+        catalogue_snapshot.get()
+        # Страница автомобилей и один запрос комментариев, производитель берется из снимка
+        with self.assertNumQueries(2):
+            self.client.get('/api/cars/')
+
+        create_catalogue(manufactures=3, cars_per_manufacture=5, comments_per_car=4)
+        catalogue_snapshot.get()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/cars/')
+
+        self.assertEqual(response.status_code, 200)
+        car = next(item for item in response.json()['results'] if item['name'] == 'Страна 1 производитель 0 авто 0')
+        self.assertEqual(car['comments_count'], 4)
+        self.assertEqual(len(car['comments']), 4)
+
+    @override_settings(CAR_COMMENTS_LIMIT=2)
+    def test_comments_limit(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=5)
+        car = self.client.get('/api/cars/').json()['results'][0]
+        self.assertEqual(car['comments_count'], 5)
+        self.assertEqual(len(car['comments']), 2)
+
+
+class QueryCountRegressionTests(TestCase):
+    """
+    Количество SQL запросов списков и экспортов не зависит от количества строк.
+    При расхождении в сообщении выводятся запросы обоих прогонов, чтобы было видно лишний.
+    """
+    LIST_URLS = ['/api/countries/', '/api/manufactures/', '/api/cars/', '/api/comments/']
+    EXPORT_URLS = [
+        f'/api/{prefix}/export/{export_format}/'
+        for prefix in ('countries', 'manufactures', 'cars', 'comments')
+        for export_format in ('csv', 'xlsx')
+    ]
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def capture(self, url):
+        """Запросы одного GET; потоковый ответ дочитывается, потому что выборка идет во время отдачи"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            # Тестовый клиент сам закрывает ответ; повторный close() закрыл бы соединение с PostgreSQL
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def capture_all(self):
+        return {url: self.capture(url) for url in self.LIST_URLS + self.EXPORT_URLS}
+
+    def test_query_count_does_not_grow(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=1)
+        small = self.capture_all()
+        create_catalogue(manufactures=4, cars_per_manufacture=3, comments_per_car=5)
+        create_catalogue(manufactures=2, cars_per_manufacture=6, comments_per_car=2)
+        large = self.capture_all()
+
+        for url in small:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    len(small[url]), len(large[url]),
+                    f'{url}: {len(small[url])} -> {len(large[url])} запросов при росте данных\n'
+                    'Мало данных:\n' + '\n'.join(small[url]) + '\nМного данных:\n' + '\n'.join(large[url]),
+                )
+
+
+class CursorPaginationTests(TestCase):
+    """Курсор хранит все поля сортировки: строки с одинаковым первым полем не повторяются и не пропадают"""
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalogue(manufactures=1, cars_per_manufacture=7, comments_per_car=0)
+        cars = list(Car.objects.order_by('id'))
+        for car, count in zip(cars, (3, 1, 3, 3, 1, 0, 3)):
+            Car.objects.filter(pk=car.pk).update(comments_count=count)
+        self.cars = cars
+
+    def read_pages(self, url, params):
+        ids = []
+        while url:
+            data = self.client.get(url, params).json()
+            params = None
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        return ids
+
+    def test_ordering_with_equal_values(self):
+        expected = list(Car.objects.order_by('-comments_count', 'id').values_list('id', flat=True))
+        for fast_read in (True, False):
+            with self.subTest(fast_read=fast_read), override_settings(FAST_READ_ENABLED=fast_read):
+                cache.clear()
+                self.assertEqual(self.read_pages('/api/cars/', {'ordering': '-comments_count', 'page_size': 2}),
+                                 expected)
+
+    def test_comments_created_at_once(self):
+        moment = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        Comment.objects.bulk_create(
+            Comment(email=f'same{i}@example.com', car=self.cars[0], comment_text='Один момент', created_at=moment)
+            for i in range(5)
+        )
+        expected = list(Comment.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.read_pages('/api/comments/', {'page_size': 2}), expected)
+
+    def test_rows_removed_before_cursor(self):
+        # Позиция в курсоре не зависит от того, сколько строк осталось перед ней
+        expected = list(Car.objects.order_by('-comments_count', 'id').values_list('id', flat=True))
+        first = self.client.get('/api/cars/', {'ordering': '-comments_count', 'page_size': 2}).json()
+        Car.objects.filter(pk=first['results'][0]['id']).delete()
+        self.assertEqual([item['id'] for item in self.client.get(first['next']).json()['results']], expected[2:4])
+
+    def test_previous_link(self):
+        first = self.client.get('/api/cars/', {'ordering': '-comments_count', 'page_size': 3}).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+        self.assertEqual(back['next'], first['next'])
+        self.assertIsNone(back['previous'])
+        self.assertEqual(self.client.get('/api/cars/', {'cursor': 'испорчен'}).status_code, 404)
+
+
+class FastReadTests(TestCase):
+    """Путь через values() и orjson отдает те же байты, что сериализаторы и JSONRenderer"""
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalogue(manufactures=2, cars_per_manufacture=3, comments_per_car=3)
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=0)
+        car = Car.objects.first()
+        car.end_year = 2010
+        car.save()
+        Comment.objects.create(email='u@example.com', car=car, comment_text='Разделитель\u2028строк и "кавычки" \\ ок')
+        self.car = car
+
+    def assertSameOutput(self, url, params=None):
+        with override_settings(FAST_READ_ENABLED=False):
+            cache.clear()
+            expected = self.client.get(url, params)
+        cache.clear()
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, expected.status_code, url)
+        self.assertEqual(response.content, expected.content, url)
+        self.assertEqual(response.content, JSONRenderer().render(expected.data), url)
+
+    def test_lists_and_details(self):
+        for url in ('/api/countries/', '/api/manufactures/', '/api/cars/', '/api/comments/'):
+            self.assertSameOutput(url)
+            self.assertSameOutput(url, {'page_size': 2})
+        self.assertSameOutput('/api/cars/', {'ordering': '-comments_count', 'page_size': 3})
+        self.assertSameOutput('/api/cars/', {'manufacture': self.car.manufacture_id})
+        self.assertSameOutput('/api/comments/', {'car': self.car.pk})
+        self.assertSameOutput(f'/api/countries/{self.car.manufacture.country_id}/')
+        self.assertSameOutput(f'/api/manufactures/{self.car.manufacture_id}/')
+        self.assertSameOutput(f'/api/cars/{self.car.pk}/')
+        self.assertSameOutput(f'/api/comments/{Comment.objects.first().pk}/')
+        self.assertSameOutput('/api/cars/0/')
+
+    @override_settings(CAR_COMMENTS_LIMIT=2)
+    def test_comments_limit(self):
+        self.assertSameOutput('/api/cars/')
+        self.assertSameOutput(f'/api/cars/{self.car.pk}/')
+
+    def test_next_page(self):
+        response = self.client.get('/api/cars/', {'page_size': 2})
+        self.assertSameOutput(response.json()['next'])
+
+
+class ConditionalGetTests(TestCase):
+    """Повторный запрос с ETag получает 304, пока данные не изменились"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=1)
+        self.car = Car.objects.get()
+
+    def test_not_modified_until_new_comment(self):
+        url = f'/api/cars/{self.car.pk}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(email='new@example.com', car=self.car, comment_text='Новый комментарий к авто')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+@override_settings(REVIEWS_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    """Изменение сбрасывает после коммита только ответы, которые от него зависят"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=1)
+        self.car, self.other_car = Car.objects.order_by('id')
+
+    def assertCache(self, url, state):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], state, url)
+
+    def add_comment(self):
+        Comment.objects.create(email='new@example.com', car=self.car, comment_text='Новый комментарий к авто')
+
+    def test_hit_and_miss(self):
+        self.assertCache('/api/cars/', 'MISS')
+        self.assertCache('/api/cars/', 'HIT')
+        self.assertEqual(get_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_scoped_invalidation(self):
+        urls = [f'/api/cars/{self.car.pk}/', f'/api/cars/{self.other_car.pk}/', '/api/cars/', '/api/countries/']
+        for url in urls:
+            self.assertCache(url, 'MISS')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_comment()
+        self.assertCache(urls[0], 'MISS')
+        self.assertCache(urls[1], 'HIT')
+        self.assertCache(urls[2], 'MISS')
+        # Комментарий не меняет названия стран и производителей
+        self.assertCache(urls[3], 'HIT')
+
+    def test_invalidated_after_commit(self):
+        url = f'/api/cars/{self.car.pk}/'
+        self.assertCache(url, 'MISS')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.add_comment()
+            # До коммита ответ остается прежним: новую версию не займут еще старые данные
+            self.assertCache(url, 'HIT')
+        for callback in callbacks:
+            callback()
+        self.assertCache(url, 'MISS')
+
+
+class CatalogueSnapshotTests(TestCase):
+    """Снимок справочников обновляется после коммита и перечитывается, когда версию сменил другой процесс"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        cache.clear()
+        create_catalogue(manufactures=2, cars_per_manufacture=1, comments_per_car=1)
+        catalogue_snapshot.get()
+        self.manufacture = Manufacture.objects.order_by('name').first()
+
+    def test_committed_change_applied_without_reload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.manufacture.name = 'Я последний'
+            self.manufacture.save()
+        # Страница из БД, названия стран и автомобилей из обновленного снимка
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/countries/')
+        self.assertEqual(response.json()['results'][0]['manufactures'], ['Страна 0 производитель 1', 'Я последний'])
+
+    def test_rolled_back_change_not_applied(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            country = Country.objects.create(name='Откатится')
+        self.assertNotIn(country.pk, catalogue_snapshot.get().rows[Country])
+
+    def test_reload_after_change_in_other_process(self):
+        Country.objects.filter(pk=self.manufacture.country_id).update(name='Переименована в обход сигналов')
+        with self.assertNumQueries(0):
+            catalogue_snapshot.get()
+        cache.incr(VERSION_KEY)
+        with CaptureQueriesContext(connection) as queries:
+            data = catalogue_snapshot.get()
+        self.assertTrue(queries)
+        self.assertEqual(data.country_name(self.manufacture.country_id), 'Переименована в обход сигналов')
+
+    def test_related_object_from_other_process(self):
+        # Другой процесс перевел производителя в новую страну, а версия снимка еще не сменилась
+        country = Country.objects.create(name='Новая страна')
+        Manufacture.objects.filter(pk=self.manufacture.pk).update(country=country)
+        response = self.client.get('/api/manufactures/')
+        self.assertEqual(response.status_code, 200)
+        item = next(item for item in response.json()['results'] if item['id'] == self.manufacture.pk)
+        self.assertEqual(item['country_name'], 'Новая страна')
+
+    def test_stale_snapshot_does_not_reject_name(self):
+        # Другой процесс переименовал страну: прежнее название свободно, хотя снимок его еще помнит
+        Country.objects.filter(pk=self.manufacture.country_id).update(name='Переименована')
+        response = self.client.post('/api/countries/', {'name': 'Страна 0'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_exports_do_not_join(self):
+        for url in ('/api/manufactures/export/csv/', '/api/cars/export/csv/', '/api/comments/export/csv/'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+                content = b''.join(response.streaming_content).decode()
+            self.assertEqual(len(queries), 1, url)
+            self.assertNotIn('JOIN', queries.captured_queries[0]['sql'], url)
+            self.assertIn('Страна 0', content.splitlines()[1], url)
+
+
+class UniqueNameTests(TestCase):
+    """Дубликат названия в другом регистре отклоняется индексом БД с прежним сообщением"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        Country.objects.create(name='Germany')
+        catalogue_snapshot.invalidate()
+
+    def test_duplicate_name_case_insensitive(self):
+        response = self.client.post('/api/countries/', {'name': ' germany '}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'name': ['Страна с таким названием уже существует']})
+        self.assertEqual(Country.objects.count(), 1)
+
+    def test_update_keeps_own_name(self):
+        country = Country.objects.get()
+        response = self.client.put(f'/api/countries/{country.pk}/', {'name': 'GERMANY'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class FilterIndexUsageTests(TestCase):
+    """Каждый фильтр списка выполняется по своему составному индексу, а не полным просмотром"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        create_catalogue(manufactures=2, cars_per_manufacture=2, comments_per_car=2)
+        self.car = Car.objects.select_related('manufacture').first()
+        # Фильтры по автомобилю и email должны отбирать малую часть комментариев, как в настоящей базе
+        Comment.objects.bulk_create(
+            Comment(email=f'reader{i}@example.com', car=Car.objects.last(), comment_text='Комментарий')
+            for i in range(50)
+        )
+
+    def explain(self, sql, ordered=False):
+        """План запроса страницы в том виде, в каком его выполнил список, без правки текста SQL"""
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # На маленькой тестовой таблице PostgreSQL иначе выберет полный просмотр, а если индекс
+                # покрывает и порядок выдачи (ordered) - индекс по одному полю с сортировкой в памяти.
+                # Без статистики оценки зависят от того, сколько места таблицы заняли откаченные строки
+                # других тестов, и план меняется от прогона к прогону
+                cursor.execute('ANALYZE reviews_car, reviews_manufacture, reviews_comment')
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('SET LOCAL enable_sort = %s' % ('off' if ordered else 'on'))
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(str(row) for row in cursor.fetchall())
+
+    def assertListUsesIndex(self, url, params, index_name, ordered=False):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        # Первый запрос - выборка страницы списка, остальные - prefetch связанных объектов
+        plan = self.explain(queries.captured_queries[0]['sql'], ordered)
+        names = {index_name}
+        if connection.vendor == 'postgresql':
+            # У секционированной таблицы комментариев в плане индексы секций, прикрепленные к индексу таблицы
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT relid::text FROM pg_partition_tree(%s::regclass)', [index_name])
+                names.update(row[0] for row in cursor.fetchall())
+        self.assertTrue(any(name in plan for name in names), f'{url} {params}: индекс {index_name} не используется\n{plan}')
+
+    def test_comment_filters(self):
+        self.assertListUsesIndex('/api/comments/', {'car': self.car.pk}, 'reviews_comm_car_created_idx', ordered=True)
+        self.assertListUsesIndex('/api/comments/', {'email': 'user0@example.com'}, 'reviews_comm_email_created_idx',
+                                 ordered=True)
+        self.assertListUsesIndex('/api/comments/', {'created_after': '2024-01-01'}, 'reviews_comment_created_id_idx',
+                                 ordered=True)
+
+    def test_car_filters(self):
+        self.assertListUsesIndex('/api/cars/', {'manufacture': self.car.manufacture_id}, 'reviews_car_manuf_year_idx')
+        self.assertListUsesIndex('/api/cars/', {'release_year_min': 1990, 'release_year_max': 2005},
+                                 'reviews_car_release_year_idx')
+        self.assertListUsesIndex('/api/cars/', {'end_year_min': 2000, 'end_year_max': 2010}, 'reviews_car_end_year_idx')
+
+    def test_manufacture_filters(self):
+        self.assertListUsesIndex('/api/manufactures/', {'country': self.car.manufacture.country_id},
+                                 'reviews_manuf_country_name_idx')
+
+    def test_invalid_filter_value(self):
+        response = self.client.get('/api/cars/', {'release_year_min': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        for url, param in (('/api/comments/', 'car'), ('/api/cars/', 'manufacture'), ('/api/manufactures/', 'country')):
+            response = self.client.get(url, {param: '9' * 23})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn(param, response.json())
+        self.assertEqual(self.client.get('/api/cars/', {'manufacture': str(2 ** 63 - 1)}).json()['results'], [])
+
+
+class CommentsCounterTests(TestCase):
+    """Счетчики comments_count меняются вместе с комментариями и чинятся командой recount_comments"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        cache.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=2)
+        self.car, self.other_car = Car.objects.order_by('id')
+
+    def assertCounts(self, car_count, other_car_count):
+        self.car.refresh_from_db()
+        self.other_car.refresh_from_db()
+        self.assertEqual((self.car.comments_count, self.other_car.comments_count), (car_count, other_car_count))
+        self.assertEqual(self.car.manufacture.__class__.objects.get().comments_count, car_count + other_car_count)
+
+    def test_api_create_move_delete(self):
+        response = self.client.post('/api/comments/', {
+            'email': 'new@example.com', 'car': self.car.pk, 'comment_text': 'Новый отзыв об автомобиле',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertCounts(3, 2)
+
+        comment_id = response.json()['id']
+        self.client.patch(f'/api/comments/{comment_id}/', {'car': self.other_car.pk}, format='json')
+        self.assertCounts(2, 3)
+
+        self.client.delete(f'/api/comments/{comment_id}/')
+        self.assertCounts(2, 2)
+
+    def test_bulk_create(self):
+        items = [{'email': 'bulk@example.com', 'car': self.other_car.pk, 'comment_text': 'Отзыв из массовой загрузки'}] * 3
+        response = self.client.post('/api/comments/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertCounts(2, 5)
+
+    def test_car_update_keeps_counter(self):
+        response = self.client.patch(f'/api/cars/{self.car.pk}/', {'release_year': 2001}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comments_count'], 2)
+        self.assertCounts(2, 2)
+
+    def test_recount_repairs_drift(self):
+        Car.objects.filter(pk=self.car.pk).update(comments_count=100)
+        call_command('recount_comments', stdout=StringIO())
+        self.assertCounts(2, 2)
+
+    def test_car_delete_handles_comments_at_once(self):
+        Comment.objects.bulk_create(
+            Comment(email='bulk@example.com', car=self.other_car, comment_text='Отзыв из массовой загрузки')
+            for _ in range(50)
+        )
+        call_command('recount_comments', stdout=StringIO())
+        manufacture = self.car.manufacture
+        # Число запросов не зависит от числа комментариев: каскад обрабатывается один раз, а не по сигналу на комментарий
+        with CaptureQueriesContext(connection) as few:
+            self.client.delete(f'/api/cars/{self.car.pk}/')
+        manufacture.refresh_from_db()
+        self.assertEqual(manufacture.comments_count, 52)
+        with CaptureQueriesContext(connection) as many:
+            self.client.delete(f'/api/cars/{self.other_car.pk}/')
+        manufacture.refresh_from_db()
+        self.assertEqual(manufacture.comments_count, 0)
+        self.assertEqual(len(few), len(many))
+
+
+class CommentBulkTests(TestCase):
+    """POST /api/comments/bulk/: ошибки по строкам, лимит на число комментариев, счетчики и кеш"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        cache.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=1)
+        self.car = Car.objects.get()
+
+    def item(self, **fields):
+        return {'email': 'bulk@example.com', 'car': self.car.pk, 'comment_text': 'Отзыв из массовой загрузки', **fields}
+
+    def post_ndjson(self, lines):
+        return self.client.post('/api/comments/bulk/', '\n'.join(lines).encode(), content_type='application/x-ndjson')
+
+    def test_validation_errors(self):
+        items = [self.item(), self.item(car=self.car.pk + 100), self.item(email='не почта'), self.item(car='abc'),
+                 self.item(comment_text='')]
+        response = self.client.post('/api/comments/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2, 3, 4])
+        self.assertIn('car', data['errors'][0]['errors'])
+        self.assertIn('email', data['errors'][1]['errors'])
+
+        response = self.client.post('/api/comments/bulk/', items[1:], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 0)
+        self.assertEqual(self.client.post('/api/comments/bulk/', self.item(), format='json').status_code, 400)
+        response = self.client.post('/api/comments/bulk/', [], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('detail', response.json())
+        # id больше bigint - такой же отсутствующий автомобиль, а не ошибка сервера
+        response = self.client.post('/api/comments/bulk/', [self.item(car=10 ** 23)], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('car', response.json()['errors'][0]['errors'])
+        response = self.post_ndjson([json.dumps(self.item()), '{"email": '])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('строке 2', response.json()['detail'])
+
+    @override_settings(COMMENTS_BULK_MAX_ITEMS=2)
+    def test_item_limit(self):
+        response = self.post_ndjson([json.dumps(self.item())] * 2 + [''])
+        self.assertEqual(response.status_code, 201)
+        # Разбор останавливается на первой лишней строке, до испорченной дальше дело не доходит
+        response = self.post_ndjson([json.dumps(self.item())] * 3 + ['{"email": '])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('не больше 2 комментариев', response.json()['detail'])
+        response = self.client.post('/api/comments/bulk/', [self.item()] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('не больше 2 комментариев', response.json()['detail'])
+        self.assertEqual(Comment.objects.count(), 3)
+
+    @override_settings(REVIEWS_CACHE_ENABLED=True)
+    def test_counters_and_cache(self):
+        url = f'/api/cars/{self.car.pk}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_ndjson([json.dumps(self.item())] * 3)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['ids']), 3)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['comments_count'], 4)
+        self.assertEqual(Manufacture.objects.get().comments_count, 4)
+
+
+class CommentSearchTests(TestCase):
+    """Поиск по комментариям: ранжирование, все слова обязательны, фильтры и keyset курсор"""
+
+    def setUp(self):
+        self.client = APIClient()
+        inverted_index.reset()
+        create_catalogue(manufactures=2, cars_per_manufacture=1, comments_per_car=0)
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=0)
+        self.car, self.other_car, self.foreign_car = Car.objects.select_related('manufacture').order_by('id')
+        texts = [
+            (self.car, 'Двигатель двигатель двигатель шумный'),
+            (self.car, 'Двигатель тихий, салон удобный, подвеска мягкая, руль легкий'),
+            (self.other_car, 'Двигатель шумный'),
+            (self.other_car, 'Салон шумный'),
+        ]
+        self.loud, self.quiet, self.other, self.salon = (
+            Comment.objects.create(email='search@example.com', car=car, comment_text=text) for car, text in texts
+        )
+
+    def search(self, **params):
+        response = self.client.get('/api/comments/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_ranking_and_all_words(self):
+        ids = self.search(q='двигатель')
+        self.assertEqual(ids[0], self.loud.pk)
+        self.assertEqual(set(ids), {self.loud.pk, self.quiet.pk, self.other.pk})
+        self.assertEqual(set(self.search(q='шумный двигатель')), {self.loud.pk, self.other.pk})
+        self.assertEqual(self.search(q='двигатель коробка'), [])
+
+    def test_filters(self):
+        self.assertEqual(set(self.search(q='шумный', car=self.other_car.pk)), {self.other.pk, self.salon.pk})
+        self.assertEqual(set(self.search(q='двигатель', manufacture=self.car.manufacture_id)),
+                         {self.loud.pk, self.quiet.pk})
+        self.assertEqual(self.search(q='двигатель', country=self.foreign_car.manufacture.country_id), [])
+        self.assertEqual(self.client.get('/api/comments/search/', {'q': 'двигатель', 'car': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/search/', {'q': 'двигатель', 'car': '9' * 23}).status_code, 400)
+        self.assertEqual(self.client.get('/api/comments/search/', {'q': ' '}).status_code, 400)
+
+    def test_cursor_pages(self):
+        # Одинаковые тексты дают одинаковый ранг, и порядок внутри него держится на id
+        same = [Comment.objects.create(email='search@example.com', car=self.foreign_car, comment_text='Двигатель мощный').pk
+                for _ in range(5)]
+        ids, ranks = [], []
+        url, params = '/api/comments/search/', {'q': 'двигатель', 'page_size': 2}
+        while url:
+            data = self.client.get(url, params).json()
+            params = None
+            ids += [item['id'] for item in data['results']]
+            ranks += [item['rank'] for item in data['results']]
+            url = data['next']
+        self.assertEqual(len(ids), 8)
+        self.assertEqual(set(ids), set(same) | {self.loud.pk, self.quiet.pk, self.other.pk})
+        self.assertEqual(list(zip(ranks, ids)), sorted(zip(ranks, ids), reverse=True))
+        self.assertEqual(self.client.get('/api/comments/search/', {'q': 'двигатель', 'cursor': 'испорчен'}).status_code,
+                         400)
+
+
+class ExportJobTests(TestCase):
+    """Фоновые выгрузки: одинаковые запросы делят одно задание, готовый файл совпадает с синхронным экспортом"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        cache.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=2)
+        jobs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(jobs_dir.cleanup)
+        settings_override = override_settings(EXPORT_JOBS_DIR=jobs_dir.name, EXPORT_JOBS_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_inflight_requests_are_deduplicated(self):
+        # Без commit задание остается в очереди, как будто воркер еще не успел его взять
+        ids = {self.client.post('/api/comments/export/', {'format': 'xlsx'}, format='json').json()['id']
+               for _ in range(3)}
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+        other = self.client.post('/api/comments/export/', {'format': 'csv'}, format='json').json()
+        self.assertNotIn(other['id'], ids)
+
+    def test_finished_job_download(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/cars/export/', {'format': 'csv'}, format='json')
+        self.assertEqual(response.status_code, 202)
+
+        job = self.client.get(response['Location']).json()
+        self.assertEqual(job['status'], 'done')
+        download = self.client.get(job['download_url'])
+        self.assertEqual(download.status_code, 200)
+        expected = b''.join(self.client.get('/api/cars/export/csv/').streaming_content)
+        self.assertEqual(b''.join(download.streaming_content), expected)
+
+        # После завершения такая же выгрузка строится заново, а не возвращает старое задание
+        with self.captureOnCommitCallbacks(execute=True):
+            again = self.client.post('/api/cars/export/', {'format': 'csv'}, format='json').json()
+        self.assertNotEqual(again['id'], job['id'])
+
+    def test_pending_job_download_conflict(self):
+        job = self.client.post('/api/comments/export/', {}, format='json').json()
+        self.assertEqual(job['format'], 'xlsx')
+        self.assertEqual(self.client.get(f'/api/export-jobs/{job["id"]}/download/').status_code, 409)
+
+    def test_invalid_format(self):
+        response = self.client.post('/api/comments/export/', {'format': 'pdf'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(EXPORT_JOBS_RETENTION=0)
+    def test_cleanup_removes_expired_files(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post('/api/cars/export/', {'format': 'xlsx'}, format='json').json()['id']
+        call_command('cleanup_export_jobs', stdout=StringIO())
+        self.assertFalse(ExportJob.objects.filter(pk=job_id).exists())
+        self.assertEqual(self.client.get(f'/api/export-jobs/{job_id}/download/').status_code, 404)
+
+
+class CatalogueExportTests(TestCase):
+    """Выгрузка каталога совпадает с четырьмя отдельными экспортами"""
+
+    def setUp(self):
+        self.client = APIClient()
+        create_catalogue(manufactures=2, cars_per_manufacture=2, comments_per_car=2)
+        Comment.objects.create(email='long@example.com', car=Car.objects.first(), comment_text='Очень ' * 40)
+
+    def test_zip_matches_csv_exports(self):
+        response = self.client.get('/api/catalogue/export/zip/')
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            for name in ('countries', 'manufactures', 'cars', 'comments'):
+                expected = b''.join(self.client.get(f'/api/{name}/export/csv/').streaming_content)
+                self.assertEqual(archive.read(f'{name}.csv'), expected, name)
+
+    def test_xlsx_has_sheet_per_model(self):
+        response = self.client.get('/api/catalogue/export/xlsx/')
+        self.assertEqual(response.status_code, 200)
+        workbook = load_workbook(BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['countries', 'manufactures', 'cars', 'comments'])
+        for name in workbook.sheetnames:
+            single = load_workbook(BytesIO(b''.join(self.client.get(f'/api/{name}/export/xlsx/').streaming_content)),
+                                   read_only=True)
+            self.assertEqual(list(workbook[name].values), list(single.active.values), name)
+
+    def test_parents_created_after_their_table_was_read(self):
+        def fetch_without_parents():
+            # Страны, производители и автомобили прочитаны раньше, чем появились их дочерние строки
+            return {**fetch_catalogue(), 'countries': [], 'manufactures': [], 'cars': []}
+
+        with mock.patch('reviews.catalogue_export.fetch_catalogue', fetch_without_parents):
+            response = self.client.get('/api/catalogue/export/zip/')
+            content = b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            comments = list(csv.reader(archive.read('comments.csv').decode().splitlines()))[1:]
+        self.assertEqual(len(comments), Comment.objects.count())
+        # Автомобиль, производитель и страна пустые, как в отдельном экспорте
+        self.assertEqual({tuple(row[2:5]) for row in comments}, {('', '', '')})
+
+
+class AsyncReadPathTests(TestCase):
+    """Асинхронные /api/async/... отдают те же данные, что и обычные вьюсеты"""
+
+    def setUp(self):
+        create_catalogue(manufactures=2, cars_per_manufacture=3, comments_per_car=3)
+
+    async def collect_pages(self, url):
+        results = []
+        while url:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            results += data['results']
+            url = data['next']
+        return results
+
+    async def test_list_pages_match_sync_list(self):
+        for name in ('countries', 'manufactures', 'cars', 'comments'):
+            sync_results = (await self.async_client.get(f'/api/{name}/', {'page_size': 100})).json()['results']
+            async_results = await self.collect_pages(f'/api/async/{name}/?page_size=4')
+            self.assertEqual(async_results, sync_results, name)
+
+    async def test_ordering_matches_sync_list(self):
+        # У части автомобилей одинаковое число комментариев, порядок внутри него держится на id
+        await Car.objects.filter(pk__in=[car.pk async for car in Car.objects.order_by('id')[:2]]).aupdate(comments_count=7)
+        for ordering in ('-comments_count', 'release_year', '-name'):
+            sync_results = (await self.async_client.get('/api/cars/', {'ordering': ordering, 'page_size': 100})).json()
+            async_results = await self.collect_pages(f'/api/async/cars/?ordering={ordering}&page_size=2')
+            self.assertEqual(async_results, sync_results['results'], ordering)
+
+    async def test_filters_and_detail(self):
+        car = await Car.objects.afirst()
+        response = await self.async_client.get('/api/async/comments/', {'car': car.pk})
+        self.assertEqual(len(response.json()['results']), 3)
+
+        response = await self.async_client.get(f'/api/async/cars/{car.pk}/')
+        self.assertEqual(response.json(), (await self.async_client.get(f'/api/cars/{car.pk}/')).json())
+        self.assertEqual((await self.async_client.get('/api/async/cars/0/')).status_code, 404)
+
+        self.assertEqual((await self.async_client.get('/api/async/cars/', {'release_year_min': 'x'})).status_code, 400)
+        self.assertEqual((await self.async_client.get('/api/async/cars/', {'cursor': 'broken'})).status_code, 400)
+
+    async def test_csv_export_matches_sync_export(self):
+        response = await self.async_client.get('/api/async/comments/export/csv/')
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        expected = await self.async_client.get('/api/comments/export/csv/')
+        # Обычный экспорт читает БД синхронно, поэтому его содержимое собираю в потоке
+        self.assertEqual(content, await sync_to_async(b''.join)(expected.streaming_content))
+
+
+class MetricsTests(TestCase):
+    """Middleware метрик считает SQL запросы по эндпоинтам и отдает их на /metrics"""
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        registry.clear()
+        create_catalogue(manufactures=2, cars_per_manufacture=2, comments_per_car=2)
+        catalogue_snapshot.get()
+
+    def metrics(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_query_count_histogram(self):
+        self.client.get('/api/cars/')
+        metrics = self.metrics()
+        self.assertIn('reviews_requests_total{view="car-list",method="GET",status="200"} 1', metrics)
+        # Список автомобилей - два запроса: страница и комментарии к ней
+        self.assertIn('reviews_request_queries_bucket{view="car-list",method="GET",le="1"} 0', metrics)
+        self.assertIn('reviews_request_queries_bucket{view="car-list",method="GET",le="2"} 1', metrics)
+        self.assertIn('reviews_cache_requests_total{result="misses"}', metrics)
+
+    def test_streaming_export_measured_until_end(self):
+        response = self.client.get('/api/comments/export/csv/')
+        size = len(b''.join(response.streaming_content))
+        response.close()
+        metrics = self.metrics()
+        self.assertIn(f'reviews_response_size_bytes_sum{{view="comment-export-csv",method="GET"}} {size}', metrics)
+        self.assertIn('reviews_request_queries_bucket{view="comment-export-csv",method="GET",le="0"} 0', metrics)
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/api/countries/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(SLOW_REQUEST_MS=0.001)
+    def test_slow_request_log(self):
+        with self.assertLogs('reviews.metrics', level='WARNING') as logs:
+            self.client.get('/api/manufactures/')
+        self.assertIn('manufacture-list', logs.output[0])
+
+    def test_async_capable(self):
+        # Под ASGI middleware - корутина, и Django не переводит остальную цепочку в поток
+        async def get_response(request):
+            return None
+        self.assertTrue(iscoroutinefunction(MetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(MetricsMiddleware(lambda request: None)))
+
+    async def test_async_request_measured(self):
+        response = await self.async_client.get('/api/async/cars/')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get('/api/async/comments/export/csv/')
+        size = len(b''.join([chunk async for chunk in response.streaming_content]))
+        metrics = await sync_to_async(self.metrics)()
+        # SQL запросы идут в потоках sync_to_async и все равно попадают в метрики запроса
+        self.assertIn('reviews_request_queries_bucket{view="async-car-list",method="GET",le="0"} 0', metrics)
+        self.assertIn(f'reviews_response_size_bytes_sum{{view="reviews.async_views.AsyncCSVExportView",method="GET"}} {size}',
+                      metrics)
+
+
+class SeedReviewsTests(TestCase):
+    """Команда seed_reviews заполняет пустую базу и пересчитывает счетчики"""
+
+    def test_seed_and_clear(self):
+        out = StringIO()
+        call_command('seed_reviews', countries=3, manufactures=5, cars=10, comments=50, stdout=out)
+        self.assertEqual((Country.objects.count(), Manufacture.objects.count(), Car.objects.count()), (3, 5, 10))
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertEqual(sum(Car.objects.values_list('comments_count', flat=True)), 50)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_reviews', cars=10, comments=50, stdout=out)
+        call_command('seed_reviews', countries=1, manufactures=1, cars=1, comments=2, clear=True, stdout=out)
+        self.assertEqual((Car.objects.count(), Comment.objects.count()), (1, 2))
+
+
+class ImportReviewsTests(TestCase):
+    """Команда import_reviews читает CSV, XLSX и NDJSON, ищет связи по названиям и не дублирует комментарии"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            csv.writer(file).writerows(rows)
+        return path
+
+    def import_file(self, path):
+        out = StringIO()
+        call_command('import_reviews', path, stdout=out)
+        return out.getvalue()
+
+    def test_catalogue_from_files(self):
+        self.import_file(self.write_csv('countries.csv', [['ID', 'Country Name'], ['1', 'Германия'], ['2', 'германия'],
+                                                          ['3', '']]))
+        self.assertEqual(list(Country.objects.values_list('name', flat=True)), ['Германия'])
+
+        wb = Workbook()
+        wb.active.append(['ID', 'Manufacture Name', 'Country'])
+        wb.active.append([1, 'BMW', 'ГЕРМАНИЯ'])
+        wb.active.append([2, 'Lada', 'Неизвестная страна'])
+        path = os.path.join(self.directory, 'manufactures.xlsx')
+        wb.save(path)
+        self.import_file(path)
+        self.assertEqual(list(Manufacture.objects.values_list('name', 'country__name')), [('BMW', 'Германия')])
+
+        path = os.path.join(self.directory, 'cars.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('{"Model": "X5", "Manufacture": "bmw", "Start Year": 1999, "End Year": "Present"}\n\n')
+            file.write('{"Model": "X3", "Manufacture": "bmw", "Start Year": "2003", "End Year": "2010"}\n')
+            file.write('{"Model": "M3", "Manufacture": "bmw", "Start Year": "когда-то"}\n')
+            file.write('{"Model": "Нива", "Manufacture": "Lada", "Start Year": "1977"}\n')
+        out = self.import_file(path)
+        self.assertIn('загружено 2, пропущено 2', out)
+        self.assertEqual(list(Car.objects.order_by('name').values_list('name', 'release_year', 'end_year')),
+                         [('X3', 2003, 2010), ('X5', 1999, None)])
+
+    def test_comments_reimport_skips_duplicates(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=3)
+        car = Car.objects.order_by('id').first()
+        Comment.objects.create(email='long@example.com', car=car, comment_text='Очень длинный отзыв. ' * 10)
+        client = APIClient(HTTP_AUTHORIZATION='Token test')
+        path = os.path.join(self.directory, 'comments.csv')
+        with open(path, 'wb') as file:
+            file.write(b''.join(client.get('/api/comments/export/csv/').streaming_content))
+        with open(path, 'a', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['', 'new@example.com', car.name, '', '', '2024-01-02 03:04:05', 'Новый отзыв'])
+            writer.writerow(['', 'new@example.com', car.name, '', '', '2024-01-02 03:04:05', 'Новый отзыв'])
+            writer.writerow(['', 'bad@example.com', 'Неизвестный автомобиль', '', '', '2024-01-02 03:04:05', 'Отзыв'])
+            writer.writerow(['', 'bad@example.com', car.name, '', '', 'вчера', 'Отзыв'])
+
+        # В БД уже есть все комментарии выгрузки, новый только один, и в файле он повторяется
+        out = self.import_file(path)
+        self.assertIn('загружено 1, пропущено 10', out)
+        self.assertIn('пропущено 8 уже загруженных комментариев', out)
+        self.assertIn('у 1 комментариев текст обрезан', out)
+        self.assertEqual(Comment.objects.count(), 8)
+        self.assertIn('загружено 0, пропущено 11', self.import_file(path))
+
+        # В пустую базу переносится все, длинный текст - в том виде, в каком его обрезала выгрузка
+        Comment.objects.all().delete()
+        self.assertIn('загружено 8, пропущено 3', self.import_file(path))
+        self.assertEqual(len(Comment.objects.get(email='long@example.com').comment_text), 103)
+        car.refresh_from_db()
+        self.assertEqual(car.comments_count, 5)
+
+
+class AdminChangelistTests(TestCase):
+    """Список комментариев в админке не делает запросов на каждую строку и не просматривает всю таблицу"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def changelist(self, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/reviews/comment/', params or {})
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_queries_do_not_grow_with_rows(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=1)
+        _, small = self.changelist()
+        create_catalogue(manufactures=3, cars_per_manufacture=3, comments_per_car=5)
+        _, large = self.changelist()
+        self.assertEqual(len(small), len(large), '\n'.join(large))
+
+    def test_date_hierarchy_without_distinct(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=2)
+        comments = list(Comment.objects.order_by('id'))
+        for comment, created_at in zip(comments, ('2022-03-05', '2022-03-20', '2024-07-01', '2024-11-11')):
+            Comment.objects.filter(pk=comment.pk).update(created_at=f'{created_at}T12:00:00Z')
+
+        response, queries = self.changelist()
+        self.assertContains(response, 'created_at__year=2022')
+        self.assertContains(response, 'created_at__year=2024')
+        self.assertNotContains(response, 'created_at__year=2023')
+        response, queries = self.changelist({'created_at__year': 2024})
+        self.assertContains(response, 'created_at__month=7')
+        self.assertContains(response, 'created_at__month=11')
+        self.assertNotContains(response, 'created_at__month=8')
+        response, queries = self.changelist({'created_at__year': 2022, 'created_at__month': 3})
+        self.assertContains(response, 'created_at__day=5')
+        self.assertContains(response, 'created_at__day=20')
+        self.assertFalse([sql for sql in queries if 'DISTINCT' in sql])
+
+    def test_car_filter_and_autocomplete(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=2)
+        car = Car.objects.first()
+        response, _ = self.changelist({'car': car.pk})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response, _ = self.changelist({'car': 'abc'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+        response = self.client.get(f'/admin/reviews/comment/{Comment.objects.first().pk}/change/')
+        self.assertContains(response, 'admin-autocomplete')
+
+    def test_estimated_count(self):
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=3)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=0):
+            with CaptureQueriesContext(connection) as queries:
+                count = EstimatedCountPaginator(Comment.objects.all(), 100).count
+        if connection.vendor == 'postgresql':
+            # Оценка по статистике, точного COUNT(*) нет
+            self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+        else:
+            self.assertEqual(count, 3)
+        self.assertEqual(EstimatedCountPaginator(Comment.objects.all(), 100).count, 3)
+
+
+async def read_async(content):
+    return b''.join([chunk async for chunk in content])
+
+
+@override_settings(THROTTLE_ENABLED=True, THROTTLE_CAPACITY=100, THROTTLE_REFILL_RATE=1, THROTTLE_COSTS={'export_csv': 20},
+                   API_ACCESS_TOKEN='secret')
+class ThrottlingTests(TestCase):
+    """Экспорт списывает из корзины клиента больше жетонов, чем чтение, корзины клиентов независимы"""
+
+    def setUp(self):
+        cache.clear()
+        local_store.clear()
+        create_catalogue(manufactures=1, cars_per_manufacture=1, comments_per_car=2)
+        patcher = mock.patch('reviews.throttling.time')
+        self.clock = patcher.start().time
+        self.clock.return_value = 1000.0
+        self.addCleanup(patcher.stop)
+
+    def exhaust(self, url='/api/comments/export/csv/', **extra):
+        # Экспорт CSV стоит 20 жетонов из 100
+        for _ in range(5):
+            response = self.client.get(url, **extra)
+            self.assertEqual(response.status_code, 200)
+            # Дочитываю ответ: close() без чтения закрыл бы соединение с PostgreSQL
+            if response.is_async:
+                async_to_sync(read_async)(response.streaming_content)
+            else:
+                b''.join(response.streaming_content)
+
+    def test_export_exhausts_bucket(self):
+        self.exhaust()
+        response = self.client.get('/api/comments/export/csv/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        # Чтение дешевле, но корзина пуста
+        self.assertEqual(self.client.get('/api/comments/').status_code, 429)
+
+        self.clock.return_value = 1001.0
+        self.assertEqual(self.client.get('/api/comments/').status_code, 200)
+        self.clock.return_value = 1021.0
+        self.assertEqual(self.client.get('/api/comments/export/csv/').status_code, 200)
+
+    def test_clients_have_separate_buckets(self):
+        self.exhaust()
+        self.assertEqual(self.client.get('/api/comments/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+        self.assertEqual(self.client.get('/api/comments/', HTTP_AUTHORIZATION='Token secret').status_code, 200)
+        # Неверный токен не дает новой корзины, и подделанный X-Forwarded-For тоже
+        self.assertEqual(self.client.get('/api/comments/', HTTP_AUTHORIZATION='Token other').status_code, 429)
+        self.assertEqual(self.client.get('/api/comments/', HTTP_X_FORWARDED_FOR='10.0.0.3').status_code, 429)
+
+    def test_async_views_share_buckets(self):
+        self.exhaust('/api/async/comments/export/csv/')
+        response = self.client.get('/api/comments/export/csv/')
+        self.assertEqual(response.status_code, 429)
+        response = self.client.get('/api/async/comments/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    @override_settings(THROTTLE_SHARED=True)
+    def test_shared_cache_store(self):
+        self.exhaust()
+        self.assertEqual(self.client.get('/api/comments/export/csv/').status_code, 429)
+        self.assertEqual(local_store.buckets, {})
+        cache.clear()
+        self.assertEqual(self.client.get('/api/comments/export/csv/').status_code, 200)
+
+    @override_settings(THROTTLE_SHARED=True)
+    async def test_shared_store_outside_event_loop(self):
+        threads = []
+
+        def take_tokens(*args):
+            threads.append(threading.current_thread())
+
+        with mock.patch('reviews.async_views.take_tokens', side_effect=take_tokens):
+            response = await self.async_client.get('/api/async/cars/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class CommentArchiveTests(TestCase):
+    """Старые месяцы уходят из БД в архив и видны в API только с ?include_archived=true"""
+
+    def setUp(self):
+        self.client = APIClient(HTTP_AUTHORIZATION='Token test')
+        cache.clear()
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        settings_override = override_settings(COMMENTS_ARCHIVE_DIR=archive_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.archive_dir = archive_dir.name
+
+        create_catalogue(manufactures=1, cars_per_manufacture=2, comments_per_car=3)
+        self.first_car, self.second_car = Car.objects.order_by('id')
+        # Два комментария первого автомобиля и один второго переезжают в март 2020 года
+        self.month = date(2020, 3, 1)
+        ids = list(Comment.objects.order_by('id').values_list('id', flat=True))
+        self.old_ids = [ids[0], ids[1], ids[3]]
+        for hour, pk in enumerate(self.old_ids):
+            Comment.objects.filter(pk=pk).update(created_at=datetime(2020, 3, 10, hour, tzinfo=dt_timezone.utc))
+        self.all_ids = list(Comment.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def archive(self):
+        call_command('archive_comments', keep_months=12, stdout=StringIO())
+
+    def read_pages(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids += [item['id'] for item in data['results']]
+            url = data['next']
+        return ids
+
+    def test_archive_and_read_back(self):
+        self.archive()
+        self.assertFalse(Comment.objects.filter(pk__in=self.old_ids).exists())
+        archive = CommentArchive.objects.get()
+        self.assertEqual((archive.month, archive.rows), (self.month, 3))
+        with gzip.open(f'{self.archive_dir}/{archive.file_name}', 'rt', encoding='utf-8') as file:
+            self.assertEqual(len(file.readlines()), 3)
+        self.first_car.refresh_from_db()
+        self.second_car.refresh_from_db()
+        self.assertEqual((self.first_car.comments_count, self.second_car.comments_count), (1, 2))
+
+        self.assertEqual(len(self.client.get('/api/comments/').json()['results']), 3)
+        self.assertEqual(self.read_pages('/api/comments/?include_archived=true&page_size=2'), self.all_ids)
+        self.assertEqual(
+            self.read_pages(f'/api/comments/?include_archived=true&car={self.second_car.pk}&created_before=2021-01-01'),
+            [self.old_ids[2]],
+        )
+
+        self.assertEqual(self.client.get(f'/api/comments/{self.old_ids[0]}/').status_code, 404)
+        response = self.client.get(f'/api/comments/{self.old_ids[0]}/?include_archived=true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['car'], self.first_car.pk)
+        self.assertEqual(response.json()['created_at'], '2020-03-10T00:00:00Z')
+
+        export = b''.join(self.client.get('/api/comments/export/csv/?include_archived=true').streaming_content)
+        self.assertEqual(len(export.decode().splitlines()), 7)
+
+    def test_rearchive_appends_to_file(self):
+        self.archive()
+        late = Comment.objects.create(email='late@example.com', car=self.second_car, comment_text='Поздний импорт',
+                                      created_at=datetime(2020, 3, 20, tzinfo=dt_timezone.utc))
+        self.assertEqual(archive_month(self.month), 1)
+        archive = CommentArchive.objects.get()
+        self.assertEqual((archive.rows, archive.max_id), (4, late.pk))
+        ids = self.read_pages('/api/comments/?include_archived=true&created_before=2021-01-01')
+        self.assertEqual(ids, [late.pk] + [pk for pk in self.all_ids if pk in self.old_ids])
+
+    def test_failed_archive_keeps_previous_file(self):
+        self.archive()
+        archive = CommentArchive.objects.get()
+        late = Comment.objects.create(email='late@example.com', car=self.second_car, comment_text='Поздний импорт',
+                                      created_at=datetime(2020, 3, 20, tzinfo=dt_timezone.utc))
+        # Пока писался файл, в месяце изменилось число комментариев
+        with mock.patch('reviews.archive.delete_month', return_value=0), self.assertRaises(RuntimeError):
+            archive_month(self.month)
+        self.assertTrue(Comment.objects.filter(pk=late.pk).exists())
+        self.assertEqual(CommentArchive.objects.get().file_name, archive.file_name)
+        self.assertEqual(os.listdir(self.archive_dir), [archive.file_name])
+        ids = self.read_pages('/api/comments/?include_archived=true&created_before=2021-01-01')
+        self.assertEqual(ids, [late.pk] + [pk for pk in self.all_ids if pk in self.old_ids])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Секции есть только на PostgreSQL')
+    def test_month_partition_is_dropped(self):
+        self.assertTrue(is_partitioned())
+        # В TestCase все идет одной транзакцией, а удалить таблицу с отложенными проверками внешних ключей нельзя
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        # Строки марта лежат в секции по умолчанию и переезжают в новую секцию
+        create_partition(self.month)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT DISTINCT tableoid::regclass::text FROM reviews_comment WHERE id = ANY(%s)', [self.old_ids])
+            self.assertEqual(cursor.fetchall(), [(partition_name(self.month),)])
+
+        self.archive()
+        self.assertNotIn(partition_name(self.month), list_partitions())
+        self.assertEqual(CommentArchive.objects.get().rows, 3)
+        self.assertEqual(Comment.objects.count(), 3)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'Секции есть только на PostgreSQL')
+    def test_partition_command_creates_months_ahead(self):
+        ahead = date.today().replace(day=1) + timedelta(days=31 * 8)
+        Comment.objects.create(email='future@example.com', car=self.first_car, comment_text='Из будущего',
+                               created_at=datetime(ahead.year, ahead.month, 2, tzinfo=dt_timezone.utc))
+        call_command('partition_comments', ahead=9, stdout=StringIO())
+        # Мартовские комментарии из секции по умолчанию тоже получают свою секцию
+        self.assertTrue({partition_name(ahead.replace(day=1)), partition_name(self.month)} <= list_partitions())
+        self.assertEqual(Comment.objects.filter(pk__in=self.old_ids).count(), 3)
+        self.assertEqual(Comment.objects.filter(email='future@example.com').count(), 1)
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    """Постоянные соединения с БД по умолчанию только под WSGI, под ASGI - новое соединение или пул"""
+
+    def database(self, **env):
+        names = ('DB_CONN_MAX_AGE', 'DB_POOL', 'DJANGO_SERVER_INTERFACE', 'WEB_CONCURRENCY', 'REDIS_URL')
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'django.db.backends.postgresql', **env}):
+            for name in set(names) - set(env):
+                os.environ.pop(name, None)
+            return runpy.run_path(project_settings.__file__)['DATABASES']['default']
+
+    def test_conn_max_age_default(self):
+        self.assertEqual(self.database(DJANGO_SERVER_INTERFACE='wsgi')['CONN_MAX_AGE'], 60)
+        self.assertEqual(self.database()['CONN_MAX_AGE'], 0)
+        self.assertEqual(self.database(DB_CONN_MAX_AGE='30')['CONN_MAX_AGE'], 30)
+
+    def test_pool_disables_persistent_connections(self):
+        database = self.database(DJANGO_SERVER_INTERFACE='wsgi', DB_POOL='True')
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool']['max_size'], 10)
+        self.assertNotIn('OPTIONS', self.database(DB_POOL='True', DB_ENGINE='django.db.backends.sqlite3'))
 
-# Create your tests here.
@@ -0,0 +1,121 @@
+"""
+Ограничение частоты запросов по алгоритму token bucket.
+
+У каждого клиента своя корзина на THROTTLE_CAPACITY жетонов, которая пополняется со скоростью
+THROTTLE_REFILL_RATE жетонов в секунду. Запрос списывает столько жетонов, сколько стоит его действие
+(THROTTLE_COSTS): экспорт стоит намного дороже чтения списка, поэтому клиент, который без остановки
+качает выгрузки, быстро получает 429 и не занимает воркеры, а дешевые запросы остальных не ждут.
+
+Клиент - это API токен, если он передан и верен, иначе адрес (с учетом NUM_PROXIES из REST_FRAMEWORK).
+Корзины хранятся в памяти процесса, с THROTTLE_SHARED=True - в кеше reviews, который с REDIS_URL общий
+для всех воркеров.
+"""
+import hashlib
+import hmac
+import math
+import threading
+import time
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+from .cache import get_cache
+
+BUCKET_PREFIX = 'reviews:throttle:'
+# Сколько корзин держать в памяти процесса, прежде чем выбрасывать уже полные
+LOCAL_BUCKETS_LIMIT = 10000
+
+
+def refill(tokens, updated_at, now, capacity, rate):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def spend(bucket, cost, now, capacity, rate):
+    """
+    Новое состояние корзины (жетоны, время) и сколько секунд ждать, если жетонов не хватает.
+    При отказе жетоны не списываются.
+    """
+    tokens = capacity if bucket is None else refill(*bucket, now, capacity, rate)
+    if tokens >= cost:
+        return (tokens - cost, now), None
+    return (tokens, now), (cost - tokens) / rate
+
+
+class LocalBucketStore:
+    """Корзины в памяти процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, cost, now, capacity, rate):
+        with self.lock:
+            self.buckets[key], wait = spend(self.buckets.get(key), cost, now, capacity, rate)
+            if len(self.buckets) > LOCAL_BUCKETS_LIMIT:
+                self.prune(now, capacity, rate)
+            return wait
+
+    def prune(self, now, capacity, rate):
+        # Полная корзина ничем не отличается от новой
+        self.buckets = {key: bucket for key, bucket in self.buckets.items()
+                        if refill(*bucket, now, capacity, rate) < capacity}
+
+    def clear(self):
+        with self.lock:
+            self.buckets = {}
+
+
+class CacheBucketStore:
+    """
+    Корзины в кеше reviews. Чтение и запись не атомарны, как и у троттлинга DRF:
+    при одновременных запросах одного клиента в разные воркеры может пройти на пару запросов больше.
+    """
+
+    def take(self, key, cost, now, capacity, rate):
+        cache = get_cache()
+        bucket, wait = spend(cache.get(BUCKET_PREFIX + key), cost, now, capacity, rate)
+        # Через время полного пополнения корзина не нужна
+        cache.set(BUCKET_PREFIX + key, bucket, timeout=math.ceil(capacity / rate) + 1)
+        return wait
+
+    def clear(self):
+        pass
+
+
+local_store = LocalBucketStore()
+cache_store = CacheBucketStore()
+
+
+def client_key(request, ident):
+    """Корзина на API токен, если он верен, иначе на адрес клиента"""
+    expected = settings.API_ACCESS_TOKEN
+    header = request.headers.get('Authorization', '')
+    # Без настроенного токена любой токен подходит, и новый токен на каждый запрос обходил бы ограничение
+    if expected and header.startswith('Token ') and hmac.compare_digest(header[6:].strip(), expected):
+        return 'token:' + hashlib.sha256(expected.encode()).hexdigest()[:16]
+    return f'ip:{ident}'
+
+
+def action_cost(action):
+    cost = settings.THROTTLE_COSTS.get(action, 1)
+    # Дороже емкости корзины запрос не пропустить никогда
+    return min(cost, settings.THROTTLE_CAPACITY)
+
+
+def take_tokens(request, action, ident):
+    """None, если запрос можно выполнять, иначе через сколько секунд повторить"""
+    if not settings.THROTTLE_ENABLED:
+        return None
+    store = cache_store if settings.THROTTLE_SHARED else local_store
+    return store.take(client_key(request, ident), action_cost(action), time.time(),
+                      settings.THROTTLE_CAPACITY, settings.THROTTLE_REFILL_RATE)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Троттлинг DRF: стоимость запроса берется по действию вьюсета (view.action)"""
+
+    def allow_request(self, request, view):
+        self.wait_seconds = take_tokens(request, getattr(view, 'action', None), self.get_ident(request))
+        return self.wait_seconds is None
+
+    def wait(self):
+        # Retry-After DRF пишет целым числом с отбрасыванием дробной части, поэтому округляю вверх
+        return math.ceil(self.wait_seconds)
@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .async_views import AsyncCSVExportView, AsyncDetailView, AsyncListView, AsyncXLSXExportView
+from .exports import countries_export, manufactures_export, cars_export, comments_export
 
 # Создание router и регистрация  ViewSet
 router = DefaultRouter()
@@ -8,9 +10,27 @@ router.register(r'countries', views.CountryViewSet, basename='country')
 router.register(r'manufactures', views.ManufactureViewSet, basename='manufacture')
 router.register(r'cars', views.CarViewSet, basename='car')
 router.register(r'comments', views.CommentViewSet, basename='comment')
+router.register(r'catalogue', views.CatalogueViewSet, basename='catalogue')
+router.register(r'export-jobs', views.ExportJobViewSet, basename='exportjob')
+
+# Асинхронный путь чтения для ASGI сервера: те же данные, что и у вьюсетов
+async_urlpatterns = []
+for prefix, viewset, export in (
+    ('countries', views.CountryViewSet, countries_export),
+    ('manufactures', views.ManufactureViewSet, manufactures_export),
+    ('cars', views.CarViewSet, cars_export),
+    ('comments', views.CommentViewSet, comments_export),
+):
+    async_urlpatterns += [
+        path(f'{prefix}/', AsyncListView.as_view(viewset=viewset), name=f'async-{viewset.cache_scope}-list'),
+        path(f'{prefix}/<int:pk>/', AsyncDetailView.as_view(viewset=viewset), name=f'async-{viewset.cache_scope}-detail'),
+        path(f'{prefix}/export/csv/', AsyncCSVExportView.as_view(export=export)),
+        path(f'{prefix}/export/xlsx/', AsyncXLSXExportView.as_view(export=export)),
+    ]
 
 # URL patterns приложения
 urlpatterns = [
     path('', include(router.urls)),
+    path('async/', include(async_urlpatterns)),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework'))
 ]
\ No newline at end of file
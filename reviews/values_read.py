@@ -0,0 +1,159 @@
+"""
+Быстрый путь чтения для list и retrieve: страница выбирается через values() плоскими словарями
+без соединений таблиц. Названия стран, производителей и автомобилей берутся из снимка справочников
+(reviews/snapshot.py), комментарии к автомобилям добираются одним запросом на страницу.
+Экземпляры моделей и поля ModelSerializer не создаются.
+
+Словари повторяют вывод сериализаторов из reviews/serializers.py поле в поле и в том же порядке
+ключей, поэтому JSON ответа не меняется. Запись (create/update) по-прежнему идет через сериализаторы.
+"""
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from .models import Country, Manufacture, Car, Comment
+from .snapshot import SnapshotLookup, catalogue_snapshot
+
+# Тот же формат даты, что у DateTimeField сериализатора комментария
+created_at_field = serializers.DateTimeField()
+
+
+def group_names(rows):
+    """{id владельца: [названия]} из пар (id владельца, название) с сохранением порядка"""
+    grouped = defaultdict(list)
+    for owner_id, name in rows:
+        grouped[owner_id].append(name)
+    return grouped
+
+
+class ValuesReader:
+    """Описывает выборку values() одной модели и превращение страницы строк в данные ответа"""
+    model = None
+    fields = ()
+
+    def get_queryset(self):
+        return self.model.objects.values(*self.fields)
+
+    def represent(self, rows):
+        raise NotImplementedError
+
+
+class CountryValuesReader(ValuesReader):
+    model = Country
+    fields = ('id', 'name')
+
+    def represent(self, rows):
+        lookup = SnapshotLookup(catalogue_snapshot, countries=[row['id'] for row in rows])
+        return [
+            {'id': row['id'], 'name': row['name'], 'manufactures': lookup('manufacture_names', row['id'], [])}
+            for row in rows
+        ]
+
+
+class ManufactureValuesReader(ValuesReader):
+    model = Manufacture
+    fields = ('id', 'name', 'country_id', 'comments_count')
+
+    def represent(self, rows):
+        lookup = SnapshotLookup(catalogue_snapshot, manufactures=[row['id'] for row in rows],
+                                countries={row['country_id'] for row in rows})
+        return [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'country': row['country_id'],
+                'country_name': lookup('country_name', row['country_id'], ''),
+                'cars': lookup('car_names', row['id'], []),
+                'comments_count': row['comments_count'],
+            }
+            for row in rows
+        ]
+
+
+class CarValuesReader(ValuesReader):
+    model = Car
+    fields = ('id', 'name', 'manufacture_id', 'release_year', 'end_year', 'comments_count')
+
+    def comment_texts(self, ids):
+        """Тексты комментариев по автомобилям, новые первыми, не больше CAR_COMMENTS_LIMIT на автомобиль"""
+        if not ids:
+            return {}
+        comments = Comment.objects.filter(car_id__in=ids).order_by('-created_at')
+        if settings.CAR_COMMENTS_LIMIT:
+            # Как и срез в Prefetch, ограничение на каждый автомобиль считаю оконной функцией
+            comments = comments.annotate(
+                position=Window(RowNumber(), partition_by=F('car_id'), order_by=F('created_at').desc()),
+            ).filter(position__lte=settings.CAR_COMMENTS_LIMIT)
+        return group_names(comments.values_list('car_id', 'comment_text'))
+
+    def represent(self, rows):
+        ids = [row['id'] for row in rows]
+        lookup = SnapshotLookup(catalogue_snapshot, cars=ids, manufactures={row['manufacture_id'] for row in rows})
+        comments = self.comment_texts(ids)
+        return [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'manufacture': row['manufacture_id'],
+                'manufacture_name': lookup('manufacture_name', row['manufacture_id'], ''),
+                'release_year': row['release_year'],
+                'end_year': row['end_year'],
+                'comments': comments.get(row['id'], []),
+                'comments_count': row['comments_count'],
+            }
+            for row in rows
+        ]
+
+
+class CommentValuesReader(ValuesReader):
+    model = Comment
+    fields = ('id', 'email', 'car_id', 'created_at', 'comment_text')
+
+    def represent(self, rows):
+        lookup = SnapshotLookup(catalogue_snapshot, cars={row['car_id'] for row in rows})
+        to_representation = created_at_field.to_representation
+        return [
+            {
+                'id': row['id'],
+                'email': row['email'],
+                'car': row['car_id'],
+                'car_name': lookup('car_title', row['car_id'], ''),
+                'created_at': to_representation(row['created_at']),
+                'comment_text': row['comment_text'],
+            }
+            for row in rows
+        ]
+
+
+class ValuesReadMixin:
+    """
+    Отдает list и retrieve через values_reader вьюсета, если включен FAST_READ_ENABLED.
+    Фильтры, сортировка и курсорная пагинация работают с теми же полями, что и для моделей.
+    """
+    values_reader = None
+
+    def use_values_reader(self):
+        return settings.FAST_READ_ENABLED and self.values_reader is not None
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_values_reader():
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.values_reader.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(self.values_reader.represent(list(queryset)))
+        return self.get_paginated_response(self.values_reader.represent(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_values_reader():
+            return super().retrieve(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.values_reader.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(queryset, **{self.lookup_field: kwargs[lookup_url_kwarg]})
+        self.check_object_permissions(request, row)
+        return Response(self.values_reader.represent([row])[0])
@@ -1,169 +1,274 @@
-from rest_framework import viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from django.http import HttpResponse
-import csv
-from openpyxl import Workbook
-from .models import Country, Manufacture, Car, Comment
-from .serializers import CountrySerializer, ManufactureSerializer, CarSerializer, CommentSerializer
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import tempfile
+from collections import Counter
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import FileResponse
+from .archive import ArchiveReadMixin, include_archived
+from .cache import CachedResponseMixin
+from .catalogue_export import ZIP_CONTENT_TYPE, write_catalogue_xlsx, write_catalogue_zip
+from .counters import adjust_comments_count
+from .exports import XLSX_CONTENT_TYPE, ExportMixin, countries_export, manufactures_export, cars_export, comments_export
+from .filters import QueryParamFilterBackend, parse_int, parse_moment
+from .jobs import ExportJobMixin, job_path
+from .models import Country, Manufacture, Car, Comment, ExportJob
+from .serializers import CountrySerializer, ManufactureSerializer, CarSerializer, CommentSerializer, CommentBulkSerializer, ExportJobSerializer
+from .pagination import CommentCursorPagination
+from .parsers import NDJSONParser, too_many_items_message
 from .permissions import HasAPIAccessToken
+from .search import decode_cursor, encode_cursor, search_comments
+from .signals import invalidate_comments
+from .values_read import ValuesReadMixin, CountryValuesReader, ManufactureValuesReader, CarValuesReader, CommentValuesReader
 from rest_framework.permissions import AllowAny
 
-class ExportMixin:
-    """Миксин для экспорта данных в CSV и XLSX форматах"""
-    
-    def export_to_csv(self, data, filename, headers, row_callback):
-        """Генерация CSV файла"""
-        response = HttpResponse(
-            content_type='text/csv',
-            headers={'Content-Disposition': f'attachment; filename="{filename}.csv"'},
-        )
-        
-        writer = csv.writer(response)
-        writer.writerow(headers)
-        
-        for item in data:
-            writer.writerow(row_callback(item))
-        
-        return response
-
-    def export_to_xlsx(self, data, filename, headers, row_callback):
-        """Генерация Excel файла"""
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename="{filename}.xlsx"'},
-        )
-        
-        wb = Workbook()
-        ws = wb.active
-        ws.title = filename
-        ws.append(headers)
-        
-        for item in data:
-            ws.append(row_callback(item))
-        
-        wb.save(response)
-        return response
-
-class CountryViewSet(ExportMixin, viewsets.ModelViewSet):
+def car_comments_prefetch():
+    """Prefetch комментариев к автомобилям в порядке выдачи, с ограничением CAR_COMMENTS_LIMIT"""
+    comments = Comment.objects.order_by('-created_at').only('id', 'car_id', 'comment_text', 'created_at')
+    if settings.CAR_COMMENTS_LIMIT:
+        comments = comments[:settings.CAR_COMMENTS_LIMIT]
+    return Prefetch('comments', queryset=comments, to_attr='latest_comments')
+
+class CountryViewSet(CachedResponseMixin, ValuesReadMixin, ExportMixin, ExportJobMixin, viewsets.ModelViewSet):
     queryset = Country.objects.all().prefetch_related('manufactures')
     serializer_class = CountrySerializer
+    values_reader = CountryValuesReader()
+    cache_scope = 'country'
+    export_name = 'countries'
     permission_classes = [HasAPIAccessToken]
 
     @action(detail=False, methods=['get'], url_path='export/csv', permission_classes=[AllowAny])
     def export_csv(self, request):
         """Экспорт стран в CSV"""
-        countries = Country.objects.all().prefetch_related('manufactures')
-        headers = ['ID', 'Country Name', 'Manufactures Count', 'Manufactures List']
-        
-        def country_row_callback(country):
-            manufactures_list = ', '.join([m.name for m in country.manufactures.all()])
-            return [country.id, country.name, country.manufactures.count(), manufactures_list]
-        
-        return self.export_to_csv(countries, 'countries', headers, country_row_callback)
+        return self.export_to_csv(*countries_export())
 
     @action(detail=False, methods=['get'], url_path='export/xlsx', permission_classes=[AllowAny])
     def export_xlsx(self, request):
         """Экспорт стран в Excel"""
-        countries = Country.objects.all().prefetch_related('manufactures')
-        headers = ['ID', 'Country Name', 'Manufactures Count', 'Manufactures List']
-        
-        def country_row_callback(country):
-            manufactures_list = ', '.join([m.name for m in country.manufactures.all()])
-            return [country.id, country.name, country.manufactures.count(), manufactures_list]
-        
-        return self.export_to_xlsx(countries, 'countries', headers, country_row_callback)
-
-class ManufactureViewSet(ExportMixin, viewsets.ModelViewSet):
+        return self.export_to_xlsx(*countries_export())
+
+class ManufactureViewSet(CachedResponseMixin, ValuesReadMixin, ExportMixin, ExportJobMixin, viewsets.ModelViewSet):
     queryset = Manufacture.objects.all().select_related('country').prefetch_related('cars')
     serializer_class = ManufactureSerializer
+    values_reader = ManufactureValuesReader()
+    cache_scope = 'manufacture'
+    export_name = 'manufactures'
     permission_classes = [HasAPIAccessToken]
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'country': ('country_id', parse_int),
+    }
 
     @action(detail=False, methods=['get'], url_path='export/csv', permission_classes=[AllowAny])
     def export_csv(self, request):
         """Экспорт производителей в CSV"""
-        manufactures = Manufacture.objects.all().select_related('country').prefetch_related('cars')
-        headers = ['ID', 'Manufacture Name', 'Country', 'Cars Count', 'Total Comments Count']
-        
-        def manufacture_row_callback(manufacture):
-            total_comments = sum(car.comments.count() for car in manufacture.cars.all())
-            return [manufacture.id, manufacture.name, manufacture.country.name, manufacture.cars.count(), total_comments]
-        
-        return self.export_to_csv(manufactures, 'manufactures', headers, manufacture_row_callback)
+        return self.export_to_csv(*manufactures_export())
 
     @action(detail=False, methods=['get'], url_path='export/xlsx', permission_classes=[AllowAny])
     def export_xlsx(self, request):
         """Экспорт производителей в Excel"""
-        manufactures = Manufacture.objects.all().select_related('country').prefetch_related('cars')
-        headers = ['ID', 'Manufacture Name', 'Country', 'Cars Count', 'Total Comments Count']
-        
-        def manufacture_row_callback(manufacture):
-            total_comments = sum(car.comments.count() for car in manufacture.cars.all())
-            return [manufacture.id, manufacture.name, manufacture.country.name, manufacture.cars.count(), total_comments]
-        
-        return self.export_to_xlsx(manufactures, 'manufactures', headers, manufacture_row_callback)
-
-class CarViewSet(ExportMixin, viewsets.ModelViewSet):
-    queryset = Car.objects.all().select_related('manufacture', 'manufacture__country').prefetch_related('comments')
+        return self.export_to_xlsx(*manufactures_export())
+
+class CarViewSet(CachedResponseMixin, ValuesReadMixin, ExportMixin, ExportJobMixin, viewsets.ModelViewSet):
+    queryset = Car.objects.all().select_related('manufacture', 'manufacture__country')
     serializer_class = CarSerializer
+    values_reader = CarValuesReader()
+    cache_scope = 'car'
+    export_name = 'cars'
     permission_classes = [HasAPIAccessToken]
+    # ?ordering=-comments_count отдает самые обсуждаемые автомобили по индексу счетчика
+    filter_backends = [QueryParamFilterBackend, OrderingFilter]
+    ordering_fields = ['name', 'release_year', 'comments_count']
+    filter_params = {
+        'manufacture': ('manufacture_id', parse_int),
+        'country': ('manufacture__country_id', parse_int),
+        'release_year_min': ('release_year__gte', parse_int),
+        'release_year_max': ('release_year__lte', parse_int),
+        'end_year_min': ('end_year__gte', parse_int),
+        'end_year_max': ('end_year__lte', parse_int),
+    }
+
+    def get_queryset(self):
+        # Комментарии подгружаю одним запросом на страницу, количество берется из счетчика comments_count
+        return super().get_queryset().prefetch_related(car_comments_prefetch())
 
     @action(detail=False, methods=['get'], url_path='export/csv', permission_classes=[AllowAny])
     def export_csv(self, request):
         """Экспорт автомобилей в CSV"""
-        cars = Car.objects.all().select_related('manufacture', 'manufacture__country').prefetch_related('comments')
-        headers = ['ID', 'Model', 'Manufacture', 'Country', 'Start Year', 'End Year', 'Comments Count']
-        
-        def car_row_callback(car):
-            return [car.id, car.name, car.manufacture.name, car.manufacture.country.name, 
-                    car.release_year, car.end_year or 'Present', car.comments.count()]
-        
-        return self.export_to_csv(cars, 'cars', headers, car_row_callback)
+        return self.export_to_csv(*cars_export())
 
     @action(detail=False, methods=['get'], url_path='export/xlsx', permission_classes=[AllowAny])
     def export_xlsx(self, request):
         """Экспорт автомобилей в Excel"""
-        cars = Car.objects.all().select_related('manufacture', 'manufacture__country').prefetch_related('comments')
-        headers = ['ID', 'Model', 'Manufacture', 'Country', 'Start Year', 'End Year', 'Comments Count']
-        
-        def car_row_callback(car):
-            return [car.id, car.name, car.manufacture.name, car.manufacture.country.name, 
-                    car.release_year, car.end_year or 'Present', car.comments.count()]
-        
-        return self.export_to_xlsx(cars, 'cars', headers, car_row_callback)
-
-class CommentViewSet(ExportMixin, viewsets.ModelViewSet):
+        return self.export_to_xlsx(*cars_export())
+
+class CommentViewSet(CachedResponseMixin, ArchiveReadMixin, ValuesReadMixin, ExportMixin, ExportJobMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all().select_related('car', 'car__manufacture', 'car__manufacture__country')
     serializer_class = CommentSerializer
+    values_reader = CommentValuesReader()
+    cache_scope = 'comment'
+    export_name = 'comments'
+    pagination_class = CommentCursorPagination
+    filter_backends = [QueryParamFilterBackend]
+    filter_params = {
+        'car': ('car_id', parse_int),
+        'email': ('email', str),
+        'created_after': ('created_at__gte', parse_moment),
+        'created_before': ('created_at__lt', parse_moment),
+    }
 
     def get_permissions(self):
-        if self.action in ['create', 'list', 'retrieve']:
+        if self.action in ['create', 'list', 'retrieve', 'search']:
             permission_classes = []
         else:
             permission_classes = [HasAPIAccessToken]
         return [permission() for permission in permission_classes]
 
+    # Комментарий и счетчики comments_count (обновляются сигналами) сохраняю в одной транзакции
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+
+    # rank - число с плавающей точкой, его формат в JSON оставляю как у json.dumps
+    @action(detail=False, methods=['get'], url_path='search', renderer_classes=[JSONRenderer, BrowsableAPIRenderer])
+    def search(self, request):
+        """Полнотекстовый поиск по тексту комментариев с ранжированием и keyset пагинацией"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'Укажите поисковый запрос'})
+
+        filters = {}
+        for param, lookup in (('car', 'car'), ('manufacture', 'car__manufacture'), ('country', 'car__manufacture__country')):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    filters[lookup] = parse_int(value)
+                except ValueError:
+                    raise ValidationError({param: 'Ожидается id'})
+
+        after = None
+        if request.query_params.get('cursor'):
+            after = decode_cursor(request.query_params['cursor'])
+            if after is None:
+                raise ValidationError({'cursor': 'Некорректный курсор'})
+
+        paginator = self.pagination_class()
+        page_size = paginator.get_page_size(request)
+        found = search_comments(query, filters, after=after, limit=page_size + 1)
+
+        next_url = None
+        if len(found) > page_size:
+            found = found[:page_size]
+            rank, comment = found[-1]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', encode_cursor(rank, comment.pk))
+
+        results = []
+        for rank, comment in found:
+            item = self.get_serializer(comment).data
+            item['rank'] = rank
+            results.append(item)
+        return Response({'next': next_url, 'results': results})
+
+    @action(detail=False, methods=['post'], url_path='bulk', parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """Массовое добавление комментариев из JSON массива или NDJSON"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Ожидается непустой массив комментариев'}, status=status.HTTP_400_BAD_REQUEST)
+        # NDJSON парсер сам останавливается на лимите, JSON массив проверяю после разбора
+        if len(items) > settings.COMMENTS_BULK_MAX_ITEMS:
+            return Response({'detail': too_many_items_message()}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Все автомобили проверяю одним запросом с IN, а не запросом на каждый комментарий.
+        # id за пределами bigint в запрос не попадают, для них сериализатор сообщит, что автомобиля нет
+        car_ids = set()
+        for item in items:
+            try:
+                car_ids.add(parse_int(item['car']))
+            except (TypeError, ValueError, KeyError):
+                pass
+        cars = Car.objects.in_bulk(car_ids)
+
+        comments = []
+        errors = []
+        for index, item in enumerate(items):
+            serializer = CommentBulkSerializer(data=item, context={'cars': cars})
+            if serializer.is_valid():
+                comments.append(Comment(**serializer.validated_data))
+            else:
+                errors.append({'index': index, 'errors': serializer.errors})
+
+        with transaction.atomic():
+            created = Comment.objects.bulk_create(comments, batch_size=settings.COMMENTS_BULK_BATCH_SIZE)
+            adjust_comments_count(Counter(comment.car_id for comment in created))
+        # bulk_create не отправляет post_save, поэтому кеш сбрасываю сам
+        if created:
+            invalidate_comments({comment.car_id for comment in created})
+
+        return Response(
+            {'created': len(created), 'ids': [comment.id for comment in created], 'errors': errors},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST,
+        )
+
     @action(detail=False, methods=['get'], url_path='export/csv', permission_classes=[AllowAny])
     def export_csv(self, request):
-        """Экспорт комментариев в CSV"""
-        comments = Comment.objects.all().select_related('car', 'car__manufacture', 'car__manufacture__country')
-        headers = ['ID', 'Email', 'Car', 'Manufacture', 'Country', 'Created At', 'Comment Text']
-        
-        def comment_row_callback(comment):
-            return [comment.id, comment.email, comment.car.name, comment.car.manufacture.name, 
-                    comment.car.manufacture.country.name, comment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    comment.comment_text[:100] + '...' if len(comment.comment_text) > 100 else comment.comment_text]
-        
-        return self.export_to_csv(comments, 'comments', headers, comment_row_callback)
+        """Экспорт комментариев в CSV, с ?include_archived=true вместе с архивом"""
+        return self.export_to_csv(*comments_export(include_archived(request)))
 
     @action(detail=False, methods=['get'], url_path='export/xlsx', permission_classes=[AllowAny])
     def export_xlsx(self, request):
-        """Экспорт комментариев в Excel"""
-        comments = Comment.objects.all().select_related('car', 'car__manufacture', 'car__manufacture__country')
-        headers = ['ID', 'Email', 'Car', 'Manufacture', 'Country', 'Created At', 'Comment Text']
-        
-        def comment_row_callback(comment):
-            return [comment.id, comment.email, comment.car.name, comment.car.manufacture.name, 
-                    comment.car.manufacture.country.name, comment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                    comment.comment_text[:100] + '...' if len(comment.comment_text) > 100 else comment.comment_text]
-        
-        return self.export_to_xlsx(comments, 'comments', headers, comment_row_callback)
\ No newline at end of file
+        """Экспорт комментариев в Excel, с ?include_archived=true вместе с архивом"""
+        return self.export_to_xlsx(*comments_export(include_archived(request)))
+
+class CatalogueViewSet(viewsets.ViewSet):
+    """Выгрузка всего каталога одним файлом вместо четырех отдельных экспортов"""
+    permission_classes = [AllowAny]
+
+    def catalogue_response(self, write, filename, content_type):
+        output = tempfile.SpooledTemporaryFile(max_size=settings.EXPORT_SPOOL_MAX_SIZE)
+        write(output)
+        output.seek(0)
+        return FileResponse(output, as_attachment=True, filename=filename, content_type=content_type)
+
+    @action(detail=False, methods=['get'], url_path='export/xlsx')
+    def export_xlsx(self, request):
+        """Каталог в Excel: лист на каждую модель"""
+        return self.catalogue_response(write_catalogue_xlsx, 'catalogue.xlsx', XLSX_CONTENT_TYPE)
+
+    @action(detail=False, methods=['get'], url_path='export/zip')
+    def export_zip(self, request):
+        """Каталог в ZIP архиве с CSV файлом на каждую модель"""
+        return self.catalogue_response(write_catalogue_zip, 'catalogue.zip', ZIP_CONTENT_TYPE)
+
+class ExportJobViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """Статус фоновой выгрузки и скачивание готового файла"""
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+
+    @action(detail=True, methods=['get'], url_path='download')
+    def download(self, request, pk=None):
+        """Скачивание готового файла выгрузки"""
+        job = self.get_object()
+        if job.status != ExportJob.DONE:
+            return Response(self.get_serializer(job).data, status=status.HTTP_409_CONFLICT)
+        try:
+            output = open(job_path(job), 'rb')
+        except FileNotFoundError:
+            raise NotFound('Файл выгрузки уже удален')
+        content_type = XLSX_CONTENT_TYPE if job.format == 'xlsx' else 'text/csv'
+        return FileResponse(output, as_attachment=True, filename=f'{job.export}.{job.format}', content_type=content_type)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_proj_reviews.settings')
 
 application = get_asgi_application()
+
+# Снимок справочников загружаю при старте воркера, а не в первом запросе
+from reviews.snapshot import catalogue_snapshot  # noqa: E402
+
+catalogue_snapshot.warm_up()
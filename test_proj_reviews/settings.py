@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 
@@ -46,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым, чтобы время запроса включало все остальные middleware
+    'reviews.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,10 +88,63 @@ DATABASES = {
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # Сколько секунд держать соединение открытым между запросами (0 - новое соединение на каждый запрос).
+        # По умолчанию соединения держатся только под WSGI (test_proj_reviews/wsgi.py): под ASGI синхронный
+        # код выполняется в разных потоках, и каждый поток держал бы свое соединение, пока оно не устареет
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60 if os.getenv('DJANGO_SERVER_INTERFACE') == 'wsgi' else 0)),
+        # Перед повторным использованием соединение проверяется, упавшее заменяется новым
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Пул соединений в процессе (PostgreSQL с psycopg 3 и psycopg_pool). Пул нужен под ASGI:
+# там запросы выполняются в разных потоках и постоянные соединения CONN_MAX_AGE не переиспользуются
+if os.getenv('DB_POOL', 'False') == 'True' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Соединениями управляет пул, Django с ним несовместим с CONN_MAX_AGE > 0
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            # Сколько секунд запрос ждет свободное соединение, прежде чем получить ошибку
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', 10)),
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# Число процессов сервера, uvicorn и gunicorn берут его из этой же переменной
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+
+# По умолчанию кеш в памяти процесса. Если задан REDIS_URL, кеш общий для всех воркеров
+# (нужен пакет redis). Через кеш процессы узнают об изменениях друг друга (версии ответов и снимка
+# справочников), поэтому с несколькими процессами нужен общий кеш
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif WEB_CONCURRENCY > 1:
+    raise ImproperlyConfigured(f'WEB_CONCURRENCY={WEB_CONCURRENCY} требует общий кеш: задайте REDIS_URL')
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'reviews',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Кеш ответов list/retrieve
+REVIEWS_CACHE_ENABLED = os.getenv('REVIEWS_CACHE_ENABLED', 'True') == 'True'
+REVIEWS_CACHE_ALIAS = 'default'
+REVIEWS_CACHE_TIMEOUT = int(os.getenv('REVIEWS_CACHE_TIMEOUT', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -135,6 +191,44 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # секретный токен для API доступа
 API_ACCESS_TOKEN = os.getenv('API_ACCESS_TOKEN')
 
+# Сколько последних комментариев отдавать вместе с автомобилем (0 - все)
+CAR_COMMENTS_LIMIT = int(os.getenv('CAR_COMMENTS_LIMIT', 0))
+
+# Размер куска, которым экспорт читает строки из БД
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+# До какого размера готовый XLSX держится в памяти, дальше сбрасывается во временный файл
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv('EXPORT_SPOOL_MAX_SIZE', 10 * 1024 * 1024))
+# Сколько потоков (и соединений с БД) параллельно читают таблицы при выгрузке всего каталога
+CATALOGUE_EXPORT_WORKERS = int(os.getenv('CATALOGUE_EXPORT_WORKERS', 4))
+
+# Фоновые выгрузки: папка с готовыми файлами, число потоков (0 - строить сразу в запросе),
+# сколько секунд хранить результат и через сколько считать зависшее задание ошибкой
+EXPORT_JOBS_DIR = os.getenv('EXPORT_JOBS_DIR', BASE_DIR / 'exports')
+EXPORT_JOBS_WORKERS = int(os.getenv('EXPORT_JOBS_WORKERS', 2))
+EXPORT_JOBS_RETENTION = int(os.getenv('EXPORT_JOBS_RETENTION', 24 * 60 * 60))
+EXPORT_JOBS_TIMEOUT = int(os.getenv('EXPORT_JOBS_TIMEOUT', 60 * 60))
+
+# Комментарии по месяцам: на сколько месяцев вперед держать секции на PostgreSQL, сколько последних
+# месяцев оставлять в БД и куда складывать архивы старых месяцев (reviews/partitions.py, reviews/archive.py)
+COMMENT_PARTITIONS_AHEAD = int(os.getenv('COMMENT_PARTITIONS_AHEAD', 3))
+COMMENTS_RETENTION_MONTHS = int(os.getenv('COMMENTS_RETENTION_MONTHS', 12))
+COMMENTS_ARCHIVE_DIR = os.getenv('COMMENTS_ARCHIVE_DIR', BASE_DIR / 'archive')
+
+# Массовая загрузка комментариев: лимит на запрос и размер пачки bulk_create
+COMMENTS_BULK_MAX_ITEMS = int(os.getenv('COMMENTS_BULK_MAX_ITEMS', 10000))
+COMMENTS_BULK_BATCH_SIZE = int(os.getenv('COMMENTS_BULK_BATCH_SIZE', 1000))
+
+# Метрики запросов на /metrics, заголовок Server-Timing и лог запросов дольше SLOW_REQUEST_MS (0 - выключен)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', 'False') == 'True'
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+
+# С какой оценки планировщика PostgreSQL админка показывает приблизительное число строк вместо COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.getenv('ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# Максимальный размер страницы, который клиент может запросить через ?page_size=
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 500))
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         # 'rest_framework.authentication.TokenAuthentication',
@@ -142,4 +236,38 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # По умолчанию разрешаю  все
     ],
+    # Курсорная пагинация, чтобы список не отдавал всю таблицу за один запрос
+    'DEFAULT_PAGINATION_CLASS': 'reviews.pagination.NameCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 50)),
+    # Троттлинг по корзинам жетонов (reviews/throttling.py)
+    'DEFAULT_THROTTLE_CLASSES': [
+        'reviews.throttling.TokenBucketThrottle',
+    ],
+    # Сколько прокси перед приложением; 0 - адрес клиента только из REMOTE_ADDR, X-Forwarded-For не подделать
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
+    # JSON через orjson, вывод тот же, что у JSONRenderer
+    'DEFAULT_RENDERER_CLASSES': [
+        'reviews.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# list и retrieve читают values() без экземпляров моделей и ModelSerializer (reviews/values_read.py)
+FAST_READ_ENABLED = os.getenv('FAST_READ_ENABLED', 'True') == 'True'
+
+# Троттлинг: емкость корзины клиента в жетонах, пополнение в жетонах в секунду и корзины в общем кеше
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_CAPACITY = int(os.getenv('THROTTLE_CAPACITY', 100))
+THROTTLE_REFILL_RATE = float(os.getenv('THROTTLE_REFILL_RATE', 2))
+THROTTLE_SHARED = os.getenv('THROTTLE_SHARED', 'False') == 'True'
+# Стоимость действий в жетонах, остальные стоят 1
+THROTTLE_COSTS = {
+    'search': 3,
+    'create': 2,
+    'bulk': 20,
+    'export': 10,
+    'download': 5,
+    'export_csv': 25,
+    'export_xlsx': 50,
+    'export_zip': 50,
 }
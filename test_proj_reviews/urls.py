@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.urls import path, include
+from reviews.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('reviews.urls')),  # Подключаю URLs нашего приложения
+    path('metrics', metrics_view),  # Метрики в формате Prometheus
 ]
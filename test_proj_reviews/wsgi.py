@@ -12,5 +12,12 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'test_proj_reviews.settings')
+# По нему настройки включают постоянные соединения с БД (CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_SERVER_INTERFACE', 'wsgi')
 
 application = get_wsgi_application()
+
+# Снимок справочников загружаю при старте воркера, а не в первом запросе
+from reviews.snapshot import catalogue_snapshot  # noqa: E402
+
+catalogue_snapshot.warm_up()